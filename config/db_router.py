@@ -0,0 +1,63 @@
+"""
+Маршрутизация чтений на реплику.
+
+По умолчанию всё идёт в основную БД. Чтения уходят на реплику только внутри
+read_from_replica(): так помечаются безопасные (GET/HEAD) запросы API, см.
+ReplicaReadMixin в habits/views.py. Запись, фоновые задачи и всё, что не
+помечено явно, остаются на основной БД.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+REPLICA_ALIAS = "replica"
+PRIMARY_PIN_KEY = "db:primary-pin:{user_id}"
+
+_use_replica = ContextVar("use_replica", default=False)
+
+
+def replica_configured() -> bool:
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    """Чтения внутри блока идут на реплику (enabled=False — обратно на основную)."""
+    token = _use_replica.set(enabled and replica_configured())
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def pin_to_primary(user_id):
+    """
+    После записи пользователь читает с основной БД DB_REPLICA_PIN_SECONDS
+    секунд, чтобы не увидеть свои изменения откатившимися из-за лага реплики.
+    """
+    if replica_configured():
+        cache.set(PRIMARY_PIN_KEY.format(user_id=user_id), 1, settings.DB_REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(user_id) -> bool:
+    return cache.get(PRIMARY_PIN_KEY.format(user_id=user_id)) is not None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На реплике те же данные: объекты с обеих БД можно связывать
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему реплики приносит репликация с основной БД
+        return db != REPLICA_ALIAS
@@ -0,0 +1,363 @@
+"""
+Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Два реестра:
+- REGISTRY — память процесса. Сюда пишет MetricsMiddleware; /metrics отдаёт
+  значения того процесса, который обслужил запрос (как prometheus_client
+  без multiprocess-режима).
+- SHARED_REGISTRY — метрики фоновых задач. Воркер Celery копит приращения
+  в памяти и после каждой задачи одним pipeline сливает их в хэши Redis;
+  /metrics читает эти хэши, поэтому видит итог по всем воркерам.
+
+Запись метрики — словарь и замок, без обращений к сети и БД.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+import redis
+from celery.signals import task_postrun
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SHARED_KEY = "metrics:{name}"
+
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def sample_sort_key(sample):
+    suffix, labels, _value = sample
+    le = dict(labels).get("le")
+    return (
+        [pair for pair in labels if pair[0] != "le"],
+        suffix,
+        float(le) if le is not None else 0,
+    )
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def get_key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def drain(self):
+        """Забирает накопленные значения и обнуляет метрику."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def snapshot(self):
+        raise NotImplementedError
+
+    def merge(self, values):
+        raise NotImplementedError
+
+    def samples(self, values):
+        """Строки метрики: (суффикс имени, метки, значение)."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self.get_key(labels), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self, values):
+        for key, value in values.items():
+            yield "_total", key, value
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self.get_key(labels)
+        index = 0
+        while value > self.buckets[index]:
+            index += 1
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [счётчики по корзинам (не накопительные), сумма, количество]
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def get(self, **labels):
+        """(количество, сумма) наблюдений."""
+        with self._lock:
+            state = self._values.get(self.get_key(labels))
+            return (state[2], state[1]) if state else (0, 0.0)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: [list(state[0]), state[1], state[2]] for key, state in self._values.items()
+            }
+
+    def merge(self, values):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                state = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+
+    def samples(self, values):
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", key + (("le", format_value(bound)),), cumulative
+            yield "_sum", key, total
+            yield "_count", key, count
+
+
+def render_metric(metric, samples):
+    lines = [
+        f"# HELP {metric.name} {metric.documentation}",
+        f"# TYPE {metric.name} {metric.type_name}",
+    ]
+    for suffix, labels, value in sorted(samples, key=sample_sort_key):
+        label_text = ",".join(
+            f'{label_name}="{escape_label(label_value)}"' for label_name, label_value in labels
+        )
+        label_text = f"{{{label_text}}}" if label_text else ""
+        lines.append(f"{metric.name}{suffix}{label_text} {format_value(value)}")
+    return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        if any(existing.name == metric.name for existing in self.metrics):
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self.metrics.append(metric)
+
+    def collect(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(render_metric(metric, metric.samples(metric.snapshot())))
+        return lines
+
+
+class SharedRegistry(Registry):
+    """Реестр, значения которого суммируются в Redis по всем процессам."""
+
+    def __init__(self):
+        super().__init__()
+        self._client = None
+
+    def get_client(self):
+        url = settings.METRICS_REDIS_URL
+        if not url:
+            return None
+        if self._client is None:
+            self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._client
+
+    def flush(self):
+        """Сливает накопленные приращения в Redis; при ошибке оставляет их до следующего раза."""
+        client = self.get_client()
+        if client is None:
+            return
+        drained = [(metric, metric.drain()) for metric in self.metrics]
+        if not any(values for _metric, values in drained):
+            return
+        pipe = client.pipeline(transaction=False)
+        for metric, values in drained:
+            key = SHARED_KEY.format(name=metric.name)
+            for suffix, labels, value in metric.samples(values):
+                pipe.hincrbyfloat(key, json.dumps([suffix, labels]), value)
+        try:
+            pipe.execute()
+        except redis.RedisError as exc:
+            for metric, values in drained:
+                metric.merge(values)
+            logger.info("Task metrics kept in memory, Redis is unavailable: %s", exc)
+
+    def collect(self):
+        client = self.get_client()
+        if client is None or not self.metrics:
+            return []
+        pipe = client.pipeline(transaction=False)
+        for metric in self.metrics:
+            pipe.hgetall(SHARED_KEY.format(name=metric.name))
+        try:
+            stored = pipe.execute()
+        except redis.RedisError as exc:
+            logger.warning("Could not read task metrics from Redis: %s", exc)
+            return [f"# task metrics unavailable: {type(exc).__name__}"]
+
+        lines = []
+        for metric, fields in zip(self.metrics, stored):
+            samples = []
+            for field, value in fields.items():
+                suffix, labels = json.loads(field)
+                samples.append((suffix, tuple(tuple(pair) for pair in labels), float(value)))
+            lines.extend(render_metric(metric, samples))
+        return lines
+
+
+REGISTRY = Registry()
+SHARED_REGISTRY = SharedRegistry()
+
+
+def render_metrics() -> str:
+    return "\n".join(REGISTRY.collect() + SHARED_REGISTRY.collect()) + "\n"
+
+
+@task_postrun.connect
+def flush_task_metrics(**kwargs):
+    SHARED_REGISTRY.flush()
+
+
+# Метрики HTTP-запросов: метки — имя маршрута и метод, без путей с id
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Полное время обработки запроса",
+    ("view", "method"),
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Число SQL-запросов за HTTP-запрос",
+    ("view", "method"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds",
+    "Время SQL-запросов за HTTP-запрос",
+    ("view", "method"),
+)
+REQUEST_SERIALIZER_TIME = Histogram(
+    "http_request_serializer_duration_seconds",
+    "Время сериализации ответа за HTTP-запрос",
+    ("view", "method"),
+)
+REQUESTS = Counter(
+    "http_requests",
+    "Обработанные HTTP-запросы",
+    ("view", "method", "status"),
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "serializer_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: считаем каждый SQL-запрос и его время
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+_request_stats = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def measure_serialization():
+    """Добавляет время блока к времени сериализации текущего запроса."""
+    stats = _request_stats.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Пишет по каждому запросу задержку, число и время SQL-запросов и время
+    сериализации. Для потоковых ответов задержка — время до первого байта.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats))
+                response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        labels = {
+            "view": match.view_name if match else "unresolved",
+            "method": request.method,
+        }
+        REQUEST_LATENCY.observe(elapsed, **labels)
+        REQUEST_QUERIES.observe(stats.queries, **labels)
+        REQUEST_DB_TIME.observe(stats.db_time, **labels)
+        REQUEST_SERIALIZER_TIME.observe(stats.serializer_time, **labels)
+        REQUESTS.inc(status=response.status_code, **labels)
+        return response
@@ -0,0 +1,38 @@
+# config/renderers.py
+try:
+    import orjson
+except ImportError:  # orjson есть в requirements.txt; без него — стандартный json
+    orjson = None
+
+from rest_framework.renderers import JSONRenderer
+
+# Те же правила, что у DRF: даты через его JSONEncoder, словари с
+# нестроковыми ключами и подклассы dict/list (ReturnDict, ReturnList)
+ORJSON_OPTIONS = (
+    (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson. Выдаёт те же байты, что и стандартный: компактные
+    разделители, UTF-8 без экранирования, экранированные U+2028/U+2029.
+    С отступами (?indent, browsable API) и без orjson работает как родитель.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # Типы, которые orjson не умеет (например, очень большие int)
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
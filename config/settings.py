@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import os
 from pathlib import Path
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы задержка включала все остальные middleware
+    "config.metrics.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -87,24 +90,248 @@ CELERY_BEAT_SCHEDULE = {
         "task": "habits.tasks.send_habit_reminders",
         "schedule": 60.0,
     },
+    # Повторы и всё, что не успел доставить тик
+    "deliver-notification-outbox": {
+        "task": "habits.tasks.deliver_notification_outbox",
+        "schedule": 10.0,
+    },
+    "refresh-trending-habits": {
+        "task": "habits.tasks.refresh_trending_habits",
+        "schedule": float(os.getenv("HABIT_TRENDING_REFRESH_INTERVAL", "300")),
+    },
+    # Страховка вебхука: обновления, для которых не удалось поставить задачу
+    "process-telegram-updates": {
+        "task": "users.tasks.process_telegram_updates",
+        "schedule": 60.0,
+    },
+    "purge-telegram-updates": {
+        "task": "users.tasks.purge_telegram_updates",
+        "schedule": 24 * 60 * 60.0,
+    },
+    "purge-habit-deletions": {
+        "task": "habits.tasks.purge_habit_deletions",
+        "schedule": 24 * 60 * 60.0,
+    },
+    "purge-notification-outbox": {
+        "task": "habits.tasks.purge_notification_outbox",
+        "schedule": 24 * 60 * 60.0,
+    },
+    # Переходы на летнее/зимнее время и смена часового пояса пользователем.
+    # Переходы случаются в начале часа или получаса по UTC (есть пояса
+    # со смещением +hh:30), поэтому сверка дважды в час, а не каждую минуту:
+    # она читает все профили
+    "sync-habit-utc-offsets": {
+        "task": "habits.tasks.sync_habit_utc_offsets",
+        "schedule": crontab(minute="0,30"),
+    },
 }
 
-
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# beat — тик send_habit_reminders каждые 60 секунд; event — тик запускает
+# manage.py run_reminder_scheduler только в минуты, где есть напоминания
+HABIT_REMINDER_SCHEDULER = os.getenv("HABIT_REMINDER_SCHEDULER", "beat")
+if HABIT_REMINDER_SCHEDULER == "event":
+    CELERY_BEAT_SCHEDULE.pop("send-habit-reminders-every-minute")
+
+# Горизонт кучи планировщика (минуты, меньше суток), период её перечитывания
+# (секунды) и сколько ближайших минут держать в памяти
+HABIT_SCHEDULER_HORIZON = int(os.getenv("HABIT_SCHEDULER_HORIZON", "360"))
+HABIT_SCHEDULER_RELOAD_INTERVAL = int(os.getenv("HABIT_SCHEDULER_RELOAD_INTERVAL", "300"))
+HABIT_SCHEDULER_HEAP_LIMIT = int(os.getenv("HABIT_SCHEDULER_HEAP_LIMIT", "1000"))
+HABIT_SCHEDULER_REDIS_URL = os.getenv("HABIT_SCHEDULER_REDIS_URL", CELERY_BROKER_URL)
+
+# Сколько элементов принимает пакетная синхронизация /api/habits/bulk/
+HABIT_BULK_MAX_ITEMS = int(os.getenv("HABIT_BULK_MAX_ITEMS", "200"))
+
+# Дельта-синхронизация /api/habits/changes/: сколько дней хранить надгробия
+# удалённых привычек (более старый токен требует полной синхронизации) и на
+# сколько секунд назад перекрывать окно, чтобы не терять долгие транзакции
+HABIT_DELETION_RETENTION_DAYS = int(os.getenv("HABIT_DELETION_RETENTION_DAYS", "30"))
+HABIT_CHANGES_OVERLAP = int(os.getenv("HABIT_CHANGES_OVERLAP", "5"))
+
+# Отметки о выполнении: на сколько дней назад можно отметить пропущенный день
+# (офлайн-клиент досылает пакет через /api/habits/completions/)
+HABIT_COMPLETION_BACKFILL_DAYS = int(os.getenv("HABIT_COMPLETION_BACKFILL_DAYS", "30"))
+
+# Популярные публичные привычки /api/public-habits/trending/: привычек на
+# одну пачку пересчёта и сколько строк рейтинга можно запросить (?limit=)
+HABIT_TRENDING_CHUNK_SIZE = int(os.getenv("HABIT_TRENDING_CHUNK_SIZE", "1000"))
+HABIT_TRENDING_MAX_LIMIT = int(os.getenv("HABIT_TRENDING_MAX_LIMIT", "100"))
+
+# Потоковый экспорт/импорт: строк на один проход курсора и на один INSERT
+HABIT_EXPORT_CHUNK_SIZE = int(os.getenv("HABIT_EXPORT_CHUNK_SIZE", "2000"))
+HABIT_IMPORT_BATCH_SIZE = int(os.getenv("HABIT_IMPORT_BATCH_SIZE", "1000"))
+
+# Сколько привычек обрабатывает одна подзадача минутного тика
+HABIT_REMINDER_SHARD_SIZE = int(os.getenv("HABIT_REMINDER_SHARD_SIZE", "500"))
+# На сколько минут назад тик догоняет пропущенные напоминания после простоя
+HABIT_REMINDER_MAX_LOOKBACK = int(os.getenv("HABIT_REMINDER_MAX_LOOKBACK", "60"))
+
+# Доставка напоминаний из NotificationOutbox: размер пачки, аренда строки
+# на время отправки, экспоненциальная задержка повторов и dead-letter
+NOTIFICATION_OUTBOX_BATCH_SIZE = int(os.getenv("NOTIFICATION_OUTBOX_BATCH_SIZE", "200"))
+NOTIFICATION_OUTBOX_LEASE = int(os.getenv("NOTIFICATION_OUTBOX_LEASE", "300"))
+NOTIFICATION_OUTBOX_BACKOFF_BASE = int(os.getenv("NOTIFICATION_OUTBOX_BACKOFF_BASE", "30"))
+NOTIFICATION_OUTBOX_BACKOFF_MAX = int(os.getenv("NOTIFICATION_OUTBOX_BACKOFF_MAX", "3600"))
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_OUTBOX_MAX_ATTEMPTS", "5"))
+NOTIFICATION_OUTBOX_TIME_BUDGET = int(os.getenv("NOTIFICATION_OUTBOX_TIME_BUDGET", "50"))
+# Сколько дней хранить отправленные и недоставленные строки. Не меньше
+# суток: по строке за сегодня ключ идемпотентности отсекает повторы
+NOTIFICATION_OUTBOX_RETENTION_DAYS = max(
+    1, int(os.getenv("NOTIFICATION_OUTBOX_RETENTION_DAYS", "7"))
+)
+
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+# Таймаут одного запроса и число параллельных отправок на процесс
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "5"))
+TELEGRAM_MAX_WORKERS = int(os.getenv("TELEGRAM_MAX_WORKERS", "8"))
+# Лимиты Bot API (сообщений в секунду); состояние общее для воркеров через Redis
+TELEGRAM_RATE_LIMIT_GLOBAL = float(os.getenv("TELEGRAM_RATE_LIMIT_GLOBAL", "30"))
+TELEGRAM_RATE_LIMIT_PER_CHAT = float(os.getenv("TELEGRAM_RATE_LIMIT_PER_CHAT", "1"))
+TELEGRAM_RATE_LIMIT_REDIS_URL = os.getenv(
+    "TELEGRAM_RATE_LIMIT_REDIS_URL", CELERY_BROKER_URL
+)
+# Вебхук /api/telegram/webhook/: секрет из setWebhook (пусто — вебхук
+# выключен), имя бота для ссылки привязки и срок её действия (сек.)
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+TELEGRAM_BOT_USERNAME = os.getenv("TELEGRAM_BOT_USERNAME", "")
+TELEGRAM_LINK_TOKEN_TTL = int(os.getenv("TELEGRAM_LINK_TOKEN_TTL", "600"))
+# Разбор обновлений: сколько секунд копить всплеск, размер пачки и сколько
+# дней хранить обработанные (для отсева повторных доставок)
+TELEGRAM_UPDATES_DEBOUNCE = float(os.getenv("TELEGRAM_UPDATES_DEBOUNCE", "1"))
+TELEGRAM_UPDATES_BATCH_SIZE = int(os.getenv("TELEGRAM_UPDATES_BATCH_SIZE", "100"))
+TELEGRAM_UPDATES_RETENTION_DAYS = int(os.getenv("TELEGRAM_UPDATES_RETENTION_DAYS", "7"))
+
+# Метрики Prometheus на /metrics: метрики задач Celery суммируются в Redis,
+# сам маршрут открыт по токену METRICS_TOKEN. METRICS_ALLOWED_IPS (по
+# умолчанию пусто) сверяется с REMOTE_ADDR: за обратным прокси на той же
+# машине это 127.0.0.1 у всех запросов, поэтому адреса только явно
+METRICS_REDIS_URL = os.getenv("METRICS_REDIS_URL", CELERY_BROKER_URL)
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv("METRICS_ALLOWED_IPS", "").split(",") if ip]
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Кэш: Redis, если задан CACHE_REDIS_URL, иначе память процесса
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        }
     }
-}
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+# Общий кэш для записей, которые ставит один процесс, а снимает другой
+# (дебаунс вебхука Telegram, кэш пользователей JWT): Redis из
+# CACHE_REDIS_URL, иначе брокера Celery
+SHARED_CACHE_REDIS_URL = os.getenv("SHARED_CACHE_REDIS_URL", CACHE_REDIS_URL or CELERY_BROKER_URL)
+if SHARED_CACHE_REDIS_URL:
+    CACHES["shared"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": SHARED_CACHE_REDIS_URL,
+        "OPTIONS": {"socket_timeout": 0.5, "socket_connect_timeout": 0.5},
+    }
+# Кэш страниц ленты публичных привычек. Изменение привычки сбрасывает его
+# сменой версии в кэше, а её видят все процессы только в общем кэше: по
+# умолчанию лента кэшируется лишь при CACHE_REDIS_URL (True в памяти
+# процесса — только для одного процесса, например runserver)
+PUBLIC_HABITS_CACHE = os.getenv("PUBLIC_HABITS_CACHE", str(bool(CACHE_REDIS_URL))) == "True"
+# Сколько секунд живёт страница ленты публичных привычек. Изменения привычек
+# сбрасывают её сразу, TTL ограничивает устаревание полей, которые меняет тик
+PUBLIC_HABITS_CACHE_TIMEOUT = int(os.getenv("PUBLIC_HABITS_CACHE_TIMEOUT", "300"))
+# Сколько секунд пользователь JWT-запроса берётся из общего кэша (shared)
+# без запроса к БД. Сохранение пользователя сбрасывает запись во всех
+# процессах; без общего кэша пользователь читается из БД на каждый запрос
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", "60"))
+
+
+# БД: DB_ENGINE=sqlite (по умолчанию, файл SQLITE_PATH) или postgresql
+# (DB_NAME, DB_USER, ...; нужен драйвер psycopg, его нет в requirements.txt)
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite")
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("DB_NAME", "habits"),
+            "USER": os.getenv("DB_USER", "postgres"),
+            "PASSWORD": os.getenv("DB_PASSWORD", ""),
+            "HOST": os.getenv("DB_HOST", "localhost"),
+            "PORT": os.getenv("DB_PORT", "5432"),
+            # Постоянные соединения: без TCP- и auth-рукопожатия на каждый запрос
+            "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {},
+        }
+    }
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "0"))
+    if DB_POOL_MAX_SIZE:
+        # Пул psycopg 3 внутри процесса (нужен psycopg[pool]) вместо CONN_MAX_AGE
+        DATABASES["default"]["CONN_MAX_AGE"] = 0
+        DATABASES["default"]["OPTIONS"]["pool"] = {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": DB_POOL_MAX_SIZE,
+            "timeout": int(os.getenv("DB_POOL_TIMEOUT", "10")),
+        }
+    if os.getenv("DB_PGBOUNCER", "False") == "True":
+        # PgBouncer в режиме transaction не держит серверные курсоры между
+        # запросами (их использует .iterator() в экспорте)
+        DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+
+    DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST", "")
+    if DB_REPLICA_HOST:
+        DATABASES["replica"] = {
+            **DATABASES["default"],
+            "HOST": DB_REPLICA_HOST,
+            "PORT": os.getenv("DB_REPLICA_PORT", DATABASES["default"]["PORT"]),
+            "OPTIONS": {**DATABASES["default"]["OPTIONS"]},
+            # В тестах реплика — та же БД, что и основная
+            "TEST": {"MIRROR": "default"},
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv("SQLITE_PATH", BASE_DIR / 'db.sqlite3'),
+            "OPTIONS": {
+                # Секунды ожидания блокировки (busy_timeout) вместо «database is locked»
+                "timeout": int(os.getenv("SQLITE_TIMEOUT", "20")),
+            },
+        }
+    }
+    if os.getenv("SQLITE_TUNED", "False") == "True":
+        # WAL: читатели API не ждут записи тика напоминаний. Режим журнала
+        # сохраняется в файле БД. IMMEDIATE сразу берёт блокировку записи,
+        # и транзакции ждут её по timeout, а не падают при повышении
+        DATABASES["default"]["OPTIONS"].update({
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA temp_store=MEMORY;"
+                "PRAGMA cache_size=-20000;"
+            ),
+            "transaction_mode": "IMMEDIATE",
+        })
+
+DATABASE_ROUTERS = ["config.db_router.PrimaryReplicaRouter"]
+# Сколько секунд после записи пользователь читает с основной БД, а не с реплики
+DB_REPLICA_PIN_SECONDS = int(os.getenv("DB_REPLICA_PIN_SECONDS", "5"))
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
+    # Тот же JSON, что у стандартного рендерера, но через orjson (если установлен)
+    "DEFAULT_RENDERER_CLASSES": (
+        "config.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import api_root
+from .views import api_root, metrics
 from drf_spectacular.views import (
     SpectacularAPIView,
     SpectacularSwaggerView,
@@ -27,10 +27,14 @@ urlpatterns = [
     # Главная страница API
     path("", api_root, name="api_root"),
 
+    # Внутренние метрики Prometheus
+    path("metrics", metrics, name="metrics"),
+
     # JWT
     path("api/auth/jwt/create/", TokenObtainPairView.as_view(), name="jwt_create"),
     path("api/auth/jwt/refresh/", TokenRefreshView.as_view(), name="jwt_refresh"),
 
     # тут позже добавлю:
     path("api/", include("habits.urls")),
+    path("api/", include("users.urls")),
 ]
\ No newline at end of file
@@ -1,6 +1,23 @@
 # config/views.py
-from django.http import JsonResponse
+import hmac
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse
+
+from .metrics import CONTENT_TYPE, render_metrics
 
 
 def api_root(request):
-    return JsonResponse({"message": "Habit tracker API is running"})
\ No newline at end of file
+    return JsonResponse({"message": "Habit tracker API is running"})
+
+
+def metrics(request):
+    """Метрики для Prometheus. Внутренний маршрут: чужим отвечаем 404."""
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    allowed = request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS or (
+        token and hmac.compare_digest(authorization, f"Bearer {token}")
+    )
+    if not allowed:
+        raise Http404
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
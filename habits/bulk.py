@@ -0,0 +1,177 @@
+"""
+Пакетная синхронизация привычек: создание, изменение и удаление списком
+за один запрос и одну транзакцию.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_public_feed_version
+from .models import Habit, HabitDeletion
+from .scheduler import publish_schedule_change
+from .serializers import BulkHabitSerializer
+from .signals import bulk_deletion, touch_related
+
+OP_CREATE = "create"
+OP_UPDATE = "update"
+OP_DELETE = "delete"
+OPERATIONS = (OP_CREATE, OP_UPDATE, OP_DELETE)
+
+# Поля, которые пересчитываются при каждом изменении
+SCHEDULE_FIELDS = ("next_reminder_at", "updated_at")
+
+
+def get_operation(item):
+    return item.get("op") or (OP_UPDATE if "id" in item else OP_CREATE)
+
+
+def collect_habit_ids(items):
+    """id изменяемых и удаляемых привычек и всех related_habit из пакета."""
+    ids = set()
+    for item in items:
+        for key in ("id", "related_habit"):
+            try:
+                ids.add(int(item[key]))
+            except (KeyError, TypeError, ValueError):
+                pass
+    return ids
+
+
+def validate_items(user, items, habits):
+    """
+    Проверяет каждый элемент. Возвращает список (op, instance, validated_data)
+    и список ошибок той же длины (None для корректных элементов).
+    """
+    context = {
+        "habits": habits,
+        "utc_offset": Habit(owner=user).get_utc_offset(),
+    }
+    operations, errors = [], []
+    seen_ids = set()
+    for item in items:
+        if not isinstance(item, dict):
+            operations.append(None)
+            errors.append({"non_field_errors": ["Ожидался объект привычки."]})
+            continue
+
+        op = get_operation(item)
+        if op not in OPERATIONS:
+            operations.append(None)
+            errors.append({"op": [f"Неизвестная операция «{op}»."]})
+            continue
+
+        instance = None
+        if op != OP_CREATE:
+            try:
+                habit_id = int(item.get("id"))
+            except (TypeError, ValueError):
+                operations.append(None)
+                errors.append({"id": ["Обязательное поле."]})
+                continue
+            instance = habits.get(habit_id)
+            if instance is None:
+                operations.append(None)
+                errors.append({"id": ["Привычка не найдена."]})
+                continue
+            if habit_id in seen_ids:
+                operations.append(None)
+                errors.append({"id": ["Привычка встречается в пакете дважды."]})
+                continue
+            seen_ids.add(habit_id)
+
+        if op == OP_DELETE:
+            operations.append((op, instance, None))
+            errors.append(None)
+            continue
+
+        data = {key: value for key, value in item.items() if key not in ("op", "id")}
+        serializer = BulkHabitSerializer(
+            instance,
+            data=data,
+            partial=op == OP_UPDATE,
+            context=context,
+        )
+        if not serializer.is_valid():
+            operations.append(None)
+            errors.append(serializer.errors)
+            continue
+
+        validated = dict(serializer.validated_data)
+        if op == OP_CREATE:
+            validated["owner"] = user
+        serializer.set_next_reminder_at(validated, instance)
+        operations.append((op, instance, validated))
+        errors.append(None)
+    return operations, errors
+
+
+def apply_operations(user, operations):
+    """Применяет проверенный пакет в одной транзакции."""
+    now = timezone.now()
+    created, updated, deleted_ids = [], [], []
+    update_fields = set(SCHEDULE_FIELDS)
+    results = []
+    # Была ли или стала ли какая-то привычка публичной
+    touches_public = False
+    for op, instance, validated in operations:
+        if op == OP_CREATE:
+            habit = Habit(**validated)
+            touches_public |= habit.is_public
+            created.append(habit)
+            results.append(habit)
+        elif op == OP_UPDATE:
+            touches_public |= instance.is_public
+            for field, value in validated.items():
+                setattr(instance, field, value)
+            touches_public |= instance.is_public
+            instance.updated_at = now
+            update_fields.update(validated)
+            updated.append(instance)
+            results.append(instance)
+        else:
+            touches_public |= instance.is_public
+            deleted_ids.append(instance.pk)
+            results.append(instance.pk)
+
+    # bulk_* не вызывает сигналы, а у удаления они выключены: надгробия,
+    # сброс кэша ленты и будильник планировщика — по одному на пакет
+    with transaction.atomic():
+        if created:
+            Habit.objects.bulk_create(created)
+        if updated:
+            Habit.objects.bulk_update(updated, sorted(update_fields))
+        if deleted_ids:
+            touch_related(deleted_ids, now)
+            with bulk_deletion():
+                Habit.objects.filter(owner=user, pk__in=deleted_ids).delete()
+            HabitDeletion.objects.bulk_create(
+                HabitDeletion(owner=user, habit_id=habit_id, deleted_at=now)
+                for habit_id in deleted_ids
+            )
+        if touches_public:
+            transaction.on_commit(bump_public_feed_version)
+        if created or updated or deleted_ids:
+            transaction.on_commit(lambda: publish_schedule_change(now, reload=True))
+    return results
+
+
+def sync_habits(user, items):
+    """
+    Проверяет весь пакет и, если ошибок нет, применяет его.
+    Возвращает (results, errors): errors — None или список по элементам.
+    """
+    if len(items) > settings.HABIT_BULK_MAX_ITEMS:
+        return None, [{"non_field_errors": [
+            f"Не больше {settings.HABIT_BULK_MAX_ITEMS} привычек за запрос."
+        ]}]
+
+    # Все упомянутые привычки владельца — одним запросом
+    habits = (
+        Habit.objects.filter(owner=user, pk__in=collect_habit_ids(items))
+        .select_related("related_habit")
+        .in_bulk()
+    )
+    operations, errors = validate_items(user, items, habits)
+    if any(errors):
+        return None, errors
+    return apply_operations(user, operations), None
@@ -0,0 +1,67 @@
+"""
+Кэш ленты публичных привычек.
+
+Ключи версионированы: при изменении публичной привычки версия растёт,
+и все страницы ленты разом становятся недействительными без перебора ключей.
+Версия живёт в кэше, поэтому ленту кэшируем только в общем для процессов
+кэше (PUBLIC_HABITS_CACHE): в памяти процесса остальные воркеры не узнали
+бы о смене версии и отдавали старые страницы до конца TTL.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+PUBLIC_FEED_VERSION_KEY = "habits:public-feed:version"
+PUBLIC_FEED_PAGE_KEY = "habits:public-feed:{version}:{params}"
+PUBLIC_FEED_CHANGED_KEY = "habits:public-feed:changed-at"
+
+
+def get_public_feed_version():
+    # Начальная версия от времени: после вытеснения счётчика из кэша старые
+    # страницы не совпадут с новыми ключами
+    cache.add(PUBLIC_FEED_VERSION_KEY, time.time_ns(), None)
+    return cache.get(PUBLIC_FEED_VERSION_KEY)
+
+
+def bump_public_feed_version():
+    try:
+        cache.incr(PUBLIC_FEED_VERSION_KEY)
+    except ValueError:
+        cache.set(PUBLIC_FEED_VERSION_KEY, time.time_ns(), None)
+    cache.set(PUBLIC_FEED_CHANGED_KEY, time.time(), None)
+
+
+def public_feed_changed_within(seconds) -> bool:
+    """Менялась ли лента за последние seconds секунд."""
+    changed_at = cache.get(PUBLIC_FEED_CHANGED_KEY)
+    return changed_at is not None and time.time() - changed_at < seconds
+
+
+def public_feed_cache_enabled() -> bool:
+    return settings.PUBLIC_HABITS_CACHE
+
+
+def get_public_feed_cache_key(request):
+    """
+    Ключ страницы: параметры запроса, а также схема и хост — ссылки
+    next/previous в закэшированной странице абсолютные.
+    """
+    params = "&".join(
+        f"{key}={value}"
+        for key, values in sorted(request.query_params.lists())
+        for value in values
+    )
+    origin = f"{request.scheme}://{request.get_host()}"
+    digest = hashlib.md5(f"{origin}?{params}".encode()).hexdigest()
+    return PUBLIC_FEED_PAGE_KEY.format(version=get_public_feed_version(), params=digest)
+
+
+def make_etag(content: bytes) -> str:
+    """Сильный ETag: хэш байтов ответа."""
+    return f'"{hashlib.sha256(content).hexdigest()}"'
+
+
+def set_public_feed_page(key, etag, data):
+    cache.set(key, (etag, data), settings.PUBLIC_HABITS_CACHE_TIMEOUT)
@@ -0,0 +1,95 @@
+"""
+Дельта-синхронизация привычек и условные GET.
+
+Токен синхронизации — момент времени в микросекундах от эпохи. Клиент
+передаёт токен прошлого ответа и получает привычки, изменённые после него,
+и id удалённых (по надгробиям HabitDeletion).
+"""
+import hashlib
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Habit, HabitDeletion
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class TokenExpired(Exception):
+    """Токен старше хранимых надгробий: нужна полная синхронизация."""
+
+
+def make_token(moment) -> str:
+    return str((moment - EPOCH) // timedelta(microseconds=1))
+
+
+def parse_token(token):
+    """Момент времени из токена; ValueError, если токен не разобрать."""
+    try:
+        return EPOCH + timedelta(microseconds=int(token))
+    except OverflowError:
+        # Число вне диапазона datetime — такой токен сервер не выдавал
+        raise ValueError(f"Токен вне допустимого диапазона: {token}") from None
+
+
+def get_changes(user, since=None, now=None):
+    """
+    Изменения после since: (changed queryset, deleted ids, новый токен).
+    Окно перекрытия HABIT_CHANGES_OVERLAP покрывает транзакции, которые
+    записали updated_at раньше, а зафиксировались позже прошлого опроса:
+    такие привычки придут повторно, но не потеряются.
+    """
+    now = now or timezone.now()
+    changed = Habit.objects.filter(owner=user)
+    deleted = HabitDeletion.objects.filter(owner=user)
+    if since is not None:
+        retention = timedelta(days=settings.HABIT_DELETION_RETENTION_DAYS)
+        if since < now - retention:
+            raise TokenExpired
+        since -= timedelta(seconds=settings.HABIT_CHANGES_OVERLAP)
+        changed = changed.filter(updated_at__gt=since)
+        deleted = deleted.filter(deleted_at__gt=since)
+    deleted_ids = list(deleted.order_by("habit_id").values_list("habit_id", flat=True).distinct())
+    return changed.order_by("updated_at", "id"), deleted_ids, make_token(now)
+
+
+def get_last_modified(user):
+    """
+    Момент последнего изменения привычек пользователя, включая удаления,
+    одним запросом из двух агрегатов по индексам (owner, updated_at)
+    и (owner, deleted_at). None, если привычек не было.
+    """
+    last_update = (
+        Habit.objects.filter(owner=OuterRef("pk"))
+        .order_by()
+        .values("owner")
+        .annotate(value=Max("updated_at"))
+        .values("value")
+    )
+    last_delete = (
+        HabitDeletion.objects.filter(owner=OuterRef("pk"))
+        .order_by()
+        .values("owner")
+        .annotate(value=Max("deleted_at"))
+        .values("value")
+    )
+    row = (
+        get_user_model().objects.filter(pk=user.pk)
+        .values_list(Subquery(last_update), Subquery(last_delete))
+        .first()
+    )
+    moments = [moment for moment in row or () if moment is not None]
+    return max(moments) if moments else None
+
+
+def make_list_etag(user, last_modified, query_string) -> str:
+    """
+    Слабый ETag списка: от времени последнего изменения с микросекундами
+    (Last-Modified точен только до секунды) и параметров страницы.
+    """
+    source = f"{user.pk}:{last_modified.isoformat() if last_modified else '-'}:{query_string}"
+    return f'W/"{hashlib.md5(source.encode()).hexdigest()}"'
@@ -0,0 +1,170 @@
+"""
+Отметки о выполнении привычек и счётчики серий.
+
+Журнал HabitCompletion — источник истины, а Habit хранит готовые счётчики:
+current_streak (серия на дату last_completed_on), best_streak и
+total_completions. Отметка после последней обновляет их одним UPDATE на
+F-выражениях; отметка задним числом (офлайн-клиент прислал старый день)
+или проигранная гонка пересчитывает серии по журналу этой привычки.
+Серия продолжается, если между выполнениями не больше periodicity дней.
+"""
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Habit, HabitCompletion
+from .serializers import HabitCompletionSerializer
+
+
+def get_local_today(user, now=None):
+    """Сегодняшняя дата в поясе пользователя."""
+    utc_offset = Habit(owner=user).get_utc_offset()
+    return ((now or timezone.now()) + timedelta(minutes=utc_offset)).date()
+
+
+def split_runs(dates, periodicity):
+    """Длины серий в отсортированном списке дат."""
+    runs = []
+    previous = None
+    for day in dates:
+        if previous is not None and (day - previous).days <= periodicity:
+            runs[-1] += 1
+        else:
+            runs.append(1)
+        previous = day
+    return runs
+
+
+def build_streak_update(dates, periodicity):
+    """
+    Значения UPDATE для новых дат, идущих после last_completed_on. Первая
+    серия продолжает текущую, если новая дата не дальше periodicity дней.
+    """
+    runs = split_runs(dates, periodicity)
+    continues = Q(last_completed_on__gte=dates[0] - timedelta(days=periodicity))
+    first_run = Case(
+        When(continues, then=F("current_streak") + runs[0]),
+        default=Value(runs[0]),
+    )
+    return {
+        "current_streak": first_run if len(runs) == 1 else Value(runs[-1]),
+        "best_streak": Greatest(F("best_streak"), first_run, Value(max(runs))),
+        "total_completions": F("total_completions") + len(dates),
+        "last_completed_on": dates[-1],
+    }
+
+
+def recalculate_streaks(habit_id, now=None):
+    """Пересчёт счётчиков по всему журналу привычки под блокировкой строки."""
+    with transaction.atomic():
+        habit = Habit.objects.select_for_update().only("id", "periodicity").get(pk=habit_id)
+        dates = list(
+            HabitCompletion.objects.filter(habit_id=habit_id)
+            .order_by("completed_on")
+            .values_list("completed_on", flat=True)
+        )
+        runs = split_runs(dates, habit.periodicity) or [0]
+        Habit.objects.filter(pk=habit_id).update(
+            current_streak=runs[-1],
+            best_streak=max(runs),
+            total_completions=len(dates),
+            last_completed_on=dates[-1] if dates else None,
+            updated_at=now or timezone.now(),
+        )
+
+
+def apply_completions(habit, dates, now):
+    """
+    Учитывает новые даты в счётчиках. Условие UPDATE проверяет, что даты
+    идут после last_completed_on и periodicity не поменялась: иначе кто-то
+    успел раньше, и счётчики пересчитываются по журналу.
+    """
+    last = habit.last_completed_on
+    if last is None or dates[0] > last:
+        updated = (
+            Habit.objects.filter(pk=habit.pk, periodicity=habit.periodicity)
+            .filter(Q(last_completed_on__isnull=True) | Q(last_completed_on__lt=dates[0]))
+            .update(**build_streak_update(dates, habit.periodicity), updated_at=now)
+        )
+        if updated:
+            return
+    recalculate_streaks(habit.pk, now)
+
+
+def get_habit_stats(habit, today):
+    return {
+        "habit": habit.pk,
+        "current_streak": habit.get_current_streak(today),
+        "best_streak": habit.best_streak,
+        "total_completions": habit.total_completions,
+        "last_completed_on": habit.last_completed_on,
+    }
+
+
+def record_completions(user, items):
+    """
+    Отмечает выполнения списком {"habit": id, "completed_on": дата}
+    (по умолчанию — сегодня). Пакет проверяется целиком, повторы одной даты
+    не считаются дважды. Возвращает (result, errors): errors — None или
+    список по элементам.
+    """
+    if len(items) > settings.HABIT_BULK_MAX_ITEMS:
+        return None, [{"non_field_errors": [
+            f"Не больше {settings.HABIT_BULK_MAX_ITEMS} отметок за запрос."
+        ]}]
+
+    habit_ids = set()
+    for item in items:
+        try:
+            habit_ids.add(int(item["habit"]))
+        except (KeyError, TypeError, ValueError):
+            pass
+    habits = Habit.objects.filter(owner=user, pk__in=habit_ids).in_bulk()
+    today = get_local_today(user)
+    serializer = HabitCompletionSerializer(context={"habits": habits, "today": today})
+
+    requested, errors = set(), []
+    for item in items:
+        if not isinstance(item, dict):
+            errors.append({"non_field_errors": ["Ожидался объект отметки."]})
+            continue
+        try:
+            validated = serializer.run_validation(item)
+        except ValidationError as exc:
+            errors.append(exc.detail)
+            continue
+        requested.add((validated["habit"].pk, validated["completed_on"]))
+        errors.append(None)
+    if any(errors):
+        return None, errors
+
+    now = timezone.now()
+    with transaction.atomic():
+        existing = set(
+            HabitCompletion.objects.filter(
+                habit_id__in={habit_id for habit_id, _day in requested},
+                completed_on__in={day for _habit_id, day in requested},
+            ).values_list("habit_id", "completed_on")
+        )
+        new = sorted(requested - existing)
+        # Одновременная отметка того же дня не даст дубля: её отсечёт
+        # уникальный индекс, а счётчики сверит условие в apply_completions
+        HabitCompletion.objects.bulk_create(
+            [HabitCompletion(habit_id=habit_id, completed_on=day) for habit_id, day in new],
+            ignore_conflicts=True,
+        )
+        for habit_id, group in groupby(new, key=lambda pair: pair[0]):
+            apply_completions(habits[habit_id], [day for _habit_id, day in group], now)
+
+    touched = Habit.objects.filter(pk__in=habits.keys() & {pk for pk, _day in requested})
+    return {
+        "created": len(new),
+        "duplicates": len(requested) - len(new),
+        "habits": [get_habit_stats(habit, today) for habit in touched.order_by("pk")],
+    }, None
@@ -0,0 +1,132 @@
+import tempfile
+import time
+import tracemalloc
+from datetime import time as dt_time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from habits.cache import bump_public_feed_version
+from habits.models import Habit
+from habits.scheduler import publish_schedule_change
+from habits.signals import bulk_deletion
+from habits.transfer import CONTENT_TYPES, import_habits, iter_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время и пик памяти потокового экспорта и импорта привычек "
+        "на синтетическом аккаунте"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument(
+            "--as",
+            dest="transfer_format",
+            choices=sorted(CONTENT_TYPES),
+            default="ndjson",
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--max-memory-mb",
+            type=float,
+            default=64,
+            help="Пик памяти Python (tracemalloc), выше которого замер считается проваленным",
+        )
+        parser.add_argument(
+            "--allow-write",
+            action="store_true",
+            help="Разрешить запись: замер создаёт и удаляет привычки в БД. "
+            "Только для тестовой или одноразовой БД",
+        )
+
+    def handle(self, *args, **options):
+        if not options["allow_write"]:
+            raise CommandError(
+                f"Замер пишет в БД {connection.settings_dict['NAME']}: "
+                "запускайте его на тестовой копии с --allow-write"
+            )
+
+        rows = options["rows"]
+        transfer_format = options["transfer_format"]
+        user, _created = get_user_model().objects.get_or_create(username="benchmark-transfer")
+        try:
+            self.purge(user)
+            self.seed(user, rows)
+            with tempfile.TemporaryFile("w+", encoding="utf-8") as dump:
+                export = self.measure(
+                    lambda: self.export_to(user, transfer_format, dump)
+                )
+                self.purge(user)
+                dump.seek(0)
+                imported = self.measure(
+                    lambda: import_habits(user, dump, transfer_format, options["batch_size"])
+                )
+        finally:
+            self.purge(user, delete_user=True)
+
+        self.report("export", rows, export)
+        self.report("import", rows, imported)
+        result = imported["result"]
+        if result["created"] != rows:
+            raise CommandError(
+                f"Импортировано {result['created']} из {rows}: {result['errors'][:3]}"
+            )
+        peak = max(export["peak_mb"], imported["peak_mb"])
+        if peak > options["max_memory_mb"]:
+            raise CommandError(f"Пик памяти {peak:.1f} МБ выше {options['max_memory_mb']} МБ")
+
+    def purge(self, user, delete_user=False):
+        """
+        Удаляет синтетические привычки без надгробий и построчных сигналов:
+        кэш ленты и планировщик будим один раз.
+        """
+        with bulk_deletion():
+            Habit.objects.filter(owner=user).delete()
+            if delete_user:
+                user.delete()
+        bump_public_feed_version()
+        publish_schedule_change(timezone.now(), reload=True)
+
+    def seed(self, user, rows):
+        batch = []
+        for i in range(rows):
+            batch.append(
+                Habit(
+                    owner=user,
+                    place=f"Место {i}",
+                    time=dt_time(i % 24, i % 60),
+                    action=f"Действие {i}",
+                    periodicity=i % 7 + 1,
+                    is_public=i % 10 == 0,
+                )
+            )
+            if len(batch) >= 5000:
+                Habit.objects.bulk_create(batch)
+                batch = []
+        Habit.objects.bulk_create(batch)
+
+    def export_to(self, user, transfer_format, dump):
+        for chunk in iter_export(user, transfer_format):
+            dump.write(chunk)
+
+    def measure(self, func):
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            result = func()
+            elapsed = time.perf_counter() - started
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {"result": result, "seconds": elapsed, "peak_mb": peak / 2 ** 20}
+
+    def report(self, name, rows, measurement):
+        self.stdout.write(
+            f"{name}: {rows} rows in {measurement['seconds']:.2f}s "
+            f"({rows / measurement['seconds']:.0f} rows/s), "
+            f"peak {measurement['peak_mb']:.1f} MB"
+        )
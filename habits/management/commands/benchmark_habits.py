@@ -0,0 +1,367 @@
+import json
+import platform
+import random
+import statistics
+import time
+from datetime import timedelta
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.celery import app as celery_app
+from habits.cache import bump_public_feed_version
+from habits.models import Habit, NotificationOutbox, Watermark
+from habits.search import get_search_terms, search_habits
+from habits.services import reset_telegram_client
+from habits.tasks import REMINDER_WATERMARK, send_habit_reminders
+from habits.testing import FakeBotAPI
+from users.models import TelegramProfile
+
+BENCH_PREFIX = "benchmark"
+# Частые и редкие слова из словарей generate_habit_data и одно без совпадений
+SEARCH_QUERIES = ("вод", "читать", "парк", "медитировать балкон", "растяжка офис", "йога")
+SEARCH_PAGE = 20
+# Сценарии, которые пишут в настроенную БД и кэш: пользователи benchmark-*,
+# привычки, отметка тика, версия кэша ленты
+WRITE_SCENARIOS = ("public_feed_cold", "create", "tick")
+
+
+def percentile(values, share):
+    """Перцентиль с линейной интерполяцией (как numpy по умолчанию)."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * share
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(durations, queries):
+    return {
+        "iterations": len(durations),
+        "p50_ms": round(percentile(durations, 0.5) * 1000, 3),
+        "p90_ms": round(percentile(durations, 0.9) * 1000, 3),
+        "p99_ms": round(percentile(durations, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(durations) * 1000, 3),
+        "max_ms": round(max(durations) * 1000, 3),
+        "queries_p50": percentile(queries, 0.5),
+        "queries_max": max(queries),
+    }
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный замер p50/p99 списка привычек, публичной ленты, поиска "
+        "(и его базовой линии icontains), создания "
+        "и полного тика send_habit_reminders с локальной заглушкой Bot API. "
+        "Данные — от generate_habit_data; результат пишется в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prefix", default="load", help="Префикс пользователей generate_habit_data"
+        )
+        parser.add_argument("--iterations", type=int, default=200)
+        parser.add_argument("--warmup", type=int, default=20)
+        parser.add_argument("--ticks", type=int, default=5)
+        parser.add_argument("--tick-habits", type=int, default=1000, help="Привычек на тик")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", default="benchmark_habits.json")
+        parser.add_argument("--compare", help="JSON прошлого запуска для сравнения")
+        parser.add_argument(
+            "--allow-write",
+            action="store_true",
+            help=f"Разрешить сценарии, которые пишут в БД и кэш: {', '.join(WRITE_SCENARIOS)}. "
+            "Только для тестовой или одноразовой БД",
+        )
+        parser.add_argument(
+            "--only",
+            nargs="+",
+            choices=(
+                "habit_list",
+                "public_feed",
+                "public_feed_cold",
+                "search",
+                "search_icontains",
+                "create",
+                "tick",
+            ),
+        )
+
+    def handle(self, *args, **options):
+        scenarios = {
+            "habit_list": self.bench_habit_list,
+            "public_feed": self.bench_public_feed,
+            "public_feed_cold": self.bench_public_feed_cold,
+            "search": self.bench_search,
+            "search_icontains": self.bench_search_icontains,
+            "create": self.bench_create,
+            "tick": self.bench_tick,
+        }
+        selected = options["only"] or list(scenarios)
+        writes = [name for name in selected if name in WRITE_SCENARIOS]
+        if writes and not options["allow_write"]:
+            raise CommandError(
+                f"Сценарии {', '.join(writes)} пишут в БД {connection.settings_dict['NAME']} "
+                "и кэш: запускайте их на тестовой копии с --allow-write "
+                "или выберите остальные через --only"
+            )
+
+        self.rng = random.Random(options["seed"])
+        self.options = options
+        self.client = APIClient()
+        user_ids = list(
+            get_user_model().objects.filter(
+                username__startswith=f"{options['prefix']}-",
+                habits__isnull=False,
+            )
+            .distinct()
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        if not user_ids:
+            raise CommandError(
+                f"Нет пользователей {options['prefix']}-* с привычками: "
+                "сначала запустите generate_habit_data"
+            )
+        self.user_ids = user_ids
+
+        results = {}
+        try:
+            for name in selected:
+                results[name] = scenarios[name]()
+                self.report(name, results[name])
+        finally:
+            get_user_model().objects.filter(username__startswith=f"{BENCH_PREFIX}-").delete()
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "users": len(user_ids),
+                "habits": Habit.objects.count(),
+                "public_habits": Habit.objects.filter(is_public=True).count(),
+            },
+            "options": {
+                key: options[key]
+                for key in ("prefix", "iterations", "warmup", "ticks", "tick_habits", "seed")
+            },
+            "scenarios": results,
+        }
+        with open(options["output"], "w", encoding="utf-8") as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        self.stdout.write(f"Results written to {options['output']}")
+        if options["compare"]:
+            self.compare(options["compare"], results)
+
+    def measure(self, request, setup=None, iterations=None, warmup=None):
+        """Вызывает request() warmup + iterations раз, setup() — вне замера."""
+        iterations = iterations or self.options["iterations"]
+        warmup = self.options["warmup"] if warmup is None else warmup
+        durations, queries = [], []
+        for number in range(warmup + iterations):
+            argument = setup() if setup else None
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                request(argument)
+                elapsed = time.perf_counter() - started
+            if number >= warmup:
+                durations.append(elapsed)
+                queries.append(counter.count)
+        return summarize(durations, queries)
+
+    def authenticate(self, user_id):
+        user = get_user_model()(pk=user_id)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def get(self, url, data=None):
+        response = self.client.get(url, data)
+        if response.status_code != 200:
+            raise CommandError(f"GET {url}: {response.status_code}")
+        return response
+
+    def bench_habit_list(self):
+        url = reverse("habit-list")
+        return self.measure(
+            lambda _arg: self.get(url),
+            setup=lambda: self.authenticate(self.rng.choice(self.user_ids)),
+        )
+
+    def bench_public_feed(self):
+        url = reverse("public-habit-list")
+        self.authenticate(self.user_ids[0])
+        pages = max(1, min(20, Habit.objects.filter(is_public=True).count() // 5))
+        # Горячий кэш: страницы повторяются, как в реальной ленте
+        return self.measure(
+            lambda page: self.get(url, {"page": page}),
+            setup=lambda: self.rng.randint(1, pages),
+        )
+
+    def bench_public_feed_cold(self):
+        url = reverse("public-habit-list")
+        self.authenticate(self.user_ids[0])
+
+        def setup():
+            bump_public_feed_version()
+
+        return self.measure(lambda _arg: self.get(url), setup=setup)
+
+    def bench_search(self):
+        """Первая страница ?q= по текстовому индексу (FTS5 или GIN), с ранжированием."""
+        def request(query):
+            queryset = search_habits(Habit.objects.filter(is_public=True), query)
+            queryset = queryset.order_by("search_rank", "-id")
+            list(queryset.values("id", "action", "place")[:SEARCH_PAGE])
+
+        return self.measure(request, setup=lambda: self.rng.choice(SEARCH_QUERIES))
+
+    def bench_search_icontains(self):
+        """Базовая линия для search: те же слова через icontains, новые сверху."""
+        def request(query):
+            condition = Q(is_public=True)
+            for term in get_search_terms(query):
+                condition &= Q(action__icontains=term) | Q(place__icontains=term)
+            queryset = Habit.objects.filter(condition).order_by("-id")
+            list(queryset.values("id", "action", "place")[:SEARCH_PAGE])
+
+        return self.measure(request, setup=lambda: self.rng.choice(SEARCH_QUERIES))
+
+    def bench_create(self):
+        writer = get_user_model().objects.create(username=f"{BENCH_PREFIX}-writer")
+        self.authenticate(writer.pk)
+        url = reverse("habit-list")
+
+        def request(number):
+            response = self.client.post(
+                url,
+                {
+                    "place": "Дом",
+                    "time": f"{number % 24:02d}:{number % 60:02d}",
+                    "action": f"Привычка {number}",
+                    "periodicity": 1,
+                    "execution_time": 60,
+                },
+                format="json",
+            )
+            if response.status_code != 201:
+                raise CommandError(f"POST {url}: {response.status_code} {response.data}")
+
+        counter = iter(range(10 ** 9))
+        return self.measure(request, setup=lambda: next(counter))
+
+    def prepare_tick_habits(self):
+        """Отдельные пользователи с профилями и привычками, которые взводятся перед каждым тиком."""
+        user_model = get_user_model()
+        count = self.options["tick_habits"]
+        chats = max(1, count // 3)
+        users = user_model.objects.bulk_create(
+            user_model(username=f"{BENCH_PREFIX}-tick-{number}") for number in range(chats)
+        )
+        TelegramProfile.objects.bulk_create(
+            TelegramProfile(user=user, chat_id=f"{BENCH_PREFIX}-{user.pk}") for user in users
+        )
+        now = timezone.localtime()
+        habits = Habit.objects.bulk_create(
+            Habit(
+                owner=users[number % chats],
+                place="Парк",
+                time=now.time().replace(second=0, microsecond=0),
+                action=f"Привычка {number}",
+                next_reminder_at=now,
+            )
+            for number in range(count)
+        )
+        return [habit.pk for habit in habits]
+
+    def arm_tick(self, habit_ids):
+        now = timezone.now()
+        minute = now.replace(second=0, microsecond=0)
+        if now - minute > timedelta(seconds=55):
+            # Тик должен уложиться в ту же минуту, что и взведённые привычки
+            time.sleep(60 - now.second)
+            minute = timezone.now().replace(second=0, microsecond=0)
+        NotificationOutbox.objects.filter(habit_id__in=habit_ids).delete()
+        Habit.objects.filter(pk__in=habit_ids).update(next_reminder_at=minute, last_reminder=None)
+        Watermark.objects.update_or_create(name=REMINDER_WATERMARK, defaults={"value": minute})
+
+    def bench_tick(self):
+        habit_ids = self.prepare_tick_habits()
+        conf = celery_app.conf
+        eager = (conf.task_always_eager, conf.task_eager_propagates)
+        # Подзадачи и доставка выполняются в этом процессе, отправка — в заглушку
+        conf.update(task_always_eager=True, task_eager_propagates=True)
+        watermark = Watermark.objects.filter(name=REMINDER_WATERMARK).first()
+        try:
+            with FakeBotAPI() as api, override_settings(
+                TELEGRAM_BOT_TOKEN="benchmark",
+                TELEGRAM_API_URL=api.url,
+                TELEGRAM_RATE_LIMIT_REDIS_URL="",
+                TELEGRAM_RATE_LIMIT_GLOBAL=10 ** 6,
+                TELEGRAM_RATE_LIMIT_PER_CHAT=10 ** 6,
+            ):
+                reset_telegram_client()
+                due = []
+
+                def request(_arg):
+                    due.append(send_habit_reminders()["due"])
+
+                result = self.measure(
+                    request,
+                    setup=lambda: self.arm_tick(habit_ids),
+                    iterations=self.options["ticks"],
+                    warmup=1,
+                )
+                result["due_p50"] = percentile(due, 0.5)
+                result["messages"] = len(api.requests)
+        finally:
+            reset_telegram_client()
+            conf.update(task_always_eager=eager[0], task_eager_propagates=eager[1])
+            # Возвращаем отметку тика, чтобы не сдвинуть настоящий планировщик
+            if watermark is not None:
+                Watermark.objects.filter(pk=watermark.pk).update(value=watermark.value)
+            else:
+                Watermark.objects.filter(name=REMINDER_WATERMARK).delete()
+        return result
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:>18}: p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms  "
+            f"queries {result['queries_p50']:g}"
+        )
+
+    def compare(self, path, results):
+        with open(path, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)["scenarios"]
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            changes = "  ".join(
+                f"{key} {before[key]:.2f} -> {result[key]:.2f} "
+                f"({(result[key] / before[key] - 1) * 100:+.0f}%)"
+                for key in ("p50_ms", "p99_ms")
+                if before[key]
+            )
+            self.stdout.write(
+                f"{name:>18}: {changes}  "
+                f"queries {before['queries_p50']:g} -> {result['queries_p50']:g}"
+            )
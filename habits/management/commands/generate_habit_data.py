@@ -0,0 +1,149 @@
+import random
+import time
+from datetime import time as dt_time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from habits.models import Habit
+from users.models import TelegramProfile
+
+# Веса распределений подобраны «на глаз» под типичный трекер привычек
+TIMEZONES = (
+    ("Europe/Moscow", 40),
+    ("Europe/Kaliningrad", 4),
+    ("Asia/Yekaterinburg", 10),
+    ("Asia/Novosibirsk", 6),
+    ("Asia/Vladivostok", 3),
+    ("Europe/Berlin", 10),
+    ("Europe/London", 5),
+    ("America/New_York", 9),
+    ("Asia/Tokyo", 3),
+    ("UTC", 10),
+)
+HABITS_PER_USER = (
+    (0, 10), (1, 15), (2, 20), (3, 18), (4, 12), (5, 9), (6, 6), (8, 6), (12, 3), (20, 1),
+)
+PERIODICITY = ((1, 70), (2, 10), (3, 5), (7, 15))
+EXECUTION_TIME = (30, 60, 90, 120)
+PLACES = ("Дом", "Парк", "Офис", "Спортзал", "Кухня", "Балкон", "Метро")
+ACTIONS = ("Зарядка", "Читать", "Медитировать", "Пить воду", "Гулять", "Учить слова", "Растяжка")
+REWARDS = ("Кофе", "Серия сериала", "Десерт", "Прогулка")
+
+
+def pick(rng, weighted):
+    values, weights = zip(*weighted)
+    return rng.choices(values, weights)[0]
+
+
+def random_habit_time(rng):
+    """Пики утром и вечером, днём равномерно; чаще всего круглые четверти часа."""
+    roll = rng.random()
+    if roll < 0.45:
+        hours = rng.gauss(7.5, 1.0)
+    elif roll < 0.8:
+        hours = rng.gauss(20.5, 1.3)
+    else:
+        hours = rng.uniform(9, 18)
+    minutes = int(hours * 60) % (24 * 60)
+    if rng.random() < 0.7:
+        minutes -= minutes % 15
+    return dt_time(minutes // 60, minutes % 60)
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет БД синтетическими пользователями, Telegram-профилями и "
+        "привычками пачками bulk_create. Одинаковый --seed даёт одинаковые данные"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--prefix", default="load", help="Префикс имён пользователей")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=5000, help="Пользователей за пачку")
+        parser.add_argument("--profile-ratio", type=float, default=0.8)
+        parser.add_argument("--public-ratio", type=float, default=0.1)
+        parser.add_argument("--pleasant-ratio", type=float, default=0.2)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Сначала удалить пользователей с этим префиксом",
+        )
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        users = get_user_model().objects.filter(username__startswith=f"{prefix}-")
+        if options["clear"]:
+            deleted, _details = users.delete()
+            self.stdout.write(f"Deleted {deleted} rows")
+        elif users.exists():
+            raise CommandError(f"Пользователи {prefix}-* уже есть: добавьте --clear")
+
+        rng = random.Random(options["seed"])
+        # Хэш пароля считается один раз: входить под этими пользователями не нужно
+        self.password = make_password(None)
+        self.now = timezone.now()
+        started = time.perf_counter()
+        totals = {"users": 0, "profiles": 0, "habits": 0}
+        for start in range(0, options["users"], options["batch_size"]):
+            stop = min(start + options["batch_size"], options["users"])
+            counts = self.create_batch(rng, prefix, range(start, stop), options)
+            for key, value in counts.items():
+                totals[key] += value
+            self.stdout.write(
+                f"{totals['users']}/{options['users']} users, {totals['habits']} habits "
+                f"({time.perf_counter() - started:.0f}s)"
+            )
+        self.stdout.write(
+            "Created {users} users, {profiles} profiles, {habits} habits".format(**totals)
+        )
+
+    @transaction.atomic
+    def create_batch(self, rng, prefix, numbers, options):
+        user_model = get_user_model()
+        users = user_model.objects.bulk_create(
+            user_model(username=f"{prefix}-{number:07d}", password=self.password)
+            for number in numbers
+        )
+
+        profiles = []
+        offsets = {}
+        for user in users:
+            if rng.random() >= options["profile_ratio"]:
+                continue
+            profile = TelegramProfile(
+                user=user,
+                chat_id=f"{prefix}-{user.pk}",
+                timezone=pick(rng, TIMEZONES),
+            )
+            profile.utc_offset = profile.get_current_utc_offset(self.now)
+            offsets[user.pk] = profile.utc_offset
+            profiles.append(profile)
+        TelegramProfile.objects.bulk_create(profiles)
+
+        habits = []
+        for user in users:
+            for _number in range(pick(rng, HABITS_PER_USER)):
+                habits.append(self.build_habit(rng, user, offsets.get(user.pk, 0), options))
+        Habit.objects.bulk_create(habits)
+        return {"users": len(users), "profiles": len(profiles), "habits": len(habits)}
+
+    def build_habit(self, rng, user, utc_offset, options):
+        is_pleasant = rng.random() < options["pleasant_ratio"]
+        habit = Habit(
+            owner=user,
+            place=rng.choice(PLACES),
+            time=random_habit_time(rng),
+            action=rng.choice(ACTIONS),
+            is_pleasant=is_pleasant,
+            periodicity=pick(rng, PERIODICITY),
+            reward=rng.choice(REWARDS) if not is_pleasant and rng.random() < 0.4 else None,
+            execution_time=rng.choice(EXECUTION_TIME),
+            is_public=rng.random() < options["public_ratio"],
+        )
+        habit.set_schedule(now=self.now, utc_offset=utc_offset)
+        return habit
@@ -0,0 +1,37 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from habits.scheduler import ReminderScheduler, listen_for_changes
+from habits.tasks import send_habit_reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Событийный планировщик напоминаний: запускает send_habit_reminders "
+        "только в минуты, когда есть что отправлять. "
+        "Используется вместо beat при HABIT_REMINDER_SCHEDULER=event."
+    )
+
+    def handle(self, *args, **options):
+        scheduler = ReminderScheduler(dispatch=send_habit_reminders.delay)
+        stop_event = threading.Event()
+
+        if settings.HABIT_SCHEDULER_REDIS_URL:
+            listener = threading.Thread(
+                target=listen_for_changes,
+                args=(scheduler, stop_event),
+                daemon=True,
+            )
+            listener.start()
+
+        self.stdout.write("Reminder scheduler started")
+        try:
+            scheduler.run_forever(stop_event)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop_event.set()
+            scheduler.stop()
+        self.stdout.write("Reminder scheduler stopped")
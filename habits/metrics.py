@@ -0,0 +1,52 @@
+"""
+Метрики напоминаний. Считаются в воркерах Celery, поэтому живут в общем
+реестре: после задачи приращения уходят в Redis и видны на /metrics.
+"""
+from config.metrics import SHARED_REGISTRY, Counter, Histogram
+
+REMINDERS_DUE = Counter(
+    "habit_reminders_due",
+    "Привычки, попавшие в окно тика напоминаний",
+    registry=SHARED_REGISTRY,
+)
+REMINDER_TICK_DURATION = Histogram(
+    "habit_reminder_tick_duration_seconds",
+    "Длительность тика send_habit_reminders",
+    registry=SHARED_REGISTRY,
+)
+REMINDER_MESSAGES = Counter(
+    "habit_reminder_messages",
+    "Сообщения с напоминаниями, собранные из очереди (дайджест — одно сообщение)",
+    registry=SHARED_REGISTRY,
+)
+REMINDER_MESSAGES_SAVED = Counter(
+    "habit_reminder_messages_saved",
+    "Сообщения, сэкономленные склейкой напоминаний одного чата в дайджест",
+    registry=SHARED_REGISTRY,
+)
+TELEGRAM_SEND_DURATION = Histogram(
+    "telegram_send_duration_seconds",
+    "Время отправки одного сообщения в чат, включая ожидание лимитера",
+    ("outcome",),
+    registry=SHARED_REGISTRY,
+)
+TELEGRAM_SEND_FAILURES = Counter(
+    "telegram_send_failures",
+    "Неудачные отправки в Telegram по причине",
+    ("reason",),
+    registry=SHARED_REGISTRY,
+)
+
+
+def get_failure_reason(result) -> str:
+    if result.retry_after:
+        return "rate_limited"
+    if result.status_code is None:
+        return "network"
+    return f"http_{result.status_code}"
+
+
+def observe_send(result, elapsed):
+    TELEGRAM_SEND_DURATION.observe(elapsed, outcome="ok" if result.ok else "error")
+    if not result.ok:
+        TELEGRAM_SEND_FAILURES.inc(reason=get_failure_reason(result))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:02
+
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_next_reminder_at(apps, schema_editor):
+    Habit = apps.get_model("habits", "Habit")
+    now = timezone.localtime().replace(second=0, microsecond=0)
+
+    batch = []
+    habits = Habit.objects.filter(is_pleasant=False).only(
+        "id", "time", "periodicity", "last_reminder"
+    )
+    for habit in habits.iterator(chunk_size=2000):
+        if habit.last_reminder is not None:
+            day = habit.last_reminder + timedelta(days=habit.periodicity)
+        else:
+            day = now.date()
+        next_at = timezone.make_aware(datetime.combine(day, habit.time))
+        if next_at < now:
+            next_at = timezone.make_aware(datetime.combine(now.date(), habit.time))
+            if next_at < now:
+                next_at += timedelta(days=1)
+
+        habit.next_reminder_at = next_at
+        batch.append(habit)
+        if len(batch) >= 2000:
+            Habit.objects.bulk_update(batch, ["next_reminder_at"])
+            batch = []
+
+    if batch:
+        Habit.objects.bulk_update(batch, ["next_reminder_at"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='next_reminder_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Денормализовано из time/periodicity/last_reminder для выборки по индексу', null=True, verbose_name='Следующее напоминание'),
+        ),
+        migrations.RunPython(backfill_next_reminder_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:20
+
+from django.db import migrations, models
+from django.db.models.functions import ExtractHour, ExtractMinute
+
+
+def backfill_utc_minute(apps, schema_editor):
+    # Пока у всех профилей пояс UTC, минута в UTC совпадает с локальной
+    Habit = apps.get_model("habits", "Habit")
+    Habit.objects.filter(is_pleasant=False).update(
+        utc_minute=ExtractHour("time") * 60 + ExtractMinute("time")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0004_watermark'),
+        ('users', '0002_telegramprofile_timezone_telegramprofile_utc_offset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='utc_minute',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, help_text='time в поясе владельца, переведённое в UTC (0–1439)', null=True, verbose_name='Минута суток в UTC'),
+        ),
+        migrations.RunPython(backfill_utc_minute, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0006_habit_habits_owner_created_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('habit_id', models.BigIntegerField(verbose_name='id привычки')),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Удалено')),
+            ],
+            options={
+                'verbose_name': 'Удалённая привычка',
+                'verbose_name_plural': 'Удалённые привычки',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['owner', 'updated_at'], name='habits_owner_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='habitdeletion',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='habit_deletions', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='habitdeletion',
+            index=models.Index(fields=['owner', 'deleted_at'], name='habits_deletion_owner_idx'),
+        ),
+    ]
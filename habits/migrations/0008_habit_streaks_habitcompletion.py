@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0007_habitdeletion_habit_habits_owner_updated_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='best_streak',
+            field=models.PositiveIntegerField(default=0, verbose_name='Лучшая серия'),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='current_streak',
+            field=models.PositiveIntegerField(default=0, help_text='Серия на дату last_completed_on; прерывается, если пропущен период', verbose_name='Текущая серия'),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='last_completed_on',
+            field=models.DateField(blank=True, null=True, verbose_name='Последнее выполнение'),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='total_completions',
+            field=models.PositiveIntegerField(default=0, verbose_name='Всего выполнений'),
+        ),
+        migrations.CreateModel(
+            name='HabitCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_on', models.DateField(verbose_name='Дата выполнения')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Отмечено')),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='habits.habit', verbose_name='Привычка')),
+            ],
+            options={
+                'verbose_name': 'Выполнение привычки',
+                'verbose_name_plural': 'Выполнения привычек',
+                'constraints': [models.UniqueConstraint(fields=('habit', 'completed_on'), name='habits_completion_unique_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0008_habit_streaks_habitcompletion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingHabit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action_key', models.CharField(max_length=255, verbose_name='Действие (нормализованное)')),
+                ('place_key', models.CharField(max_length=255, verbose_name='Место (нормализованное)')),
+                ('action', models.CharField(max_length=255, verbose_name='Действие')),
+                ('place', models.CharField(max_length=255, verbose_name='Место')),
+                ('habits_count', models.PositiveIntegerField(default=0, verbose_name='Публичных привычек')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Популярная привычка',
+                'verbose_name_plural': 'Популярные привычки',
+            },
+        ),
+        migrations.CreateModel(
+            name='TrendingHabitMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Учтённая публичная привычка',
+                'verbose_name_plural': 'Учтённые публичные привычки',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='habit',
+            index=models.Index(fields=['updated_at'], name='habits_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trendinghabit',
+            index=models.Index(fields=['-habits_count', 'id'], name='habits_trending_count_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='trendinghabit',
+            constraint=models.UniqueConstraint(fields=('action_key', 'place_key'), name='habits_trending_unique_key'),
+        ),
+        migrations.AddField(
+            model_name='trendinghabitmember',
+            name='habit',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='trending_member', to='habits.habit', verbose_name='Привычка'),
+        ),
+        migrations.AddField(
+            model_name='trendinghabitmember',
+            name='trend',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='habits.trendinghabit', verbose_name='Популярная привычка'),
+        ),
+    ]
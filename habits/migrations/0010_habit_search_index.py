@@ -0,0 +1,113 @@
+"""
+Полнотекстовый индекс публичных привычек для ?q= (см. habits/search.py).
+
+SQLite: FTS5-таблица с внешним содержимым habits_habit; в неё попадают
+только публичные привычки, синхронность держат триггеры. Команда FTS5
+'rebuild' проиндексировала бы и личные привычки — заполнять только как ниже. PostgreSQL:
+частичный GIN-индекс по тому же выражению to_tsvector, что строит поиск.
+
+На SQLite Django пересоздаёт таблицу при AlterField привычки, и триггеры
+пропадают вместе со старой таблицей: такая миграция должна заново
+выполнить SQLITE_BACKWARD и SQLITE_FORWARD отсюда.
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q
+
+SQLITE_FORWARD = (
+    """
+    CREATE VIRTUAL TABLE habits_habit_fts USING fts5(
+        action, place,
+        content='habits_habit', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO habits_habit_fts(rowid, action, place)
+    SELECT id, action, place FROM habits_habit WHERE is_public
+    """,
+    """
+    CREATE TRIGGER habits_habit_fts_insert AFTER INSERT ON habits_habit
+    WHEN new.is_public BEGIN
+        INSERT INTO habits_habit_fts(rowid, action, place)
+        VALUES (new.id, new.action, new.place);
+    END
+    """,
+    """
+    CREATE TRIGGER habits_habit_fts_delete AFTER DELETE ON habits_habit
+    WHEN old.is_public BEGIN
+        INSERT INTO habits_habit_fts(habits_habit_fts, rowid, action, place)
+        VALUES ('delete', old.id, old.action, old.place);
+    END
+    """,
+    # Тик напоминаний и счётчики серий не трогают эти столбцы: триггер молчит.
+    # Одним триггером, чтобы старый текст гарантированно удалялся до вставки
+    """
+    CREATE TRIGGER habits_habit_fts_update
+    AFTER UPDATE OF action, place, is_public ON habits_habit BEGIN
+        INSERT INTO habits_habit_fts(habits_habit_fts, rowid, action, place)
+        SELECT 'delete', old.id, old.action, old.place WHERE old.is_public;
+        INSERT INTO habits_habit_fts(rowid, action, place)
+        SELECT new.id, new.action, new.place WHERE new.is_public;
+    END
+    """,
+)
+SQLITE_BACKWARD = (
+    "DROP TRIGGER IF EXISTS habits_habit_fts_update",
+    "DROP TRIGGER IF EXISTS habits_habit_fts_delete",
+    "DROP TRIGGER IF EXISTS habits_habit_fts_insert",
+    "DROP TABLE IF EXISTS habits_habit_fts",
+)
+
+
+def get_postgresql_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    # Выражение должно совпадать с habits.search.get_search_vector()
+    return GinIndex(
+        SearchVector("action", "place", config="russian"),
+        condition=Q(is_public=True),
+        name="habits_public_search_idx",
+    )
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for statement in SQLITE_FORWARD:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        schema_editor.add_index(apps.get_model("habits", "Habit"), get_postgresql_index())
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for statement in SQLITE_BACKWARD:
+            schema_editor.execute(statement)
+    elif vendor == "postgresql":
+        schema_editor.remove_index(apps.get_model("habits", "Habit"), get_postgresql_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0009_trending_habits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitSearchEntry',
+            fields=[
+                ('habit', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='habits.habit')),
+                ('action', models.TextField()),
+                ('place', models.TextField()),
+            ],
+            options={
+                'db_table': 'habits_habit_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
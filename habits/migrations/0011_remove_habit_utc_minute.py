@@ -0,0 +1,39 @@
+"""
+utc_minute не читал ни один запрос: тик выбирает привычки по
+next_reminder_at. Поле и его индекс только удорожали каждую запись.
+
+На SQLite удаление индексированного столбца пересоздаёт таблицу привычек,
+а с ней пропадают триггеры полнотекстового индекса, поэтому он
+пересоздаётся целиком, как велит миграция 0010.
+"""
+from importlib import import_module
+
+from django.db import migrations
+
+search_index = import_module("habits.migrations.0010_habit_search_index")
+
+
+def drop_sqlite_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        search_index.drop_search_index(apps, schema_editor)
+
+
+def create_sqlite_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        search_index.create_search_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0010_habit_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_sqlite_search_index, create_sqlite_search_index),
+        migrations.RemoveField(
+            model_name='habit',
+            name='utc_minute',
+        ),
+        migrations.RunPython(create_sqlite_search_index, drop_sqlite_search_index),
+    ]
@@ -1,5 +1,43 @@
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+
+def calculate_next_reminder_at(
+    habit_time, periodicity, last_reminder=None, now=None, utc_offset=0
+):
+    """
+    Ближайший момент напоминания не раньше текущей минуты.
+    Если последнее напоминание было, следующее — через periodicity дней.
+    habit_time и last_reminder — в поясе пользователя со смещением utc_offset
+    минут; результат в UTC.
+    """
+    tz = dt_timezone(timedelta(minutes=utc_offset))
+    now = (now or timezone.now()).astimezone(tz).replace(second=0, microsecond=0)
+    if last_reminder is not None:
+        day = last_reminder + timedelta(days=periodicity)
+    else:
+        day = now.date()
+
+    next_at = datetime.combine(day, habit_time, tzinfo=tz)
+    if next_at < now:
+        # Пропущенное время сегодня — напоминаем в ближайший подходящий день
+        next_at = datetime.combine(now.date(), habit_time, tzinfo=tz)
+        if next_at < now:
+            next_at += timedelta(days=1)
+    return next_at.astimezone(dt_timezone.utc)
+
+
+def calculate_current_streak(current_streak, last_completed_on, periodicity, today):
+    """Серия на сегодня (дата в поясе владельца): 0, если период пропущен."""
+    if last_completed_on is None:
+        return 0
+    if (today - last_completed_on).days > periodicity:
+        return 0
+    return current_streak
 
 
 class Habit(models.Model):
@@ -61,6 +99,24 @@ class Habit(models.Model):
         blank=True,
     )
 
+    next_reminder_at = models.DateTimeField(
+        "Следующее напоминание",
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="Денормализовано из time/periodicity/last_reminder для выборки по индексу",
+    )
+
+    # Счётчики по журналу HabitCompletion, обновляются при каждой отметке
+    # (habits/completions.py), чтобы статистика не агрегировала историю
+    current_streak = models.PositiveIntegerField(
+        "Текущая серия",
+        default=0,
+        help_text="Серия на дату last_completed_on; прерывается, если пропущен период",
+    )
+    best_streak = models.PositiveIntegerField("Лучшая серия", default=0)
+    total_completions = models.PositiveIntegerField("Всего выполнений", default=0)
+    last_completed_on = models.DateField("Последнее выполнение", null=True, blank=True)
     created_at = models.DateTimeField("Создано", auto_now_add=True)
     updated_at = models.DateTimeField("Обновлено", auto_now=True)
 
@@ -68,6 +124,269 @@ class Habit(models.Model):
         verbose_name = "Привычка"
         verbose_name_plural = "Привычки"
         ordering = ("-created_at",)
+        indexes = [
+            # Keyset-пагинация личного списка и публичной ленты
+            models.Index(fields=["owner", "created_at"], name="habits_owner_created_idx"),
+            models.Index(fields=["is_public", "created_at"], name="habits_public_created_idx"),
+            # max(updated_at) и выборка изменений для синхронизации
+            models.Index(fields=["owner", "updated_at"], name="habits_owner_updated_idx"),
+            # Изменения всех привычек для пересчёта популярных (trending.py)
+            models.Index(fields=["updated_at"], name="habits_updated_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.owner} — {self.action} в {self.time} ({self.place})"
+
+    def save(self, *args, **kwargs):
+        # Привычки, созданные в обход сериализатора, тоже попадают в расписание
+        if self.next_reminder_at is None and not self.is_pleasant and self.time:
+            self.set_schedule()
+        super().save(*args, **kwargs)
+
+    def get_utc_offset(self) -> int:
+        """Смещение, по которому считается расписание владельца (0 без профиля)."""
+        profile = getattr(self.owner, "telegram_profile", None)
+        return profile.utc_offset if profile is not None else 0
+
+    def get_next_reminder_at(self, now=None, utc_offset=None):
+        # Приятные привычки — награда, о них не напоминаем
+        if self.is_pleasant:
+            return None
+        if utc_offset is None:
+            utc_offset = self.get_utc_offset()
+        return calculate_next_reminder_at(
+            self.time,
+            self.periodicity,
+            last_reminder=self.last_reminder,
+            now=now,
+            utc_offset=utc_offset,
+        )
+
+    def get_current_streak(self, today) -> int:
+        return calculate_current_streak(
+            self.current_streak, self.last_completed_on, self.periodicity, today
+        )
+
+    def set_schedule(self, now=None, utc_offset=None):
+        """Пересчитывает next_reminder_at по поясу владельца."""
+        self.next_reminder_at = self.get_next_reminder_at(now, utc_offset)
+
+
+class NotificationOutbox(models.Model):
+    """
+    Очередь исходящих напоминаний. Минутный тик только вставляет строки,
+    доставку с повторами выполняет отдельная задача.
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_SENT = "sent"
+    STATUS_DEAD = "dead"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Ожидает отправки"),
+        (STATUS_SENT, "Отправлено"),
+        (STATUS_DEAD, "Не доставлено"),
+    )
+
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        related_name="notifications",
+        verbose_name="Привычка",
+    )
+    chat_id = models.CharField("Telegram chat_id", max_length=64)
+    text = models.TextField("Текст")
+    reminder_date = models.DateField("Дата напоминания")
+    dedup_key = models.CharField(
+        "Ключ идемпотентности",
+        max_length=64,
+        unique=True,
+        help_text="Одно напоминание на привычку в день",
+    )
+    status = models.CharField(
+        "Статус",
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField("Попыток отправки", default=0)
+    next_attempt_at = models.DateTimeField("Следующая попытка", default=timezone.now)
+    last_error = models.TextField("Последняя ошибка", blank=True, default="")
+    created_at = models.DateTimeField("Создано", auto_now_add=True)
+    sent_at = models.DateTimeField("Отправлено", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Уведомление в очереди"
+        verbose_name_plural = "Очередь уведомлений"
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"],
+                name="habits_outbox_due_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.dedup_key} → {self.chat_id} ({self.status})"
+
+    @staticmethod
+    def make_dedup_key(habit_id, reminder_date) -> str:
+        return f"{habit_id}:{reminder_date.isoformat()}"
+
+
+class Watermark(models.Model):
+    """
+    Отметка, до какого момента обработан поток событий (например, минутный
+    тик напоминаний). Позволяет следующему запуску продолжить с того же места.
+    """
+
+    name = models.CharField("Имя", max_length=64, unique=True)
+    value = models.DateTimeField("Обработано до")
+    updated_at = models.DateTimeField("Обновлено", auto_now=True)
+
+    class Meta:
+        verbose_name = "Отметка обработки"
+        verbose_name_plural = "Отметки обработки"
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.value}"
+
+
+class HabitDeletion(models.Model):
+    """
+    Надгробие удалённой привычки: по нему клиент, синхронизирующийся
+    через /api/habits/changes/, узнаёт, что привычку надо удалить у себя.
+    Старые записи удаляются задачей purge_habit_deletions.
+    """
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="habit_deletions",
+        verbose_name="Пользователь",
+    )
+    habit_id = models.BigIntegerField("id привычки")
+    deleted_at = models.DateTimeField("Удалено", default=timezone.now)
+
+    class Meta:
+        verbose_name = "Удалённая привычка"
+        verbose_name_plural = "Удалённые привычки"
+        indexes = [
+            models.Index(fields=["owner", "deleted_at"], name="habits_deletion_owner_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.owner}: привычка {self.habit_id} удалена {self.deleted_at}"
+
+
+class HabitCompletion(models.Model):
+    """
+    Отметка о выполнении привычки: одна на привычку в день (дата в поясе
+    владельца). Журнал только растёт; счётчики серий хранятся в Habit.
+    """
+
+    habit = models.ForeignKey(
+        Habit,
+        on_delete=models.CASCADE,
+        related_name="completions",
+        verbose_name="Привычка",
+    )
+    completed_on = models.DateField("Дата выполнения")
+    created_at = models.DateTimeField("Отмечено", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Выполнение привычки"
+        verbose_name_plural = "Выполнения привычек"
+        constraints = [
+            # Индекс ограничения нужен и для пересчёта серий по журналу
+            models.UniqueConstraint(
+                fields=["habit", "completed_on"],
+                name="habits_completion_unique_day",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"Привычка {self.habit_id} выполнена {self.completed_on}"
+
+
+class HabitSearchEntry(models.Model):
+    """
+    Строка FTS5-индекса публичных привычек (только SQLite, см. миграцию
+    0010 и habits/search.py). Таблицу ведут триггеры, Django её не создаёт
+    и не пишет в неё: модель нужна только для JOIN в поиске.
+    """
+
+    habit = models.OneToOneField(
+        Habit,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        db_constraint=False,
+        related_name="search_entry",
+    )
+    action = models.TextField()
+    place = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = "habits_habit_fts"
+
+
+class TrendingHabit(models.Model):
+    """
+    Популярная публичная привычка: сколько публичных привычек сводится
+    к одной паре действие/место после нормализации. Таблицу ведёт задача
+    refresh_trending_habits по приращениям, запросы её только читают.
+    """
+
+    action_key = models.CharField("Действие (нормализованное)", max_length=255)
+    place_key = models.CharField("Место (нормализованное)", max_length=255)
+    # Написание первой попавшейся привычки: ключи приведены к нижнему регистру
+    action = models.CharField("Действие", max_length=255)
+    place = models.CharField("Место", max_length=255)
+    habits_count = models.PositiveIntegerField("Публичных привычек", default=0)
+    updated_at = models.DateTimeField("Обновлено", auto_now=True)
+
+    class Meta:
+        verbose_name = "Популярная привычка"
+        verbose_name_plural = "Популярные привычки"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["action_key", "place_key"],
+                name="habits_trending_unique_key",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["-habits_count", "id"], name="habits_trending_count_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.action} ({self.place}): {self.habits_count}"
+
+
+class TrendingHabitMember(models.Model):
+    """
+    В какую строку TrendingHabit сейчас засчитана публичная привычка.
+    По ней приращение знает, что вычесть при правке или удалении: при
+    удалении привычки (в том числе каскадом с пользователем) habit
+    обнуляется, и следующий пересчёт вычитает такие строки.
+    """
+
+    habit = models.OneToOneField(
+        Habit,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="trending_member",
+        verbose_name="Привычка",
+    )
+    trend = models.ForeignKey(
+        TrendingHabit,
+        on_delete=models.CASCADE,
+        related_name="members",
+        verbose_name="Популярная привычка",
+    )
+
+    class Meta:
+        verbose_name = "Учтённая публичная привычка"
+        verbose_name_plural = "Учтённые публичные привычки"
 
     def __str__(self) -> str:
-        return f"{self.owner} — {self.action} в {self.time} ({self.place})"
\ No newline at end of file
+        return f"Привычка {self.habit_id} → {self.trend_id}"
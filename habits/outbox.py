@@ -0,0 +1,187 @@
+"""
+Доставка напоминаний через NotificationOutbox.
+
+Тик кладёт строки в очередь (enqueue_reminders), а deliver_outbox_batch
+забирает созревшие строки, склеивает напоминания одного чата в дайджест,
+отправляет пачкой и раскладывает результат: отправлено, повтор
+с экспоненциальной задержкой или dead-letter.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .metrics import REMINDER_MESSAGES, REMINDER_MESSAGES_SAVED
+from .models import Habit, NotificationOutbox
+from .services import send_telegram_messages
+
+# Ошибки, которые не исправятся повтором (чат не найден, бот заблокирован)
+PERMANENT_STATUS_CODES = {400, 403}
+
+# Максимальная длина текста сообщения в Bot API
+TELEGRAM_MESSAGE_LIMIT = 4096
+SINGLE_HEADER = "Напоминание о привычке:\n"
+DIGEST_HEADER = "Напоминания о привычках:\n"
+DIGEST_BULLET = "• "
+
+
+def enqueue_reminders(items):
+    """
+    Кладёт напоминания в очередь одним INSERT.
+    items — пары (habit, строка напоминания) с подгруженным owner.telegram_profile.
+    Повторная постановка той же привычки на ту же дату игнорируется.
+    """
+    now = timezone.now()
+    rows = []
+    for habit, text in items:
+        # Дата в поясе пользователя: с ней сравнивается last_reminder
+        local_at = habit.next_reminder_at + timedelta(minutes=habit.get_utc_offset())
+        reminder_date = local_at.date()
+        rows.append(
+            NotificationOutbox(
+                habit_id=habit.pk,
+                chat_id=habit.owner.telegram_profile.chat_id,
+                text=text,
+                reminder_date=reminder_date,
+                dedup_key=NotificationOutbox.make_dedup_key(habit.pk, reminder_date),
+                next_attempt_at=now,
+            )
+        )
+    NotificationOutbox.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def format_digest(rows) -> str:
+    if len(rows) == 1:
+        return SINGLE_HEADER + rows[0].text
+    return DIGEST_HEADER + "\n".join(DIGEST_BULLET + row.text for row in rows)
+
+
+def build_digests(rows):
+    """
+    Группирует строки очереди по chat_id: одно сообщение на пользователя,
+    новое начинается, только если текст превысит лимит Telegram.
+    Возвращает пары (chat_id, [rows]).
+    """
+    by_chat = {}
+    for row in rows:
+        by_chat.setdefault(row.chat_id, []).append(row)
+
+    digests = []
+    for chat_id, chat_rows in by_chat.items():
+        chunk, length = [], len(DIGEST_HEADER)
+        for row in chat_rows:
+            line_length = len(DIGEST_BULLET) + len(row.text) + 1
+            if chunk and length + line_length > TELEGRAM_MESSAGE_LIMIT:
+                digests.append((chat_id, chunk))
+                chunk, length = [], len(DIGEST_HEADER)
+            chunk.append(row)
+            length += line_length
+        digests.append((chat_id, chunk))
+    return digests
+
+
+def get_backoff(attempts):
+    base = settings.NOTIFICATION_OUTBOX_BACKOFF_BASE
+    return min(base * 2 ** max(attempts - 1, 0), settings.NOTIFICATION_OUTBOX_BACKOFF_MAX)
+
+
+def claim_outbox_batch(batch_size, now=None):
+    """
+    Забирает созревшие строки: переносит next_attempt_at на время аренды,
+    чтобы параллельный доставщик их не взял. Если воркер упадёт посреди
+    отправки, строки вернутся в работу по истечении аренды.
+    """
+    now = now or timezone.now()
+    lease_until = now + timedelta(seconds=settings.NOTIFICATION_OUTBOX_LEASE)
+    with transaction.atomic():
+        rows = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=NotificationOutbox.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "pk")[:batch_size]
+        )
+        if rows:
+            NotificationOutbox.objects.filter(
+                pk__in=[row.pk for row in rows],
+                next_attempt_at__lte=now,
+            ).update(next_attempt_at=lease_until, attempts=F("attempts") + 1)
+    for row in rows:
+        row.attempts += 1
+    return rows
+
+
+def deliver_outbox_batch(batch_size=None):
+    """Отправляет одну пачку из очереди и возвращает счётчики по исходам."""
+    batch_size = batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+    rows = claim_outbox_batch(batch_size)
+    stats = {
+        "claimed": len(rows),
+        "messages": 0,
+        "saved": 0,
+        "sent": 0,
+        "retried": 0,
+        "dead": 0,
+    }
+    if not rows:
+        return stats
+
+    digests = build_digests(rows)
+    stats["messages"] = len(digests)
+    stats["saved"] = len(rows) - len(digests)
+    REMINDER_MESSAGES.inc(stats["messages"])
+    REMINDER_MESSAGES_SAVED.inc(stats["saved"])
+    results = send_telegram_messages(
+        [(chat_id, format_digest(chat_rows)) for chat_id, chat_rows in digests]
+    )
+
+    now = timezone.now()
+    sent_ids = []
+    sent_dates = defaultdict(list)
+    updated = []
+    for (chat_id, chat_rows), result in zip(digests, results):
+        for row in chat_rows:
+            if result.ok:
+                sent_ids.append(row.pk)
+                sent_dates[row.reminder_date].append(row.habit_id)
+                continue
+
+            row.last_error = result.error[:1000]
+            if result.retry_after:
+                # Упёрлись в лимит Bot API: это не неудачная попытка, просто ждём
+                row.attempts -= 1
+                row.next_attempt_at = now + timedelta(seconds=result.retry_after)
+                stats["retried"] += 1
+            elif (
+                result.status_code in PERMANENT_STATUS_CODES
+                or row.attempts >= settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS
+            ):
+                row.status = NotificationOutbox.STATUS_DEAD
+                stats["dead"] += 1
+            else:
+                row.next_attempt_at = now + timedelta(seconds=get_backoff(row.attempts))
+                stats["retried"] += 1
+            updated.append(row)
+
+    with transaction.atomic():
+        if sent_ids:
+            NotificationOutbox.objects.filter(pk__in=sent_ids).update(
+                status=NotificationOutbox.STATUS_SENT,
+                sent_at=now,
+                last_error="",
+            )
+            # last_reminder отмечаем только после реальной доставки
+            for reminder_date, habit_ids in sent_dates.items():
+                Habit.objects.filter(
+                    Q(last_reminder__isnull=True) | Q(last_reminder__lt=reminder_date),
+                    pk__in=habit_ids,
+                ).update(last_reminder=reminder_date, updated_at=now)
+        if updated:
+            NotificationOutbox.objects.bulk_update(
+                updated, ["status", "attempts", "next_attempt_at", "last_error"]
+            )
+
+    stats["sent"] = len(sent_ids)
+    return stats
@@ -5,10 +5,11 @@ class IsOwnerHabit(BasePermission):
     """
     Доступ на изменение/удаление — только владельцу.
     Для списка/создания — стандартные IsAuthenticated.
+    Сравниваем owner_id, чтобы не загружать владельца отдельным запросом.
     """
 
     def has_object_permission(self, request, view, obj):
         if request.method in SAFE_METHODS:
             # читать можно только свои объекты через личное API
-            return obj.owner == request.user
-        return obj.owner == request.user
\ No newline at end of file
+            return obj.owner_id == request.user.pk
+        return obj.owner_id == request.user.pk
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""
+Token bucket для Telegram Bot API: общий лимит на бота и отдельный на чат.
+
+Состояние хранится в Redis (тот же, что брокер Celery), поэтому все
+воркеры делят один бюджет. Без Redis используется лимитер в памяти процесса.
+"""
+import logging
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_KEY = "telegram:ratelimit:global"
+CHAT_KEY = "telegram:ratelimit:chat:{}"
+
+
+class LocalRateLimiter:
+    """Лимитер в памяти процесса."""
+
+    def __init__(self, global_rate, chat_rate, global_burst=None, chat_burst=None):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.global_burst = global_burst or global_rate
+        self.chat_burst = chat_burst or chat_rate
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _refill(self, key, rate, burst, now):
+        tokens, updated_at, blocked_until = self._buckets.get(key, (burst, now, 0.0))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        return tokens, blocked_until
+
+    def acquire(self, chat_id) -> float:
+        """
+        Забирает по токену из общего бакета и бакета чата.
+        Возвращает 0, если отправлять можно, иначе сколько секунд подождать.
+        """
+        now = time.monotonic()
+        chat_key = CHAT_KEY.format(chat_id)
+        with self._lock:
+            g_tokens, g_blocked = self._refill(
+                GLOBAL_KEY, self.global_rate, self.global_burst, now
+            )
+            c_tokens, c_blocked = self._refill(
+                chat_key, self.chat_rate, self.chat_burst, now
+            )
+            wait = max(
+                g_blocked - now,
+                c_blocked - now,
+                (1 - g_tokens) / self.global_rate,
+                (1 - c_tokens) / self.chat_rate,
+                0.0,
+            )
+            if wait > 0:
+                return wait
+
+            self._buckets[GLOBAL_KEY] = (g_tokens - 1, now, g_blocked)
+            self._buckets[chat_key] = (c_tokens - 1, now, c_blocked)
+            return 0.0
+
+    def block(self, chat_id, seconds):
+        """Запрещает отправку в чат на seconds (ответ 429 с retry_after)."""
+        now = time.monotonic()
+        if chat_id is None:
+            key, burst = GLOBAL_KEY, self.global_burst
+        else:
+            key, burst = CHAT_KEY.format(chat_id), self.chat_burst
+        with self._lock:
+            tokens, updated_at, blocked_until = self._buckets.get(key, (burst, now, 0.0))
+            self._buckets[key] = (tokens, updated_at, max(blocked_until, now + seconds))
+
+
+# Срок жизни ключа только продлевается: иначе короткий EXPIRE обрезал бы
+# TTL ключа, в котором лежит более длинная пауза retry_after
+EXTEND_TTL = """
+local function extend_ttl(key, seconds)
+    if redis.call('TTL', key) < seconds then
+        redis.call('EXPIRE', key, seconds)
+    end
+end
+"""
+
+# KEYS: общий бакет, бакет чата. ARGV: rate/burst общего и чата.
+# Время берём у Redis, чтобы часы воркеров не влияли на расчёт.
+ACQUIRE_SCRIPT = EXTEND_TTL + """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+
+local function refill(key, rate, burst)
+    local data = redis.call('HMGET', key, 'tokens', 'ts', 'blocked_until')
+    local tokens = tonumber(data[1]) or burst
+    local ts = tonumber(data[2]) or now
+    local blocked_until = tonumber(data[3]) or 0
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    return tokens, blocked_until
+end
+
+local g_rate, g_burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local c_rate, c_burst = tonumber(ARGV[3]), tonumber(ARGV[4])
+local g_tokens, g_blocked = refill(KEYS[1], g_rate, g_burst)
+local c_tokens, c_blocked = refill(KEYS[2], c_rate, c_burst)
+
+local wait = math.max(g_blocked - now, c_blocked - now, 0)
+if g_tokens < 1 then wait = math.max(wait, (1 - g_tokens) / g_rate) end
+if c_tokens < 1 then wait = math.max(wait, (1 - c_tokens) / c_rate) end
+if wait > 0 then
+    return tostring(wait)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', g_tokens - 1, 'ts', now)
+redis.call('HSET', KEYS[2], 'tokens', c_tokens - 1, 'ts', now)
+extend_ttl(KEYS[1], 60)
+extend_ttl(KEYS[2], 60)
+return '0'
+"""
+
+BLOCK_SCRIPT = EXTEND_TTL + """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local blocked_until = now + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+if blocked_until > current then
+    redis.call('HSET', KEYS[1], 'blocked_until', blocked_until)
+end
+extend_ttl(KEYS[1], math.ceil(tonumber(ARGV[1])) + 60)
+return 1
+"""
+
+
+class RedisRateLimiter:
+    """
+    Лимитер с общим для всех процессов состоянием в Redis.
+    Если Redis недоступен, временно работает локальный лимитер.
+    """
+
+    def __init__(self, url, global_rate, chat_rate, global_burst=None, chat_burst=None):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.global_burst = global_burst or global_rate
+        self.chat_burst = chat_burst or chat_rate
+        self.client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self._acquire = self.client.register_script(ACQUIRE_SCRIPT)
+        self._block = self.client.register_script(BLOCK_SCRIPT)
+        self.fallback = LocalRateLimiter(
+            global_rate, chat_rate, self.global_burst, self.chat_burst
+        )
+
+    def acquire(self, chat_id) -> float:
+        try:
+            wait = self._acquire(
+                keys=[GLOBAL_KEY, CHAT_KEY.format(chat_id)],
+                args=[self.global_rate, self.global_burst, self.chat_rate, self.chat_burst],
+            )
+        except redis.RedisError as exc:
+            logger.warning("Redis rate limiter unavailable, using local: %s", exc)
+            return self.fallback.acquire(chat_id)
+        return float(wait)
+
+    def block(self, chat_id, seconds):
+        key = CHAT_KEY.format(chat_id) if chat_id is not None else GLOBAL_KEY
+        try:
+            self._block(keys=[key], args=[seconds])
+        except redis.RedisError as exc:
+            logger.warning("Redis rate limiter unavailable, using local: %s", exc)
+        self.fallback.block(chat_id, seconds)
+
+
+def build_rate_limiter():
+    global_rate = settings.TELEGRAM_RATE_LIMIT_GLOBAL
+    chat_rate = settings.TELEGRAM_RATE_LIMIT_PER_CHAT
+    url = settings.TELEGRAM_RATE_LIMIT_REDIS_URL
+    if url and url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisRateLimiter(url, global_rate, chat_rate)
+    return LocalRateLimiter(global_rate, chat_rate)
@@ -0,0 +1,206 @@
+"""
+Событийный планировщик напоминаний.
+
+Вместо тика каждые 60 секунд держит min-heap ближайших минут, в которые
+у кого-то есть напоминание, спит до первой из них и только тогда запускает
+send_habit_reminders. Изменения привычек будят планировщик: в своём
+процессе напрямую, в остальных — через Redis pub/sub.
+"""
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import redis
+from django.conf import settings
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+
+from .models import Habit
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "habits:scheduler:invalidate"
+RELOAD = "reload"
+
+_local_schedulers = set()
+_local_lock = threading.Lock()
+_publisher = None
+
+
+class ReminderScheduler:
+    """
+    Куча ближайших непустых минут на горизонт HABIT_SCHEDULER_HORIZON.
+    Горизонт меньше суток: привычки, сдвинутые тиком на periodicity дней,
+    всегда оказываются за ним и подхватываются следующей загрузкой.
+    """
+
+    def __init__(self, dispatch, horizon=None, reload_interval=None, limit=None):
+        self.dispatch = dispatch
+        self.horizon = timedelta(minutes=horizon or settings.HABIT_SCHEDULER_HORIZON)
+        if self.horizon >= timedelta(days=1):
+            raise ValueError("Горизонт планировщика должен быть меньше суток")
+        self.reload_interval = reload_interval or settings.HABIT_SCHEDULER_RELOAD_INTERVAL
+        self.limit = limit or settings.HABIT_SCHEDULER_HEAP_LIMIT
+        self.heap = []
+        self.loaded_until = None
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._reload_requested = True
+
+    def load(self, now=None):
+        """Одним запросом по индексу next_reminder_at берёт ближайшие минуты."""
+        now = now or timezone.now()
+        start = now.replace(second=0, microsecond=0)
+        horizon_end = start + self.horizon
+        minutes = list(
+            Habit.objects.filter(
+                next_reminder_at__gte=start,
+                next_reminder_at__lt=horizon_end,
+            )
+            .annotate(minute=TruncMinute("next_reminder_at"))
+            .order_by("minute")
+            .values_list("minute", flat=True)
+            .distinct()[:self.limit]
+        )
+        with self._lock:
+            self.heap = minutes
+            heapq.heapify(self.heap)
+            # Если упёрлись в limit, дальше последней минуты кучи ничего не знаем
+            self.loaded_until = (
+                minutes[-1] if len(minutes) >= self.limit else horizon_end
+            )
+            self.loaded_at = now
+            self._reload_requested = False
+        return len(minutes)
+
+    def notify(self, minute=None):
+        """
+        Привычка изменилась. Если известна её новая минута и она внутри
+        загруженного горизонта — кладём в кучу, иначе просим перезагрузку.
+        """
+        with self._lock:
+            if minute is None:
+                self._reload_requested = True
+            elif self.loaded_until is not None and minute < self.loaded_until:
+                heapq.heappush(self.heap, minute.replace(second=0, microsecond=0))
+        self._wakeup.set()
+
+    def next_wakeup(self):
+        with self._lock:
+            return self.heap[0] if self.heap else None
+
+    def needs_reload(self, now):
+        return (
+            self._reload_requested
+            or self.loaded_at is None
+            or now >= self.loaded_until
+            or now - self.loaded_at >= timedelta(seconds=self.reload_interval)
+        )
+
+    def run_pending(self, now=None):
+        """Снимает с кучи наступившие минуты и запускает один тик на все."""
+        now = now or timezone.now()
+        due = []
+        with self._lock:
+            while self.heap and self.heap[0] <= now:
+                due.append(heapq.heappop(self.heap))
+        if due:
+            # Тик сам обрабатывает окно от своей отметки, одного вызова хватает
+            self.dispatch()
+        return len(due)
+
+    def seconds_until_next(self, now):
+        candidates = [self.loaded_at + timedelta(seconds=self.reload_interval)]
+        candidates.append(self.loaded_until)
+        next_minute = self.next_wakeup()
+        if next_minute is not None:
+            candidates.append(next_minute)
+        return max((min(candidates) - now).total_seconds(), 0)
+
+    def run_forever(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        register_local_scheduler(self)
+        try:
+            while not stop_event.is_set():
+                now = timezone.now()
+                if self.needs_reload(now):
+                    count = self.load(now)
+                    logger.debug("Reminder scheduler loaded %s minutes", count)
+                self.run_pending(now)
+                self._wakeup.wait(self.seconds_until_next(timezone.now()))
+                self._wakeup.clear()
+        finally:
+            unregister_local_scheduler(self)
+
+    def stop(self):
+        self._wakeup.set()
+
+
+def register_local_scheduler(scheduler):
+    with _local_lock:
+        _local_schedulers.add(scheduler)
+
+
+def unregister_local_scheduler(scheduler):
+    with _local_lock:
+        _local_schedulers.discard(scheduler)
+
+
+def get_publisher():
+    global _publisher
+    url = settings.HABIT_SCHEDULER_REDIS_URL
+    if _publisher is None and url:
+        _publisher = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _publisher
+
+
+def publish_schedule_change(next_reminder_at, reload=False):
+    """
+    Сообщает планировщикам, что у привычки поменялось время напоминания.
+    reload=True просит перечитать кучу (привычку удалили). Если время за
+    горизонтом, никого не будим: его подхватит плановая перезагрузка.
+    """
+    horizon_end = timezone.now() + timedelta(minutes=settings.HABIT_SCHEDULER_HORIZON)
+    if next_reminder_at is None or next_reminder_at >= horizon_end:
+        return
+    if reload:
+        next_reminder_at = None
+
+    with _local_lock:
+        schedulers = list(_local_schedulers)
+    for scheduler in schedulers:
+        scheduler.notify(next_reminder_at)
+
+    if settings.HABIT_REMINDER_SCHEDULER != "event":
+        return
+    publisher = get_publisher()
+    if publisher is None:
+        return
+    message = next_reminder_at.isoformat() if next_reminder_at else RELOAD
+    try:
+        publisher.publish(INVALIDATION_CHANNEL, message)
+    except redis.RedisError as exc:
+        # Планировщик всё равно перечитает расписание по reload_interval
+        logger.warning("Could not publish reminder schedule change: %s", exc)
+
+
+def listen_for_changes(scheduler, stop_event):
+    """Поток, пересылающий события из Redis в планировщик этого процесса."""
+    client = redis.Redis.from_url(settings.HABIT_SCHEDULER_REDIS_URL)
+    while not stop_event.is_set():
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # После переподключения события могли потеряться
+            scheduler.notify()
+            while not stop_event.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                data = message["data"].decode()
+                scheduler.notify(None if data == RELOAD else datetime.fromisoformat(data))
+        except redis.RedisError as exc:
+            logger.warning("Reminder scheduler lost Redis subscription: %s", exc)
+            stop_event.wait(5)
@@ -0,0 +1,74 @@
+"""
+Полнотекстовый поиск по публичным привычкам (?q= в /api/public-habits/).
+
+SQLite: FTS5-таблица habits_habit_fts (модель HabitSearchEntry) с внешним
+содержимым, её ведут триггеры (миграция 0010), ранжирование — bm25(). PostgreSQL: частичный
+GIN-индекс по to_tsvector(action, place), ранжирование — ts_rank.
+search_rank в обоих случаях «меньше — лучше», поэтому keyset-пагинация
+одна: по (search_rank, -id).
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Value
+from django.db.models.expressions import RawSQL
+
+
+# Должно совпадать с конфигурацией индекса в миграции 0010
+SEARCH_CONFIG = "russian"
+FTS_TABLE = "habits_habit_fts"
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 8
+WORD_RE = re.compile(r"\w+")
+
+
+def get_search_terms(query):
+    """
+    Слова запроса без синтаксиса FTS5/tsquery: кавычки, операторы и скобки
+    из пользовательского ввода не попадают в MATCH и не ломают запрос.
+    """
+    return WORD_RE.findall(query.casefold())[:MAX_TERMS]
+
+
+def get_search_vector():
+    return SearchVector("action", "place", config=SEARCH_CONFIG)
+
+
+def search_sqlite(queryset, terms):
+    # Каждое слово — префикс: «вод» находит «воду»; слова через пробел — И.
+    # JOIN с FTS5-таблицей: MATCH выбирает строки по индексу, bm25 считается
+    # один раз на совпадение (коррелированный подзапрос повторял бы MATCH)
+    match = " ".join(f'"{term}"*' for term in terms)
+    return (
+        queryset.filter(search_entry__isnull=False)
+        .filter(RawSQL(f"{FTS_TABLE} MATCH %s", (match,), output_field=BooleanField()))
+        # Совпадение в действии весит вдвое больше, чем в месте
+        .annotate(
+            search_rank=RawSQL(f"bm25({FTS_TABLE}, 2.0, 1.0)", (), output_field=FloatField())
+        )
+    )
+
+
+def search_postgresql(queryset, terms):
+    query = SearchQuery(
+        " & ".join(f"{term}:*" for term in terms),
+        config=SEARCH_CONFIG,
+        search_type="raw",
+    )
+    vector = get_search_vector()
+    return (
+        queryset.annotate(search_vector=vector)
+        .filter(search_vector=query)
+        .annotate(search_rank=SearchRank(vector, query) * Value(-1.0))
+    )
+
+
+def search_habits(queryset, query):
+    """Привычки queryset, подходящие под query, с аннотацией search_rank."""
+    terms = get_search_terms(query)
+    if not terms:
+        return queryset.none().annotate(search_rank=Value(0.0))
+    if connections[queryset.db].vendor == "postgresql":
+        return search_postgresql(queryset, terms)
+    return search_sqlite(queryset, terms)
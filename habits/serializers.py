@@ -1,16 +1,89 @@
 from datetime import timedelta
+from functools import lru_cache
 
+from django.conf import settings
 from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Habit
+from config.metrics import measure_serialization
 
+from .models import Habit, TrendingHabit, calculate_current_streak
+
+
+class TimedDataMixin:
+    """Время построения .data идёт в метрику сериализации запроса."""
+
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
+
+
+class HabitSerializer(TimedDataMixin, serializers.ModelSerializer):
+    # Хранимая серия — на дату last_completed_on; отдаём серию на сегодня,
+    # как в /stats/, иначе прерванная серия висела бы до следующей отметки
+    current_streak = serializers.SerializerMethodField()
+
+    # Вычисляемые поля: столбцы, из которых они считаются, и расчёт по строке
+    # .values() для HabitRowSerializer
+    computed_fields = {
+        "current_streak": (
+            ("current_streak", "last_completed_on", "periodicity"),
+            lambda row, today: calculate_current_streak(
+                row["current_streak"], row["last_completed_on"], row["periodicity"], today
+            ),
+        ),
+    }
 
-class HabitSerializer(serializers.ModelSerializer):
     class Meta:
         model = Habit
-        fields = "__all__"
-        read_only_fields = ("owner", "last_reminder", "created_at", "updated_at")
+        fields = (
+            "id",
+            "place",
+            "time",
+            "action",
+            "is_pleasant",
+            "periodicity",
+            "reward",
+            "execution_time",
+            "is_public",
+            "last_reminder",
+            "next_reminder_at",
+            "current_streak",
+            "best_streak",
+            "total_completions",
+            "last_completed_on",
+            "created_at",
+            "updated_at",
+            "owner",
+            "related_habit",
+        )
+        list_serializer_class = TimedListSerializer
+        read_only_fields = (
+            "owner",
+            "last_reminder",
+            "next_reminder_at",
+            "best_streak",
+            "total_completions",
+            "last_completed_on",
+            "created_at",
+            "updated_at",
+        )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # ?fields= / ?exclude=: представление только с запрошенными полями
+        fields = self.context.get("fields")
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def get_current_streak(self, habit):
+        return habit.get_current_streak(self.context.get("today") or timezone.localdate())
 
     def validate(self, attrs):
         is_pleasant = attrs.get(
@@ -65,6 +138,182 @@ class HabitSerializer(serializers.ModelSerializer):
 
         return attrs
 
+    def set_next_reminder_at(self, validated_data, instance=None):
+        """Пересчитываем денормализованное расписание в поясе владельца."""
+        draft = Habit(
+            owner=getattr(instance, "owner", None) or validated_data["owner"],
+            time=validated_data.get("time", getattr(instance, "time", None)),
+            periodicity=validated_data.get(
+                "periodicity",
+                getattr(instance, "periodicity", 1),
+            ),
+            is_pleasant=validated_data.get(
+                "is_pleasant",
+                getattr(instance, "is_pleasant", False),
+            ),
+            last_reminder=getattr(instance, "last_reminder", None),
+        )
+        # Пакетная синхронизация передаёт смещение владельца один раз на запрос
+        draft.set_schedule(utc_offset=self.context.get("utc_offset"))
+        validated_data["next_reminder_at"] = draft.next_reminder_at
+        return validated_data
+
     def create(self, validated_data):
         validated_data["owner"] = self.context["request"].user
-        return super().create(validated_data)
\ No newline at end of file
+        self.set_next_reminder_at(validated_data)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        self.set_next_reminder_at(validated_data, instance)
+        return super().update(instance, validated_data)
+
+
+class PublicHabitSerializer(HabitSerializer):
+    """
+    Привычка в публичной ленте: без расписания напоминаний (по нему видно
+    смещение пояса владельца) и без личной статистики выполнения.
+    """
+
+    class Meta(HabitSerializer.Meta):
+        fields = tuple(
+            name
+            for name in HabitSerializer.Meta.fields
+            if name
+            not in (
+                "last_reminder",
+                "next_reminder_at",
+                "current_streak",
+                "best_streak",
+                "total_completions",
+                "last_completed_on",
+            )
+        )
+
+
+class PrefetchedHabitField(serializers.PrimaryKeyRelatedField):
+    """
+    related_habit из заранее выбранных привычек владельца (context["habits"]),
+    без запроса на каждый элемент пакета.
+    """
+
+    def to_internal_value(self, data):
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        habit = self.context["habits"].get(pk)
+        if habit is None:
+            self.fail("does_not_exist", pk_value=data)
+        return habit
+
+
+class BulkHabitSerializer(HabitSerializer):
+    """Элемент пакетной синхронизации: те же правила, что у HabitSerializer."""
+
+    related_habit = PrefetchedHabitField(
+        queryset=Habit.objects.none(),
+        required=False,
+        allow_null=True,
+    )
+
+
+class HabitCompletionSerializer(serializers.Serializer):
+    """
+    Отметка о выполнении. context: "habits" — привычки владельца по id,
+    "today" — сегодняшняя дата в поясе владельца.
+    """
+
+    habit = PrefetchedHabitField(queryset=Habit.objects.none())
+    completed_on = serializers.DateField(required=False)
+
+    def validate_completed_on(self, value):
+        today = self.context["today"]
+        if value > today:
+            raise serializers.ValidationError("Нельзя отметить выполнение в будущем.")
+        backfill_days = settings.HABIT_COMPLETION_BACKFILL_DAYS
+        if value < today - timedelta(days=backfill_days):
+            raise serializers.ValidationError(
+                f"Отметить выполнение можно не раньше, чем за {backfill_days} дней."
+            )
+        return value
+
+    def validate(self, attrs):
+        attrs.setdefault("completed_on", self.context["today"])
+        return attrs
+
+
+class TrendingHabitSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TrendingHabit
+        fields = ("action", "place", "habits_count")
+
+
+# Поля, значение которых из .values() уже совпадает с представлением DRF
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+
+def get_source_columns(serializer_class, fields):
+    """Столбцы модели для полей: у вычисляемых — те, из которых они считаются."""
+    computed = getattr(serializer_class, "computed_fields", {})
+    return list(
+        dict.fromkeys(
+            column
+            for name in fields
+            for column in (computed[name][0] if name in computed else (name,))
+        )
+    )
+
+
+class HabitRowSerializer:
+    """
+    Представление привычки для чтения прямо из строк .values(): без создания
+    моделей и обхода полей DRF. Порядок и формат полей берутся у
+    serializer_class, поэтому JSON совпадает с ним байт в байт.
+    """
+
+    def __init__(self, fields=None, serializer_class=HabitSerializer):
+        serializer_fields = serializer_class().fields
+        computed = getattr(serializer_class, "computed_fields", {})
+        self.fields = [
+            name for name in serializer_fields if fields is None or name in fields
+        ]
+        # Что выбирать в .values(): поля и исходные столбцы вычисляемых
+        self.columns = get_source_columns(serializer_class, self.fields)
+        # (имя, преобразование, считается ли поле по всей строке)
+        self.converters = [
+            (name, computed[name][1], True)
+            if name in computed
+            else (
+                name,
+                None
+                if isinstance(serializer_fields[name], PASSTHROUGH_FIELDS)
+                else serializer_fields[name].to_representation,
+                False,
+            )
+            for name in self.fields
+        ]
+
+    def to_representation(self, row, today):
+        data = {}
+        for name, convert, from_row in self.converters:
+            if from_row:
+                data[name] = convert(row, today)
+                continue
+            value = row[name]
+            data[name] = value if convert is None or value is None else convert(value)
+        return data
+
+    def represent(self, rows, today=None):
+        today = today or timezone.localdate()
+        return [self.to_representation(row, today) for row in rows]
+
+
+@lru_cache(maxsize=64)
+def get_row_serializer(fields=None, serializer_class=HabitSerializer):
+    """HabitRowSerializer на набор полей (кортеж или None), общий на процесс."""
+    return HabitRowSerializer(fields, serializer_class)
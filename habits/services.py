@@ -1,15 +1,174 @@
-import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import observe_send
+from .ratelimit import build_rate_limiter
+
+
+@dataclass
+class SendResult:
+    """Результат отправки одного сообщения в Telegram."""
+
+    chat_id: str
+    ok: bool
+    status_code: Optional[int] = None
+    error: str = ""
+    # Через сколько секунд повторить, если упёрлись в лимит (429 или свой лимитер)
+    retry_after: Optional[float] = None
+
+
+class TelegramClient:
+    """
+    Клиент Bot API с keep-alive пулом соединений.
+    Токен читается один раз, пачки сообщений отправляются параллельно
+    через ограниченный пул потоков. Если задан limiter, короткие ожидания
+    токена выжидаются на месте, а длинные возвращаются как retry_after.
+    """
+
+    def __init__(
+        self,
+        token,
+        api_url,
+        timeout=10,
+        max_workers=8,
+        limiter=None,
+        max_rate_limit_wait=1.0,
+    ):
+        self.base_url = f"{api_url.rstrip('/')}/bot{token}"
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.limiter = limiter
+        self.max_rate_limit_wait = max_rate_limit_wait
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="telegram",
+        )
+
+    def wait_for_token(self, chat_id) -> float:
+        """Ждёт токен не дольше max_rate_limit_wait; возвращает остаток ожидания."""
+        deadline = time.monotonic() + self.max_rate_limit_wait
+        wait = self.limiter.acquire(chat_id)
+        while wait > 0 and time.monotonic() + wait <= deadline:
+            time.sleep(wait)
+            wait = self.limiter.acquire(chat_id)
+        return wait
+
+    def send_message(self, chat_id: str, text: str) -> SendResult:
+        started = time.perf_counter()
+        result = self._send_message(chat_id, text)
+        observe_send(result, time.perf_counter() - started)
+        return result
+
+    def _send_message(self, chat_id: str, text: str) -> SendResult:
+        if self.limiter is not None:
+            wait = self.wait_for_token(chat_id)
+            if wait > 0:
+                return SendResult(
+                    chat_id=chat_id,
+                    ok=False,
+                    error="rate limited",
+                    retry_after=wait,
+                )
+
+        payload = {"chat_id": chat_id, "text": text}
+        try:
+            response = self.session.post(
+                f"{self.base_url}/sendMessage",
+                data=payload,
+                timeout=self.timeout,
+            )
+        except requests.RequestException as exc:
+            return SendResult(chat_id=chat_id, ok=False, error=str(exc))
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.ok and body.get("ok"):
+            return SendResult(chat_id=chat_id, ok=True, status_code=response.status_code)
+        if response.status_code == 429:
+            # Bot API сообщает, сколько ждать: не теряем сообщение, а откладываем
+            retry_after = (body.get("parameters") or {}).get("retry_after", 1)
+            if self.limiter is not None:
+                self.limiter.block(chat_id, retry_after)
+            return SendResult(
+                chat_id=chat_id,
+                ok=False,
+                status_code=429,
+                error=body.get("description", "Too Many Requests"),
+                retry_after=retry_after,
+            )
+        return SendResult(
+            chat_id=chat_id,
+            ok=False,
+            status_code=response.status_code,
+            error=body.get("description") or response.reason or "",
+        )
+
+    def send_messages(self, messages: Iterable[tuple]) -> list:
+        """Отправляет пары (chat_id, text) параллельно; порядок результатов совпадает."""
+        messages = list(messages)
+        if len(messages) <= 1:
+            return [self.send_message(chat_id, text) for chat_id, text in messages]
+        return list(
+            self._executor.map(lambda message: self.send_message(*message), messages)
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_telegram_client() -> Optional[TelegramClient]:
+    """Общий на процесс клиент; None, если токен бота не настроен."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None and settings.TELEGRAM_BOT_TOKEN:
+                _client = TelegramClient(
+                    token=settings.TELEGRAM_BOT_TOKEN,
+                    api_url=settings.TELEGRAM_API_URL,
+                    timeout=settings.TELEGRAM_TIMEOUT,
+                    max_workers=settings.TELEGRAM_MAX_WORKERS,
+                    limiter=build_rate_limiter(),
+                )
+    return _client
+
+
+def reset_telegram_client():
+    """Закрывает общий клиент: следующий вызов создаст его по текущим настройкам."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
 
+def send_telegram_messages(messages: Iterable[tuple]) -> list:
+    client = get_telegram_client()
+    if client is None:
+        return [
+            SendResult(chat_id=chat_id, ok=False, error="TELEGRAM_BOT_TOKEN is not set")
+            for chat_id, _text in messages
+        ]
+    return client.send_messages(messages)
 
-def send_telegram_message(chat_id: str, text: str) -> None:
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not token:
-        return
 
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text}
-    try:
-        requests.post(url, data=payload, timeout=10)
-    except requests.RequestException:
-        pass
\ No newline at end of file
+def send_telegram_message(chat_id: str, text: str) -> SendResult:
+    return send_telegram_messages([(chat_id, text)])[0]
@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_public_feed_version
+from .models import Habit, HabitDeletion
+from .scheduler import publish_schedule_change
+
+
+# Пакетное удаление само пишет надгробия и будит планировщик один раз
+_bulk_deletion = ContextVar("habits_bulk_deletion", default=False)
+
+
+@contextmanager
+def bulk_deletion():
+    """Внутри блока post_delete привычки ничего не делает: всё на вызывающем."""
+    token = _bulk_deletion.set(True)
+    try:
+        yield
+    finally:
+        _bulk_deletion.reset(token)
+
+
+def is_habit_deletion(origin):
+    """Удаляют саму привычку или набор привычек, а не их владельца каскадом."""
+    return isinstance(origin, Habit) or (
+        isinstance(origin, QuerySet) and origin.model is Habit
+    )
+
+
+def touch_related(habit_ids, now):
+    """
+    Двигает updated_at у привычек, ссылающихся на удаляемые: SET_NULL
+    обнуляет related_habit без updated_at, и /habits/changes/ их не вернул бы.
+    """
+    return (
+        Habit.objects.filter(related_habit__in=habit_ids)
+        .exclude(pk__in=habit_ids)
+        .update(updated_at=now)
+    )
+
+
+def affects_public_feed(instance):
+    """
+    Была ли привычка публичной при загрузке или стала ли сейчас.
+    Читаем __dict__, чтобы не догружать отложенное (.only) поле запросом;
+    неизвестное значение считаем публичным.
+    """
+    loaded = getattr(instance, "_public_on_load", None)
+    current = instance.__dict__.get("is_public")
+    return loaded is not False or current is not False
+
+
+@receiver(post_init, sender=Habit)
+def habit_loaded(sender, instance, **kwargs):
+    instance._public_on_load = instance.__dict__.get("is_public")
+
+
+@receiver(post_save, sender=Habit)
+def habit_saved(sender, instance, created, **kwargs):
+    next_reminder_at = instance.next_reminder_at
+    transaction.on_commit(lambda: publish_schedule_change(next_reminder_at))
+    if created:
+        instance._public_on_load = False
+    if affects_public_feed(instance):
+        transaction.on_commit(bump_public_feed_version)
+    instance._public_on_load = instance.__dict__.get("is_public")
+
+
+@receiver(pre_delete, sender=Habit)
+def habit_deleting(sender, instance, **kwargs):
+    # Удаление идёт в транзакции коллектора, SET_NULL выполнится после
+    if _bulk_deletion.get() or not is_habit_deletion(kwargs.get("origin")):
+        return
+    touch_related([instance.pk], timezone.now())
+
+
+@receiver(post_delete, sender=Habit)
+def habit_deleted(sender, instance, **kwargs):
+    if _bulk_deletion.get():
+        return
+    next_reminder_at = instance.next_reminder_at
+    transaction.on_commit(lambda: publish_schedule_change(next_reminder_at, reload=True))
+    if affects_public_feed(instance):
+        transaction.on_commit(bump_public_feed_version)
+    # Надгробие для дельта-синхронизации. При удалении самого пользователя
+    # не пишем: его надгробия удаляются тем же каскадом
+    if is_habit_deletion(kwargs.get("origin")):
+        HabitDeletion.objects.create(owner_id=instance.owner_id, habit_id=instance.pk)
@@ -1,44 +1,329 @@
-from datetime import timedelta
+import logging
+import time
+from datetime import datetime, timedelta
 
-from celery import shared_task
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, When
 from django.utils import timezone
 
-from .models import Habit
-from .services import send_telegram_message
+from users.models import TelegramProfile
+
+from .metrics import REMINDER_TICK_DURATION, REMINDERS_DUE
+from .models import (
+    Habit,
+    HabitDeletion,
+    NotificationOutbox,
+    Watermark,
+    calculate_next_reminder_at,
+)
+from .outbox import deliver_outbox_batch, enqueue_reminders
+from .scheduler import publish_schedule_change
+from .trending import refresh_trending
+
+logger = logging.getLogger(__name__)
+
+REMINDER_WATERMARK = "habit-reminders"
+
+
+def build_reminder_line(habit) -> str:
+    return f"{habit.action} в {habit.time.strftime('%H:%M')} в месте: {habit.place}"
+
+
+def advance_next_reminder_at():
+    """
+    Сдвигает next_reminder_at на periodicity дней прямо в UPDATE,
+    чтобы пачку привычек с разной периодичностью обновить одним запросом.
+    """
+    return Case(
+        *[
+            When(periodicity=days, then=F("next_reminder_at") + timedelta(days=days))
+            for days in range(1, 8)
+        ],
+        default=F("next_reminder_at") + timedelta(days=1),
+    )
+
+
+def reschedule_missed_reminders(window_start):
+    """
+    Привычки, чьё время раньше окна тика (простой дольше допустимого
+    lookback), переносим на ближайший день без отправки.
+    """
+    missed = list(
+        Habit.objects.filter(next_reminder_at__lt=window_start)
+        .order_by()
+        .select_related("owner__telegram_profile")
+        .only(
+            "id",
+            "time",
+            "periodicity",
+            "last_reminder",
+            "next_reminder_at",
+            "owner__id",
+            "owner__telegram_profile__utc_offset",
+        )
+    )
+    now = timezone.now()
+    for habit in missed:
+        habit.updated_at = now
+        habit.next_reminder_at = calculate_next_reminder_at(
+            habit.time,
+            habit.periodicity,
+            last_reminder=habit.last_reminder,
+            now=window_start,
+            utc_offset=habit.get_utc_offset(),
+        )
+    if missed:
+        Habit.objects.bulk_update(missed, ["next_reminder_at", "updated_at"])
+    return len(missed)
+
+
+def claim_due_habits(habit_ids, window_start, window_end):
+    """
+    Атомарно забирает привычки шарда: строки, которые уже забрал другой
+    воркер (или предыдущая попытка этого шарда), пропускаются.
+    """
+    with transaction.atomic():
+        habits = list(
+            Habit.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(
+                pk__in=habit_ids,
+                next_reminder_at__gte=window_start,
+                next_reminder_at__lt=window_end,
+            )
+            .order_by("pk")
+            .select_related("owner__telegram_profile")
+            .only(
+                "id",
+                "action",
+                "place",
+                "time",
+                "periodicity",
+                "next_reminder_at",
+                "owner__id",
+                "owner__telegram_profile__chat_id",
+                "owner__telegram_profile__utc_offset",
+            )
+        )
+        if habits:
+            # Условие по next_reminder_at повторяем в UPDATE: на СУБД без
+            # SELECT ... FOR UPDATE второй воркер не сдвинет строку дважды
+            # updated_at тоже сдвигаем: по нему клиенты узнают об изменениях
+            Habit.objects.filter(
+                pk__in=[habit.pk for habit in habits],
+                next_reminder_at__gte=window_start,
+                next_reminder_at__lt=window_end,
+            ).update(
+                next_reminder_at=advance_next_reminder_at(),
+                updated_at=timezone.now(),
+            )
+            # В той же транзакции кладём напоминания в очередь: либо привычка
+            # сдвинута и напоминание ждёт доставки, либо ни то, ни другое
+            enqueue_reminders((habit, build_reminder_line(habit)) for habit in habits)
+    return habits
+
+
+def get_reminder_window(now):
+    """
+    Окно тика: от отметки прошлого запуска до конца текущей минуты, но не
+    глубже HABIT_REMINDER_MAX_LOOKBACK. Если тик опоздал или воркер
+    перезапускался, пропущенные минуты попадают в окно следующего тика.
+    Вызывать внутри транзакции: строка отметки блокируется до её сдвига.
+    """
+    window_end = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    lookback_start = window_end - timedelta(minutes=settings.HABIT_REMINDER_MAX_LOOKBACK)
+
+    watermark = (
+        Watermark.objects.select_for_update()
+        .filter(name=REMINDER_WATERMARK)
+        .values_list("value", flat=True)
+        .first()
+    )
+    if watermark is None:
+        window_start = window_end - timedelta(minutes=1)
+    else:
+        window_start = min(max(watermark, lookback_start), window_end)
+        # В режиме event тики идут только в минуты с напоминаниями, и старая
+        # отметка после тихого периода — норма, а не отставание
+        lagged = watermark < lookback_start and settings.HABIT_REMINDER_SCHEDULER != "event"
+        if lagged:
+            logger.warning(
+                "Habit reminders lagged since %s, only the last %s minutes are caught up",
+                watermark,
+                settings.HABIT_REMINDER_MAX_LOOKBACK,
+            )
+    return window_start, window_end
+
+
+def apply_utc_offset_changes(now=None):
+    """
+    Сверяет сохранённые смещения профилей с их часовыми поясами и, если пояс
+    перешёл на летнее/зимнее время (или пользователь сменил пояс), сдвигает
+    next_reminder_at всех его привычек одним UPDATE на пару
+    (пояс, старое смещение). Поясов у пользователей немного, поэтому это
+    десяток запросов, а не пересчёт каждой привычки в Python.
+    """
+    now = now or timezone.now()
+    changed = 0
+    pairs = TelegramProfile.objects.values_list("timezone", "utc_offset").distinct()
+    for tz, stored_offset in list(pairs):
+        profiles = TelegramProfile.objects.filter(timezone=tz, utc_offset=stored_offset)
+        current_offset = TelegramProfile(timezone=tz).get_current_utc_offset(now)
+        delta = current_offset - stored_offset
+        if not delta:
+            continue
+        with transaction.atomic():
+            Habit.objects.filter(owner__in=profiles.values("user_id")).update(
+                next_reminder_at=F("next_reminder_at") - timedelta(minutes=delta),
+                updated_at=now,
+            )
+            changed += profiles.update(utc_offset=current_offset)
+    if changed:
+        # Сдвинутые времена могли попасть в кучу событийного планировщика
+        publish_schedule_change(now, reload=True)
+    return changed
+
+
+@shared_task
+def sync_habit_utc_offsets():
+    """Пересчитывает расписание привычек при смене смещения часового пояса."""
+    changed = apply_utc_offset_changes()
+    if changed:
+        logger.info("Habit schedules shifted for %s profiles after UTC offset change", changed)
+    return changed
 
 
 @shared_task
 def send_habit_reminders():
+    """
+    Координатор тика: выбирает id привычек, чьё время попало в окно
+    с прошлого запуска, и раздаёт их пачками параллельным подзадачам.
+    """
+    started = time.perf_counter()
     now = timezone.localtime()
-    current_time = now.time().replace(second=0, microsecond=0)
-    today = now.date()
 
-    # Берём только полезные, не приятные привычки
-    habits = Habit.objects.filter(
-        is_pleasant=False,
-        time=current_time,
+    with transaction.atomic():
+        window_start, window_end = get_reminder_window(now)
+        missed = reschedule_missed_reminders(window_start)
+
+        # Ограниченный диапазон по индексу next_reminder_at: приятные привычки
+        # его не имеют, пользователи без chat_id отсекаются JOIN'ом.
+        due_ids = list(
+            Habit.objects.filter(
+                next_reminder_at__gte=window_start,
+                next_reminder_at__lt=window_end,
+                owner__telegram_profile__isnull=False,
+            )
+            .exclude(owner__telegram_profile__chat_id="")
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        moved = Watermark.objects.filter(name=REMINDER_WATERMARK).update(value=window_end)
+        if not moved:
+            Watermark.objects.create(name=REMINDER_WATERMARK, value=window_end)
+
+    shard_size = settings.HABIT_REMINDER_SHARD_SIZE
+    shards = [
+        due_ids[start:start + shard_size]
+        for start in range(0, len(due_ids), shard_size)
+    ]
+    window = (window_start.isoformat(), window_end.isoformat())
+    if shards:
+        chord(
+            send_habit_reminders_shard.s(shard, *window) for shard in shards
+        )(summarize_reminder_tick.s(window[0]))
+
+    REMINDERS_DUE.inc(len(due_ids))
+    REMINDER_TICK_DURATION.observe(time.perf_counter() - started)
+    return {
+        "window_start": window[0],
+        "window_end": window[1],
+        "due": len(due_ids),
+        "shards": len(shards),
+        "missed": missed,
+    }
+
+
+@shared_task(autoretry_for=(DatabaseError,), retry_backoff=True, max_retries=3)
+def send_habit_reminders_shard(habit_ids, window_start, window_end):
+    """
+    Забирает привычки шарда и ставит напоминания в очередь, без сетевых
+    вызовов. Окно передаётся явно, поэтому повтор шарда после ошибки
+    заберёт те же строки, даже если отметка тика уже сдвинулась.
+    """
+    habits = claim_due_habits(
+        habit_ids,
+        datetime.fromisoformat(window_start),
+        datetime.fromisoformat(window_end),
     )
+    return {
+        "requested": len(habit_ids),
+        "claimed": len(habits),
+        "queued": len(habits),
+    }
 
-    for habit in habits:
-        last = habit.last_reminder
-        if last is not None:
-            days_passed = (today - last).days
-            if days_passed < habit.periodicity:
-                # Ещё рано напоминать
-                continue
-
-        user = habit.owner
-        profile = getattr(user, "telegram_profile", None)
-        chat_id = getattr(profile, "chat_id", None)
-        if not chat_id:
-            continue
 
-        text = (
-            f"Напоминание о привычке:\n"
-            f"{habit.action} в {habit.time.strftime('%H:%M')} "
-            f"в месте: {habit.place}"
+@shared_task
+def summarize_reminder_tick(results, window_start):
+    """Собирает счётчики шардов в итог по тику и запускает доставку."""
+    summary = {"window_start": window_start, "shards": len(results)}
+    for key in ("requested", "claimed", "queued"):
+        summary[key] = sum(result[key] for result in results)
+    logger.info("Habit reminder tick from %(window_start)s: %(queued)s queued", summary)
+    if summary["queued"]:
+        deliver_notification_outbox.delay()
+    return summary
+
+
+@shared_task
+def deliver_notification_outbox():
+    """
+    Доставляет очередь напоминаний пачками, пока есть созревшие строки
+    или не вышел бюджет времени. Несколько таких задач могут работать
+    параллельно: строки забираются с SKIP LOCKED.
+    """
+    deadline = time.monotonic() + settings.NOTIFICATION_OUTBOX_TIME_BUDGET
+    totals = {"claimed": 0, "messages": 0, "saved": 0, "sent": 0, "retried": 0, "dead": 0}
+    while time.monotonic() < deadline:
+        stats = deliver_outbox_batch()
+        for key, value in stats.items():
+            totals[key] += value
+        if stats["claimed"] < settings.NOTIFICATION_OUTBOX_BATCH_SIZE:
+            break
+
+    if totals["claimed"]:
+        logger.info(
+            "Notification outbox: %(sent)s sent in %(messages)s messages "
+            "(%(saved)s saved by digests), %(retried)s retried, %(dead)s dead",
+            totals,
         )
-        send_telegram_message(chat_id, text)
+    return totals
+
+
+@shared_task
+def purge_habit_deletions():
+    """Удаляет надгробия старше HABIT_DELETION_RETENTION_DAYS."""
+    threshold = timezone.now() - timedelta(days=settings.HABIT_DELETION_RETENTION_DAYS)
+    deleted, _details = HabitDeletion.objects.filter(deleted_at__lt=threshold).delete()
+    return deleted
 
-        habit.last_reminder = today
-        habit.save(update_fields=["last_reminder"])
\ No newline at end of file
+
+@shared_task
+def purge_notification_outbox():
+    """
+    Удаляет отправленные и недоставленные напоминания старше
+    NOTIFICATION_OUTBOX_RETENTION_DAYS. Ожидающие строки не трогаем.
+    """
+    threshold = timezone.localdate() - timedelta(days=settings.NOTIFICATION_OUTBOX_RETENTION_DAYS)
+    deleted, _details = NotificationOutbox.objects.filter(
+        status__in=(NotificationOutbox.STATUS_SENT, NotificationOutbox.STATUS_DEAD),
+        reminder_date__lt=threshold,
+    ).delete()
+    return deleted
+
+
+@shared_task
+def refresh_trending_habits():
+    """Переносит в рейтинг популярных привычек изменения с прошлого запуска."""
+    return refresh_trending()
@@ -0,0 +1,92 @@
+"""
+Локальная заглушка Telegram Bot API для тестов и бенчмарков.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело уходят разными write: без TCP_NODELAY каждый ответ
+    # ждёт отложенного ACK клиента (~40 мс), и замеры меряют не код, а TCP
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length).decode()
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            payload = json.loads(raw or "{}")
+        else:
+            payload = {key: values[0] for key, values in parse_qs(raw).items()}
+
+        with server.lock:
+            server.requests.append(
+                {"path": self.path, "payload": payload, "client": self.client_address}
+            )
+            server.connections.add(self.client_address)
+            status, body = server.responder(payload)
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def ok_responder(payload):
+    return 200, {"ok": True, "result": {"message_id": 1, "chat": {"id": payload.get("chat_id")}}}
+
+
+class FakeBotAPI:
+    """
+    HTTP-сервер в отдельном потоке, отвечающий как sendMessage Bot API.
+    responder(payload) -> (status, body) позволяет эмулировать ошибки.
+    """
+
+    def __init__(self, responder=ok_responder, delay=0.0):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeBotAPIHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.connections = set()
+        self.server.responder = responder
+        self.server.delay = delay
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,20 +1,87 @@
-from datetime import time
+from contextlib import contextmanager
+from io import StringIO
+import json
+import tempfile
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+import time as time_module
 
+import redis
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, router
+from django.utils.connection import ConnectionDoesNotExist
 from django.urls import reverse
 from django.utils import timezone
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
+from unittest import skipUnless
+from unittest.mock import patch
 
-from habits.models import Habit
-from habits.serializers import HabitSerializer
-from habits.tasks import send_habit_reminders
+from config.celery import app as celery_app
+from config.db_router import REPLICA_ALIAS, is_pinned_to_primary, read_from_replica
+from config.metrics import REQUEST_QUERIES, REQUESTS, Histogram, Registry, render_metric
+from config.renderers import FastJSONRenderer
+
+from habits.metrics import (
+    REMINDER_MESSAGES,
+    REMINDER_MESSAGES_SAVED,
+    REMINDERS_DUE,
+    TELEGRAM_SEND_DURATION,
+    TELEGRAM_SEND_FAILURES,
+)
+from habits.models import (
+    Habit,
+    HabitCompletion,
+    HabitDeletion,
+    NotificationOutbox,
+    TrendingHabit,
+    TrendingHabitMember,
+    Watermark,
+)
+from habits.outbox import (
+    TELEGRAM_MESSAGE_LIMIT,
+    build_digests,
+    deliver_outbox_batch,
+    enqueue_reminders,
+    format_digest,
+)
+from habits.ratelimit import CHAT_KEY, LocalRateLimiter, RedisRateLimiter
+from habits.scheduler import (
+    ReminderScheduler,
+    register_local_scheduler,
+    unregister_local_scheduler,
+)
+from habits.serializers import HabitSerializer, PublicHabitSerializer, get_row_serializer
+from habits.services import SendResult, TelegramClient
+from habits.testing import FakeBotAPI, ok_responder
+from habits.trending import refresh_trending
+from habits.tasks import (
+    REMINDER_WATERMARK,
+    apply_utc_offset_changes,
+    purge_notification_outbox,
+    send_habit_reminders,
+    send_habit_reminders_shard,
+)
 from users.models import TelegramProfile
 
 
 User = get_user_model()
 
 
+def redis_available():
+    try:
+        url = settings.TELEGRAM_RATE_LIMIT_REDIS_URL
+        return redis.Redis.from_url(url, socket_connect_timeout=0.2).ping()
+    except (redis.RedisError, ValueError):
+        return False
+
+
 class HabitSerializerValidatorTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -129,6 +196,7 @@ class HabitSerializerValidatorTests(TestCase):
 
 class HabitAPITests(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user1 = User.objects.create_user(
             username="user1",
@@ -202,6 +270,136 @@ class HabitAPITests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertGreaterEqual(len(response.data["results"]), 1)
 
+    def test_public_feed_hides_schedule_and_stats(self):
+        self.create_public_habit()
+        self.client.force_authenticate(user=None)
+        url = reverse("public-habit-list")
+
+        item = self.client.get(url).data["results"][0]
+
+        for name in ("next_reminder_at", "last_reminder", "current_streak", "total_completions"):
+            self.assertNotIn(name, item)
+        self.assertIn("action", item)
+        response = self.client.get(url, {"fields": "id,next_reminder_at"})
+        self.assertEqual(response.status_code, 400)
+
+    def create_public_habit(self, **kwargs):
+        data = {
+            "owner": self.user1,
+            "place": "Парк",
+            "time": time(18, 0),
+            "action": "Гулять",
+            "is_public": True,
+            "periodicity": 1,
+            "execution_time": 60,
+        }
+        data.update(kwargs)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Habit.objects.create(**data)
+
+    @override_settings(PUBLIC_HABITS_CACHE=True)
+    def test_public_feed_is_cached_and_supports_etag(self):
+        self.create_public_habit()
+        url = reverse("public-habit-list")
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached["ETag"], etag)
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], etag)
+
+    @override_settings(PUBLIC_HABITS_CACHE=True)
+    def test_public_feed_cache_key_includes_host(self):
+        for number in range(3):
+            self.create_public_habit(action=f"Гулять {number}")
+        url = reverse("public-habit-list")
+
+        first = self.client.get(url, {"page_size": 1}, HTTP_HOST="a.example.com")
+        second = self.client.get(url, {"page_size": 1}, HTTP_HOST="b.example.com")
+
+        self.assertTrue(first.data["next"].startswith("http://a.example.com/"))
+        self.assertTrue(second.data["next"].startswith("http://b.example.com/"))
+
+    @override_settings(PUBLIC_HABITS_CACHE=False)
+    def test_public_feed_without_shared_cache_is_not_cached(self):
+        habit = self.create_public_habit()
+        url = reverse("public-habit-list")
+        etag = self.client.get(url)["ETag"]
+
+        # Смена версии в памяти другого процесса сюда бы не дошла: без общего
+        # кэша страница строится заново, но If-None-Match по-прежнему работает
+        Habit.objects.filter(pk=habit.pk).update(action="Бегать")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["action"], "Бегать")
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    @override_settings(PUBLIC_HABITS_CACHE=True)
+    def test_public_feed_is_invalidated_only_by_public_habits(self):
+        habit = self.create_public_habit()
+        url = reverse("public-habit-list")
+        etag = self.client.get(url)["ETag"]
+
+        # Личная привычка в ленту не попадает и кэш не сбрасывает
+        self.create_public_habit(is_public=False, action="Читать")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url)["ETag"], etag)
+
+        # Привычка перестала быть публичной — лента пересчитывается
+        habit.is_public = False
+        with self.captureOnCommitCallbacks(execute=True):
+            habit.save()
+        response = self.client.get(url)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["count"], 0)
+
+    def test_next_reminder_at_follows_time_changes(self):
+        self.authenticate(self.user1)
+        response = self.client.post(
+            reverse("habit-list"),
+            {
+                "place": "Дом",
+                "time": "07:30:00",
+                "action": "Зарядка",
+                "periodicity": 1,
+                "execution_time": 60,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        habit = Habit.objects.get(pk=response.data["id"])
+        self.assertEqual(habit.next_reminder_at.time(), time(7, 30))
+
+        response = self.client.patch(
+            reverse("habit-detail", args=[habit.id]),
+            {"time": "21:15:00"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_reminder_at.time(), time(21, 15))
+        self.assertGreaterEqual(
+            habit.next_reminder_at,
+            timezone.localtime().replace(second=0, microsecond=0),
+        )
+
+        response = self.client.patch(
+            reverse("habit-detail", args=[habit.id]),
+            {"is_pleasant": True},
+            format="json",
+        )
+        habit.refresh_from_db()
+        self.assertIsNone(habit.next_reminder_at)
+
     def test_pagination_returns_five_per_page(self):
         for i in range(7):
             Habit.objects.create(
@@ -224,37 +422,1723 @@ class HabitAPITests(TestCase):
         self.assertEqual(response_page2.status_code, 200)
         self.assertEqual(len(response_page2.data["results"]), 2)
 
+    def test_cursor_pagination_walks_all_pages_without_count(self):
+        for i in range(12):
+            Habit.objects.create(
+                owner=self.user1,
+                place=f"Место {i}",
+                time=time(10, 0),
+                action=f"Действие {i}",
+                is_pleasant=False,
+                periodicity=1,
+                execution_time=60,
+            )
+
+        self.authenticate(self.user1)
+        url = reverse("habit-list")
+        params = {"pagination": "cursor"}
+        seen = []
+        with CaptureQueriesContext(connection) as queries:
+            while url:
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn("count", response.data)
+                seen.extend(item["id"] for item in response.data["results"])
+                url, params = response.data["next"], None
 
-class CeleryReminderTests(TestCase):
+        self.assertEqual(len(seen), 12)
+        self.assertEqual(
+            seen,
+            list(Habit.objects.order_by("-created_at", "id").values_list("id", flat=True)),
+        )
+        self.assertFalse(any("COUNT(" in query["sql"] for query in queries))
+
+    def test_bulk_sync_applies_batch_in_one_transaction(self):
+        reward = Habit.objects.create(
+            owner=self.user1,
+            place="Дом",
+            time=time(20, 0),
+            action="Сериал",
+            is_pleasant=True,
+        )
+        to_update = Habit.objects.create(
+            owner=self.user1, place="Офис", time=time(9, 0), action="Кофе"
+        )
+        to_delete = Habit.objects.create(
+            owner=self.user1, place="Офис", time=time(9, 0), action="Почта"
+        )
+        items = [
+            {
+                "place": f"Парк {i}",
+                "time": "07:00:00",
+                "action": f"Бег {i}",
+                "related_habit": reward.pk,
+            }
+            for i in range(20)
+        ]
+        items.append({"id": to_update.pk, "time": "10:30:00", "related_habit": reward.pk})
+        items.append({"op": "delete", "id": to_delete.pk})
+
+        self.authenticate(self.user1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("habit-bulk"), items, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        # Число запросов не зависит от размера пакета
+        self.assertLess(len(queries), 15)
+
+        self.assertEqual(len(response.data), 22)
+        self.assertEqual(response.data[-1], {"id": to_delete.pk, "deleted": True})
+        self.assertEqual(
+            Habit.objects.filter(owner=self.user1, related_habit=reward).count(), 21
+        )
+        self.assertFalse(Habit.objects.filter(pk=to_delete.pk).exists())
+        to_update.refresh_from_db()
+        self.assertEqual(to_update.next_reminder_at.time(), time(10, 30))
+        created = Habit.objects.get(action="Бег 0")
+        self.assertIsNotNone(created.next_reminder_at)
+
+    def test_bulk_delete_writes_tombstones_in_one_insert(self):
+        habits = [
+            Habit.objects.create(
+                owner=self.user1, place="Офис", time=time(9, 0), action=f"Почта {i}"
+            )
+            for i in range(20)
+        ]
+        items = [{"op": "delete", "id": habit.pk} for habit in habits]
+
+        self.authenticate(self.user1)
+        with patch("habits.bulk.publish_schedule_change") as publish, patch(
+            "habits.signals.publish_schedule_change"
+        ) as per_row_publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.post(reverse("habit-bulk"), items, format="json")
+
+        self.assertEqual(response.status_code, 200, response.data)
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "habits_habitdeletion"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            set(HabitDeletion.objects.values_list("habit_id", flat=True)),
+            {habit.pk for habit in habits},
+        )
+        self.assertEqual(publish.call_count, 1)
+        per_row_publish.assert_not_called()
+
+    def test_bulk_sync_returns_per_item_errors_and_changes_nothing(self):
+        foreign = Habit.objects.create(
+            owner=self.user2, place="Дом", time=time(8, 0), action="Чужая", is_pleasant=True
+        )
+        items = [
+            {"place": "Парк", "time": "07:00:00", "action": "Бег"},
+            {"place": "Парк", "time": "07:00:00", "action": "Бег", "execution_time": 500},
+            {"place": "Парк", "time": "07:00:00", "action": "Бег", "related_habit": foreign.pk},
+            {"op": "delete", "id": foreign.pk},
+        ]
+
+        self.authenticate(self.user1)
+        response = self.client.post(reverse("habit-bulk"), items, format="json")
+        self.assertEqual(response.status_code, 400)
+        errors = response.data["errors"]
+        self.assertIsNone(errors[0])
+        self.assertIn("non_field_errors", errors[1])
+        self.assertIn("related_habit", errors[2])
+        self.assertIn("id", errors[3])
+        self.assertFalse(Habit.objects.filter(owner=self.user1).exists())
+
+    def export_habits(self, user, export_format):
+        self.authenticate(user)
+        response = self.client.get(reverse("habit-export"), {"as": export_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_and_import_round_trip(self):
+        reward = Habit.objects.create(
+            owner=self.user1, place="Дом", time=time(20, 0), action="Сериал", is_pleasant=True
+        )
+        Habit.objects.create(
+            owner=self.user1,
+            place="Парк, у пруда",
+            time=time(7, 0),
+            action="Бег",
+            related_habit=reward,
+            is_public=True,
+        )
+
+        formats = (("ndjson", "application/x-ndjson"), ("csv", "text/csv"))
+        for export_format, content_type in formats:
+            with self.subTest(export_format=export_format):
+                Habit.objects.filter(owner=self.user2).delete()
+                dump = self.export_habits(self.user1, export_format)
+
+                self.authenticate(self.user2)
+                response = self.client.post(
+                    reverse("habit-import"), dump, content_type=content_type
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data, {"created": 2, "failed": 0, "errors": []})
+
+                imported = Habit.objects.get(owner=self.user2, action="Бег")
+                self.assertEqual(imported.place, "Парк, у пруда")
+                self.assertEqual(imported.related_habit.owner, self.user2)
+                self.assertEqual(imported.related_habit.action, "Сериал")
+                self.assertIsNotNone(imported.next_reminder_at)
+
+    def test_import_reports_bad_lines_and_keeps_good_ones(self):
+        dump = "\n".join([
+            '{"place": "Дом", "time": "08:00", "action": "Зарядка"}',
+            "{not json",
+            '{"place": "Дом", "time": "08:00", "action": "Йога", "execution_time": 500}',
+            "",
+            '{"place": "Дом", "time": "09:00", "action": "Чтение"}',
+        ])
+
+        self.authenticate(self.user1)
+        response = self.client.post(
+            reverse("habit-import") + "?as=ndjson", dump, content_type="text/plain"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([error["line"] for error in response.data["errors"]], [2, 3])
+        self.assertEqual(Habit.objects.filter(owner=self.user1).count(), 2)
+
+    def test_sparse_fieldsets_trim_response_and_sql(self):
+        habit = self.create_public_habit(place="Очень длинное место", reward="Кино")
+        cases = (
+            (reverse("habit-list"), {"fields": "action,time"}),
+            (reverse("public-habit-list"), {"fields": "id,action,time"}),
+            (reverse("habit-detail", args=[habit.pk]), {"exclude": "place,reward"}),
+        )
+
+        self.authenticate(self.user1)
+        for url, params in cases:
+            with self.subTest(url=url, params=params):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                item = response.data["results"][0] if "results" in response.data else response.data
+                if "fields" in params:
+                    self.assertEqual(set(item), {"id", "action", "time"})
+                else:
+                    self.assertNotIn("place", item)
+                    self.assertNotIn("reward", item)
+                    self.assertIn("action", item)
+                habit_selects = [
+                    query["sql"]
+                    for query in queries
+                    if query["sql"].startswith('SELECT "habits_habit"."id"')
+                ]
+                self.assertTrue(habit_selects)
+                for sql in habit_selects:
+                    self.assertNotIn('"habits_habit"."place"', sql)
+                    self.assertNotIn('"habits_habit"."reward"', sql)
+
+        response = self.client.get(reverse("habit-list"), {"fields": "action,password"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_supports_conditional_get(self):
+        habit = Habit.objects.create(
+            owner=self.user1, place="Дом", time=time(8, 0), action="Зарядка"
+        )
+        other = Habit.objects.create(
+            owner=self.user1, place="Дом", time=time(9, 0), action="Чтение"
+        )
+        self.authenticate(self.user1)
+        url = reverse("habit-list")
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        habit.action = "Зарядка утром"
+        habit.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        # Удаление не двигает max(updated_at), но меняет ETag через надгробие
+        etag = response["ETag"]
+        other.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(HABIT_CHANGES_OVERLAP=0)
+    def test_changes_returns_updates_and_tombstones_since_token(self):
+        kept = Habit.objects.create(
+            owner=self.user1, place="Дом", time=time(8, 0), action="Зарядка"
+        )
+        removed = Habit.objects.create(
+            owner=self.user1, place="Дом", time=time(9, 0), action="Чтение"
+        )
+        Habit.objects.create(owner=self.user2, place="Офис", time=time(9, 0), action="Чужая")
+        self.authenticate(self.user1)
+        url = reverse("habit-changes")
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.data["changed"]), 2)
+        token = response.data["token"]
+
+        response = self.client.get(url, {"since": token})
+        self.assertEqual(response.data["changed"], [])
+        self.assertEqual(response.data["deleted"], [])
+
+        kept.place = "Парк"
+        kept.save()
+        removed_id = removed.pk
+        removed.delete()
+        response = self.client.get(url, {"since": token})
+        self.assertEqual([item["id"] for item in response.data["changed"]], [kept.pk])
+        self.assertEqual(response.data["deleted"], [removed_id])
+
+        self.assertEqual(self.client.get(url, {"since": "0"}).status_code, 410)
+        self.assertEqual(self.client.get(url, {"since": "abc"}).status_code, 400)
+        for overflow in ("99999999999999999999999", "-99999999999999999999999"):
+            self.assertEqual(self.client.get(url, {"since": overflow}).status_code, 400)
+        # В диапазоне timedelta, но за пределами datetime
+        self.assertEqual(self.client.get(url, {"since": str(10 ** 18)}).status_code, 400)
+
+        # Пользователь удаляется вместе с привычками без новых надгробий
+        self.user1.delete()
+        self.assertFalse(HabitDeletion.objects.exists())
+
+    @override_settings(HABIT_CHANGES_OVERLAP=0)
+    def test_changes_return_habits_unlinked_from_deleted_reward(self):
+        rewards = [
+            Habit.objects.create(
+                owner=self.user1, place="Дом", time=time(20, 0), action=f"Кино {i}",
+                is_pleasant=True,
+            )
+            for i in range(2)
+        ]
+        linked = [
+            Habit.objects.create(
+                owner=self.user1, place="Дом", time=time(8, 0), action=f"Зарядка {i}",
+                related_habit=reward,
+            )
+            for i, reward in enumerate(rewards)
+        ]
+        self.authenticate(self.user1)
+        url = reverse("habit-changes")
+        token = self.client.get(url).data["token"]
+        reward_ids = [reward.pk for reward in rewards]
+
+        # Одиночное удаление и пакетное через /habits/bulk/
+        rewards[0].delete()
+        response = self.client.post(
+            reverse("habit-bulk"), [{"op": "delete", "id": reward_ids[1]}], format="json"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+
+        response = self.client.get(url, {"since": token})
+        changed = {item["id"]: item for item in response.data["changed"]}
+        self.assertEqual(set(changed), {habit.pk for habit in linked})
+        self.assertTrue(all(item["related_habit"] is None for item in changed.values()))
+        self.assertEqual(sorted(response.data["deleted"]), reward_ids)
+
+
+class HabitCompletionTests(TestCase):
     def setUp(self):
-        self.user = User.objects.create_user(
-            username="user1",
-            password="pass12345",
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user1", password="pass12345")
+        self.client.force_authenticate(self.user)
+        self.habit = Habit.objects.create(
+            owner=self.user, place="Дом", time=time(8, 0), action="Зарядка", execution_time=60,
         )
-        self.profile = TelegramProfile.objects.create(
-            user=self.user,
-            chat_id="123456789",
+        self.today = timezone.now().date()
+
+    def complete(self, days_ago=None, habit=None):
+        data = {} if days_ago is None else {
+            "completed_on": (self.today - timedelta(days=days_ago)).isoformat()
+        }
+        return self.client.post(
+            reverse("habit-complete", args=[(habit or self.habit).pk]), data, format="json"
         )
 
-    def test_send_habit_reminders_sends_message(self):
-        now = timezone.localtime()
-        reminder_time = now.time().replace(second=0, microsecond=0)
+    def assert_counters(self, current, best, total):
+        self.habit.refresh_from_db()
+        self.assertEqual(
+            (self.habit.current_streak, self.habit.best_streak, self.habit.total_completions),
+            (current, best, total),
+        )
+
+    def test_streak_grows_incrementally_and_duplicates_are_ignored(self):
+        for days_ago in (3, 2):
+            self.assertEqual(self.complete(days_ago).status_code, 201)
+        response = self.complete()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["current_streak"], 1)
+        self.assert_counters(current=1, best=2, total=3)
+
+        response = self.complete()
+        self.assertEqual(response.status_code, 200)
+        self.assert_counters(current=1, best=2, total=3)
+        self.assertEqual(self.habit.last_completed_on, self.today)
+
+    def test_lapsed_streak_is_reported_as_zero(self):
+        for days_ago in (3, 2):
+            self.complete(days_ago)
+        self.assert_counters(current=2, best=2, total=2)
+
+        detail = self.client.get(reverse("habit-detail", args=[self.habit.pk]))
+        listed = self.client.get(reverse("habit-list"), {"fields": "current_streak"})
+        stats = self.client.get(reverse("habit-stats", args=[self.habit.pk]))
+
+        self.assertEqual(detail.data["current_streak"], 0)
+        self.assertEqual(listed.json()["results"][0]["current_streak"], 0)
+        self.assertEqual(stats.data["current_streak"], 0)
+
+    def test_late_completion_recalculates_from_log(self):
+        for days_ago in (4, 2, 0):
+            self.complete(days_ago)
+        self.assert_counters(current=1, best=1, total=3)
+        # Офлайн-клиент досылает пропущенные дни: серии склеиваются
+        self.complete(1)
+        self.complete(3)
+        self.assert_counters(current=5, best=5, total=5)
+
+    def test_periodicity_allows_gaps(self):
+        self.habit.periodicity = 2
+        self.habit.save()
+        for days_ago in (6, 4, 2):
+            self.complete(days_ago)
+        self.assert_counters(current=3, best=3, total=3)
+
+    def test_batch_is_validated_as_a_whole(self):
+        other = Habit.objects.create(
+            owner=User.objects.create_user(username="user2", password="pass12345"),
+            place="Офис", time=time(9, 0), action="Кофе", execution_time=60,
+        )
+        url = reverse("habit-completions")
+        day = (self.today - timedelta(days=1)).isoformat()
+        tomorrow = (self.today + timedelta(days=1)).isoformat()
+        response = self.client.post(
+            url,
+            [{"habit": self.habit.pk, "completed_on": day}, {"habit": other.pk},
+             {"habit": self.habit.pk, "completed_on": tomorrow}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.data["errors"]
+        self.assertIsNone(errors[0])
+        self.assertIn("habit", errors[1])
+        self.assertIn("completed_on", errors[2])
+        self.assertFalse(HabitCompletion.objects.exists())
+
+        response = self.client.post(
+            url,
+            [{"habit": self.habit.pk, "completed_on": day}, {"habit": self.habit.pk},
+             {"habit": self.habit.pk}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["duplicates"], 0)
+        self.assertEqual(response.data["habits"][0]["current_streak"], 2)
+        self.assert_counters(current=2, best=2, total=2)
+
+    def test_stats_read_counters_and_expire_broken_streak(self):
+        for days_ago in (5, 4, 3):
+            self.complete(days_ago)
+        url = reverse("habit-stats", args=[self.habit.pk])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        # Только строка привычки: журнал отметок не читается
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data["current_streak"], 0)
+        self.assertEqual(response.data["best_streak"], 3)
+        self.assertEqual(response.data["total_completions"], 3)
+
+    def test_foreign_habit_cannot_be_completed(self):
+        other = Habit.objects.create(
+            owner=User.objects.create_user(username="user2", password="pass12345"),
+            place="Офис", time=time(9, 0), action="Кофе", execution_time=60,
+        )
+        self.assertEqual(self.complete(habit=other).status_code, 404)
+        self.assertEqual(self.complete(days_ago=60).status_code, 400)
+
+    def test_complete_rejects_non_object_body(self):
+        url = reverse("habit-complete", args=[self.habit.pk])
+        for body in ([1, 2], "2026-01-01", 5):
+            with self.subTest(body=body):
+                response = self.client.post(url, body, format="json")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("non_field_errors", response.data)
+        self.assertFalse(HabitCompletion.objects.exists())
+
+
+class TrendingHabitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="user1", password="pass12345")
+        self.other = User.objects.create_user(username="user2", password="pass12345")
+
+    def create_habit(self, owner, action, place="Дом", is_public=True):
+        return Habit.objects.create(
+            owner=owner, place=place, time=time(8, 0), action=action,
+            execution_time=60, is_public=is_public,
+        )
+
+    def trending(self):
+        return list(
+            TrendingHabit.objects.order_by("-habits_count", "action_key")
+            .values_list("action_key", "place_key", "habits_count")
+        )
+
+    def test_rollup_groups_normalized_public_habits(self):
+        self.create_habit(self.user, "Пить  воду.")
+        self.create_habit(self.other, "пить воду", place=" дом ")
+        self.create_habit(self.other, "Зарядка")
+        self.create_habit(self.user, "Секрет", is_public=False)
+
+        self.assertEqual(refresh_trending()["changed"], 3)
+        self.assertEqual(
+            self.trending(), [("пить воду", "дом", 2), ("зарядка", "дом", 1)]
+        )
+        self.assertEqual(TrendingHabit.objects.get(action_key="пить воду").action, "Пить  воду.")
+        # Повторный проход по окну перекрытия ничего не засчитывает дважды
+        self.assertEqual(refresh_trending()["changed"], 0)
+        self.assertEqual(self.trending()[0][2], 2)
+
+    def test_rollup_applies_edits_and_deletions_incrementally(self):
+        water = self.create_habit(self.user, "Пить воду")
+        self.create_habit(self.other, "Пить воду")
+        charge = self.create_habit(self.user, "Зарядка")
+        refresh_trending()
+
+        water.action = "Зарядка"
+        water.save()
+        self.create_habit(self.user, "Гулять").delete()
+        refresh_trending()
+        self.assertEqual(
+            self.trending(), [("зарядка", "дом", 2), ("пить воду", "дом", 1)]
+        )
+
+        charge.is_public = False
+        charge.save()
+        self.other.delete()
+        result = refresh_trending()
+        self.assertEqual(result["deleted"], 1)
+        self.assertEqual(self.trending(), [("зарядка", "дом", 1)])
+        self.assertEqual(TrendingHabitMember.objects.count(), 1)
+
+    def test_rollup_skips_habits_unchanged_since_last_run(self):
+        self.create_habit(self.user, "Пить воду")
+        refresh_trending()
+        later = timezone.now() + timedelta(minutes=10)
+        refresh_trending(now=later)
+        with patch("habits.trending.apply_changed_habits") as apply_changed:
+            refresh_trending(now=later + timedelta(minutes=1))
+        apply_changed.assert_not_called()
+
+    def test_trending_endpoint_reads_rollup(self):
+        for owner in (self.user, self.other):
+            self.create_habit(owner, "Пить воду")
+        self.create_habit(self.user, "Зарядка")
+        refresh_trending()
+        client = APIClient()
+        url = reverse("public-habit-trending")
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, {"limit": 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            response.json(), [{"action": "Пить воду", "place": "Дом", "habits_count": 2}]
+        )
+        self.assertEqual(client.get(url, {"limit": 0}).status_code, 400)
+        self.assertEqual(client.get(url, {"limit": "x"}).status_code, 400)
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5-индекс поиска — только в SQLite")
+class PublicHabitSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user1", password="pass12345")
+        self.url = reverse("public-habit-list")
+
+    def create_habit(self, action, place="Дом", is_public=True):
+        return Habit.objects.create(
+            owner=self.user, place=place, time=time(8, 0), action=action,
+            execution_time=60, is_public=is_public,
+        )
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def found(self, query):
+        return [item["id"] for item in self.search(query)["results"]]
+
+    def test_search_matches_prefixes_of_public_habits_by_rank(self):
+        in_place = self.create_habit("Читать", place="Вода рядом")
+        in_action = self.create_habit("Пить воду")
+        self.create_habit("Пить воду", is_public=False)
+        self.create_habit("Зарядка")
+
+        self.assertEqual(self.found("вод"), [in_action.pk, in_place.pk])
+        self.assertEqual(self.found("ПИТЬ воду"), [in_action.pk])
+        self.assertEqual(self.found("бег"), [])
+        # Синтаксис FTS5 из ввода не доходит до MATCH
+        self.assertEqual(self.found('"пить" OR (NEAR'), [])
+        self.assertEqual(self.found("!!!"), [])
+
+    def test_index_follows_habit_changes(self):
+        habit = self.create_habit("Пить воду")
+        self.assertEqual(self.found("воду"), [habit.pk])
+
+        habit.action = "Гулять"
+        habit.save()
+        self.assertEqual(self.found("воду"), [])
+        self.assertEqual(self.found("гулять"), [habit.pk])
+
+        habit.is_public = False
+        habit.save()
+        self.assertEqual(self.found("гулять"), [])
+        habit.is_public = True
+        habit.save()
+        self.assertEqual(self.found("гулять"), [habit.pk])
+
+        habit.delete()
+        self.assertEqual(self.found("гулять"), [])
+
+    def test_search_pages_by_keyset_cursor(self):
+        expected = {self.create_habit("Пить воду").pk for _number in range(7)}
+        expected.add(self.create_habit("Вода", place="Пить").pk)
+        seen = []
+        data = self.search("пить", page_size=3)
+        while True:
+            seen.extend(item["id"] for item in data["results"])
+            if not data["next"]:
+                break
+            response = self.client.get(data["next"])
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+        self.assertEqual(len(seen), len(expected))
+        self.assertEqual(set(seen), expected)
+
+    def test_long_query_is_rejected(self):
+        response = self.client.get(self.url, {"q": "а" * 201})
+        self.assertEqual(response.status_code, 400)
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user1", password="pass12345")
+
+    @contextmanager
+    def replica(self):
+        """Реплика «настроена», но соединения с ней нет: чтение с неё упадёт."""
+        with patch("config.db_router.replica_configured", return_value=True), patch(
+            "habits.views.replica_configured", return_value=True
+        ):
+            yield
+
+    def test_router_sends_only_marked_reads_to_replica(self):
+        with self.replica():
+            self.assertEqual(router.db_for_read(Habit), "default")
+            with read_from_replica():
+                self.assertEqual(router.db_for_read(Habit), REPLICA_ALIAS)
+                self.assertEqual(router.db_for_write(Habit), "default")
+                with read_from_replica(enabled=False):
+                    self.assertEqual(router.db_for_read(Habit), "default")
+            self.assertEqual(router.db_for_read(Habit), "default")
+        self.assertFalse(router.allow_migrate(REPLICA_ALIAS, "habits"))
 
+    def test_replica_is_ignored_when_not_configured(self):
+        with read_from_replica():
+            self.assertEqual(router.db_for_read(Habit), "default")
+
+    def test_safe_requests_read_from_replica(self):
+        with self.replica(), self.assertRaises(ConnectionDoesNotExist):
+            self.client.get(reverse("public-habit-list"))
+
+    def test_writer_is_pinned_to_primary(self):
+        self.client.force_authenticate(self.user)
+        with self.replica():
+            response = self.client.post(
+                reverse("habit-list"),
+                {"place": "Дом", "time": "08:00", "action": "Зарядка", "execution_time": 60},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201)
+            self.assertTrue(is_pinned_to_primary(self.user.pk))
+
+            response = self.client.get(reverse("habit-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 1)
+
+    def test_changes_are_read_from_primary(self):
+        self.client.force_authenticate(self.user)
+        with self.replica():
+            response = self.client.get(reverse("habit-changes"))
+        self.assertEqual(response.status_code, 200)
+
+
+class HabitRepresentationParityTests(TestCase):
+    """Быстрый путь чтения обязан давать те же байты, что HabitSerializer."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="parity", password="pass12345")
+        reward = Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=time(20, 0),
+            action="Сериал",
+            is_pleasant=True,
+            is_public=True,
+        )
         Habit.objects.create(
             owner=self.user,
-            place="Парк",
-            time=reminder_time,
-            action="Гулять",
-            is_pleasant=False,
-            periodicity=1,
-            execution_time=60,
+            place="Парк\u2028у пруда «Лебединый»",
+            time=time(7, 5, 30),
+            action='Бег "трусцой"',
+            related_habit=reward,
+            is_public=True,
+            last_reminder=timezone.localdate(),
+        )
+        Habit.objects.create(
+            owner=self.user,
+            place="Офис",
+            time=time(12, 0),
+            action="Разминка",
+            reward="Кофе",
+            periodicity=3,
+            is_public=True,
+        )
+        # Прерванная серия: в ответе 0, а не хранимое значение
+        Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=time(22, 0),
+            action="Чтение",
+            current_streak=5,
+            best_streak=5,
+            total_completions=5,
+            last_completed_on=timezone.localdate() - timedelta(days=3),
+            is_public=True,
         )
 
-        # Мокаем отправку в Telegram
-        from unittest.mock import patch
+    def legacy_bytes(self, data):
+        return JSONRenderer().render(data)
 
-        with patch("habits.tasks.send_telegram_message") as mocked_send:
-            send_habit_reminders()
-            self.assertTrue(mocked_send.called)
-            args, kwargs = mocked_send.call_args
-            self.assertEqual(args[0], self.profile.chat_id)
\ No newline at end of file
+    def test_row_serializer_matches_habit_serializer(self):
+        queryset = Habit.objects.order_by("-created_at")
+        field_sets = (
+            None,
+            ("id", "action", "time"),
+            ("next_reminder_at", "owner", "related_habit"),
+            ("id", "current_streak"),
+        )
+        for fields in field_sets:
+            with self.subTest(fields=fields):
+                legacy = HabitSerializer(queryset, many=True, context={"fields": fields}).data
+                row_serializer = get_row_serializer(fields)
+                fast = row_serializer.represent(queryset.values(*row_serializer.columns))
+                self.assertEqual(FastJSONRenderer().render(fast), self.legacy_bytes(legacy))
+
+    def test_list_endpoints_match_legacy_payload(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        queryset = Habit.objects.order_by("-created_at")
+        endpoints = (
+            (reverse("habit-list"), HabitSerializer),
+            (reverse("public-habit-list"), PublicHabitSerializer),
+        )
+        for url, serializer_class in endpoints:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                expected = {
+                    "count": 4,
+                    "next": None,
+                    "previous": None,
+                    "results": serializer_class(queryset, many=True).data,
+                }
+                self.assertEqual(response.content, self.legacy_bytes(expected))
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {
+            "text": "строка\u2028с\u2029разделителями и \"кавычками\"",
+            "moment": timezone.now(),
+            "day": timezone.localdate(),
+            "at": time(7, 30, 15, 250),
+            "amount": Decimal("1.50"),
+            "nested": [{"ok": True, "none": None, "number": 10 ** 12}],
+            "tuple": (1, 2),
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, "application/json; indent=2"),
+            JSONRenderer().render(data, "application/json; indent=2"),
+        )
+
+
+# Метрики задач читаются из Redis; в тестах проверяем только память процесса
+@override_settings(METRICS_REDIS_URL="")
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user1", password="pass12345")
+        self.client.force_authenticate(self.user)
+
+    def test_request_metrics_are_recorded_per_view(self):
+        labels = {"view": "habit-list", "method": "GET"}
+        queries_before = REQUEST_QUERIES.get(**labels)
+        requests_before = REQUESTS.get(status=200, **labels)
+
+        self.assertEqual(self.client.get(reverse("habit-list")).status_code, 200)
+
+        count, total = REQUEST_QUERIES.get(**labels)
+        self.assertEqual(count, queries_before[0] + 1)
+        self.assertGreater(total, queries_before[1])
+        self.assertEqual(REQUESTS.get(status=200, **labels), requests_before + 1)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint_renders_prometheus_text(self):
+        self.client.get(reverse("habit-list"))
+
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        self.assertIn('http_requests_total{view="habit-list",method="GET",status="200"}', body)
+        self.assertIn("http_request_serializer_duration_seconds_count", body)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_endpoint_is_internal(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.1").status_code, 404)
+        # Локальный адрес сам по себе не пускает: так приходят запросы через прокси
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="127.0.0.1").status_code, 404)
+        response = self.client.get(
+            url, REMOTE_ADDR="10.0.0.1", HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(response.status_code, 200)
+        with override_settings(METRICS_ALLOWED_IPS=["10.0.0.5"]):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.5").status_code, 200)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_metrics_endpoint_is_closed_without_token_and_ips(self):
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, 404)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram(
+            "test_seconds", "Тест", ("kind",), buckets=(0.1, 1), registry=Registry()
+        )
+        histogram.observe(0.05, kind="a")
+        histogram.observe(0.5, kind="a")
+        histogram.observe(5, kind="a")
+
+        lines = render_metric(histogram, histogram.samples(histogram.snapshot()))
+
+        self.assertEqual(lines[2:], [
+            'test_seconds_bucket{kind="a",le="0.1"} 1',
+            'test_seconds_bucket{kind="a",le="1"} 2',
+            'test_seconds_bucket{kind="a",le="+Inf"} 3',
+            'test_seconds_count{kind="a"} 3',
+            'test_seconds_sum{kind="a"} 5.55',
+        ])
+
+
+class LoadBenchmarkCommandTests(TestCase):
+    def generate(self, **options):
+        call_command("generate_habit_data", users=40, batch_size=15, stdout=StringIO(), **options)
+        return list(
+            Habit.objects.filter(owner__username__startswith="load-")
+            .order_by("owner__username", "pk")
+            .values_list("owner__username", "time", "is_pleasant", "next_reminder_at")
+        )
+
+    def test_generated_data_is_reproducible_and_scheduled(self):
+        first = self.generate()
+        second = self.generate(clear=True)
+
+        self.assertEqual(User.objects.filter(username__startswith="load-").count(), 40)
+        self.assertTrue(first)
+        self.assertEqual(
+            [row[:3] for row in first],
+            [row[:3] for row in second],
+        )
+        for _username, _time, is_pleasant, next_reminder_at in second:
+            self.assertEqual(next_reminder_at is None, is_pleasant)
+
+    def test_benchmark_writes_json_report(self):
+        self.generate()
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            call_command(
+                "benchmark_habits",
+                only=["habit_list", "create"],
+                iterations=3,
+                warmup=1,
+                output=output.name,
+                allow_write=True,
+                stdout=StringIO(),
+            )
+            report = json.load(output)
+
+        self.assertEqual(set(report["scenarios"]), {"habit_list", "create"})
+        self.assertEqual(report["scenarios"]["habit_list"]["iterations"], 3)
+        self.assertGreater(report["scenarios"]["create"]["p99_ms"], 0)
+        self.assertFalse(User.objects.filter(username__startswith="benchmark-").exists())
+
+    def test_benchmark_refuses_to_write_without_flag(self):
+        self.generate()
+        users = User.objects.count()
+        with self.assertRaisesMessage(CommandError, "--allow-write"):
+            call_command("benchmark_habits", only=["habit_list", "tick"], stdout=StringIO())
+        self.assertEqual(User.objects.count(), users)
+        self.assertFalse(Watermark.objects.exists())
+
+    def test_transfer_benchmark_cleans_up_without_tombstones(self):
+        with self.assertRaisesMessage(CommandError, "--allow-write"):
+            call_command("benchmark_habit_transfer", rows=10, stdout=StringIO())
+
+        stdout = StringIO()
+        call_command("benchmark_habit_transfer", rows=50, allow_write=True, stdout=stdout)
+
+        self.assertIn("import: 50 rows", stdout.getvalue())
+        self.assertFalse(User.objects.filter(username="benchmark-transfer").exists())
+        self.assertFalse(Habit.objects.exists())
+        self.assertFalse(HabitDeletion.objects.exists())
+
+
+class CeleryReminderTests(TestCase):
+    def setUp(self):
+        # Подзадачи шардов выполняются синхронно, без брокера
+        conf = celery_app.conf
+        self.addCleanup(
+            conf.update,
+            task_always_eager=conf.task_always_eager,
+            task_eager_propagates=conf.task_eager_propagates,
+        )
+        conf.update(task_always_eager=True, task_eager_propagates=True)
+
+        self.user = User.objects.create_user(
+            username="user1",
+            password="pass12345",
+        )
+        self.profile = TelegramProfile.objects.create(
+            user=self.user,
+            chat_id="123456789",
+        )
+
+    @contextmanager
+    def capture_telegram(self):
+        """Подменяет отправку в Telegram и собирает пары (chat_id, text)."""
+        sent = []
+
+        def fake_send(messages):
+            messages = list(messages)
+            sent.extend(messages)
+            return [SendResult(chat_id=chat_id, ok=True) for chat_id, _text in messages]
+
+        with patch("habits.outbox.send_telegram_messages", side_effect=fake_send):
+            yield sent
+
+    def test_send_habit_reminders_sends_message(self):
+        now = timezone.localtime()
+        reminder_time = now.time().replace(second=0, microsecond=0)
+
+        Habit.objects.create(
+            owner=self.user,
+            place="Парк",
+            time=reminder_time,
+            action="Гулять",
+            is_pleasant=False,
+            periodicity=1,
+            execution_time=60,
+        )
+
+        # Мокаем отправку в Telegram
+        with self.capture_telegram() as sent:
+            send_habit_reminders()
+            self.assertTrue(sent)
+            chat_id, text = sent[0]
+            self.assertEqual(chat_id, self.profile.chat_id)
+
+    @override_settings(METRICS_REDIS_URL="")
+    def test_send_habit_reminders_records_due_count(self):
+        reminder_time = timezone.localtime().time().replace(second=0, microsecond=0)
+        for action in ("Гулять", "Читать"):
+            Habit.objects.create(
+                owner=self.user,
+                place="Парк",
+                time=reminder_time,
+                action=action,
+                execution_time=60,
+            )
+        due_before = REMINDERS_DUE.get()
+
+        with self.capture_telegram():
+            send_habit_reminders()
+
+        self.assertEqual(REMINDERS_DUE.get(), due_before + 2)
+
+    def test_send_habit_reminders_skips_users_without_profile(self):
+        reminder_time = timezone.localtime().time().replace(second=0, microsecond=0)
+        stranger = User.objects.create_user(username="user2", password="pass12345")
+        habit = Habit.objects.create(
+            owner=stranger,
+            place="Дом",
+            time=reminder_time,
+            action="Читать",
+            is_pleasant=False,
+            periodicity=1,
+            execution_time=60,
+        )
+
+        with self.capture_telegram() as sent:
+            send_habit_reminders()
+            self.assertFalse(sent)
+
+        habit.refresh_from_db()
+        self.assertIsNone(habit.last_reminder)
+
+    def test_send_habit_reminders_query_count_is_constant(self):
+        reminder_time = timezone.localtime().time().replace(second=0, microsecond=0)
+
+        def create_due_habits(count):
+            for i in range(count):
+                user = User.objects.create(username=f"bulk{User.objects.count()}")
+                TelegramProfile.objects.create(user=user, chat_id=f"chat-{user.pk}")
+                Habit.objects.create(
+                    owner=user,
+                    place=f"Место {i}",
+                    time=reminder_time,
+                    action=f"Действие {i}",
+                    is_pleasant=False,
+                    periodicity=1,
+                    execution_time=60,
+                )
+
+        # Координатор: отметка, пропущенные, id к отправке и сдвиг отметки
+        # (7 с savepoint); шард: SELECT с JOIN владельца и профиля, UPDATE
+        # и INSERT в очередь (5); доставка: захват пачки (4) и отметка
+        # отправленных (4)
+        for count in (1, 20):
+            Habit.objects.all().delete()
+            Watermark.objects.all().delete()
+            create_due_habits(count)
+            with self.capture_telegram() as sent:
+                with self.assertNumQueries(20):
+                    send_habit_reminders()
+            self.assertEqual(len(sent), count)
+            self.assertEqual(
+                Habit.objects.filter(last_reminder=timezone.localdate()).count(),
+                count,
+            )
+
+    def test_send_habit_reminders_respects_periodicity(self):
+        now = timezone.localtime()
+        reminder_time = now.time().replace(second=0, microsecond=0)
+        habit = Habit.objects.create(
+            owner=self.user,
+            place="Спортзал",
+            time=reminder_time,
+            action="Тренировка",
+            is_pleasant=False,
+            periodicity=3,
+            execution_time=60,
+            last_reminder=now.date() - timedelta(days=1),
+        )
+        self.assertEqual(habit.next_reminder_at.date(), now.date() + timedelta(days=2))
+
+        with self.capture_telegram() as sent:
+            send_habit_reminders()
+            self.assertFalse(sent)
+
+    def test_send_habit_reminders_advances_next_reminder_at(self):
+        now = timezone.localtime()
+        reminder_time = now.time().replace(second=0, microsecond=0)
+        habit = Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=reminder_time,
+            action="Медитация",
+            is_pleasant=False,
+            periodicity=2,
+            execution_time=60,
+        )
+        due_at = habit.next_reminder_at
+
+        with self.capture_telegram():
+            send_habit_reminders()
+
+        habit.refresh_from_db()
+        self.assertEqual(habit.last_reminder, now.date())
+        self.assertEqual(habit.next_reminder_at, due_at + timedelta(days=2))
+
+    def test_missed_reminder_is_rescheduled_without_sending(self):
+        now = timezone.localtime()
+        habit = Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=time(6, 0),
+            action="Зарядка",
+            is_pleasant=False,
+            periodicity=1,
+            execution_time=60,
+        )
+        Habit.objects.filter(pk=habit.pk).update(
+            next_reminder_at=habit.next_reminder_at - timedelta(days=3)
+        )
+
+        with self.capture_telegram() as sent:
+            send_habit_reminders()
+            self.assertFalse(sent)
+
+        habit.refresh_from_db()
+        self.assertGreater(habit.next_reminder_at, now)
+        self.assertEqual(habit.next_reminder_at.time(), time(6, 0))
+
+    def test_reminders_are_split_into_shards(self):
+        reminder_time = timezone.localtime().time().replace(second=0, microsecond=0)
+        for i in range(5):
+            Habit.objects.create(
+                owner=self.user,
+                place="Дом",
+                time=reminder_time,
+                action=f"Действие {i}",
+                is_pleasant=False,
+                periodicity=1,
+                execution_time=60,
+            )
+
+        with override_settings(HABIT_REMINDER_SHARD_SIZE=2):
+            with self.capture_telegram() as sent:
+                with self.assertLogs("habits.tasks", level="INFO") as logs:
+                    result = send_habit_reminders()
+
+        self.assertEqual(result["due"], 5)
+        self.assertEqual(result["shards"], 3)
+        # Все пять привычек одного пользователя уходят одним дайджестом
+        self.assertEqual(len(sent), 1)
+        chat_id, text = sent[0]
+        self.assertTrue(text.startswith("Напоминания о привычках:"))
+        for i in range(5):
+            self.assertIn(f"Действие {i}", text)
+        self.assertIn("5 sent in 1 messages (4 saved by digests)", logs.output[-1])
+
+    def test_retried_shard_does_not_send_twice(self):
+        now = timezone.localtime()
+        habit = Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=now.time().replace(second=0, microsecond=0),
+            action="Зарядка",
+            is_pleasant=False,
+            periodicity=1,
+            execution_time=60,
+        )
+        slot_start = now.replace(second=0, microsecond=0)
+        window = (slot_start.isoformat(), (slot_start + timedelta(minutes=1)).isoformat())
+
+        first = send_habit_reminders_shard([habit.pk], *window)
+        second = send_habit_reminders_shard([habit.pk], *window)
+
+        self.assertEqual(first["claimed"], 1)
+        self.assertEqual(second["claimed"], 0)
+        self.assertEqual(NotificationOutbox.objects.filter(habit=habit).count(), 1)
+
+    def test_late_tick_catches_up_from_watermark(self):
+        now = timezone.localtime()
+        slot_start = now.replace(second=0, microsecond=0)
+        Watermark.objects.create(
+            name=REMINDER_WATERMARK,
+            value=slot_start - timedelta(minutes=10),
+        )
+        habit = Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=time(6, 0),
+            action="Зарядка",
+            is_pleasant=False,
+            periodicity=1,
+            execution_time=60,
+        )
+        # Тик пять минут назад не отработал
+        missed_at = slot_start - timedelta(minutes=5)
+        Habit.objects.filter(pk=habit.pk).update(next_reminder_at=missed_at)
+
+        with self.capture_telegram() as sent:
+            result = send_habit_reminders()
+
+        self.assertEqual(result["due"], 1)
+        self.assertEqual(len(sent), 1)
+        habit.refresh_from_db()
+        self.assertEqual(habit.next_reminder_at, missed_at + timedelta(days=1))
+        self.assertEqual(
+            Watermark.objects.get(name=REMINDER_WATERMARK).value,
+            slot_start + timedelta(minutes=1),
+        )
+
+    @override_settings(HABIT_REMINDER_MAX_LOOKBACK=60)
+    def test_reminders_older_than_lookback_are_not_sent(self):
+        now = timezone.localtime()
+        slot_start = now.replace(second=0, microsecond=0)
+        Watermark.objects.create(
+            name=REMINDER_WATERMARK,
+            value=slot_start - timedelta(hours=3),
+        )
+        habit = Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=time(6, 0),
+            action="Зарядка",
+            is_pleasant=False,
+            periodicity=1,
+            execution_time=60,
+        )
+        missed_at = slot_start - timedelta(hours=2)
+        Habit.objects.filter(pk=habit.pk).update(next_reminder_at=missed_at)
+
+        with self.capture_telegram() as sent:
+            with self.assertLogs("habits.tasks", level="WARNING"):
+                send_habit_reminders()
+
+        self.assertFalse(sent)
+        habit.refresh_from_db()
+        self.assertGreater(habit.next_reminder_at, now)
+
+    @override_settings(HABIT_REMINDER_MAX_LOOKBACK=60, HABIT_REMINDER_SCHEDULER="event")
+    def test_event_tick_after_quiet_period_is_not_reported_as_lag(self):
+        slot_start = timezone.localtime().replace(second=0, microsecond=0)
+        Watermark.objects.create(
+            name=REMINDER_WATERMARK,
+            value=slot_start - timedelta(hours=3),
+        )
+
+        with self.capture_telegram():
+            with self.assertNoLogs("habits.tasks", level="WARNING"):
+                send_habit_reminders()
+
+    def test_repeated_tick_in_same_minute_sends_nothing(self):
+        Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=timezone.localtime().time().replace(second=0, microsecond=0),
+            action="Зарядка",
+            is_pleasant=False,
+            periodicity=1,
+            execution_time=60,
+        )
+        with self.capture_telegram() as sent:
+            send_habit_reminders()
+            second = send_habit_reminders()
+
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(second["due"], 0)
+
+    def test_failed_delivery_does_not_stamp_last_reminder(self):
+        now = timezone.localtime()
+        habit = Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=now.time().replace(second=0, microsecond=0),
+            action="Зарядка",
+            is_pleasant=False,
+            periodicity=1,
+            execution_time=60,
+        )
+
+        failed = [SendResult(chat_id=self.profile.chat_id, ok=False, status_code=502)]
+        with patch("habits.outbox.send_telegram_messages", return_value=failed):
+            send_habit_reminders()
+
+        habit.refresh_from_db()
+        self.assertIsNone(habit.last_reminder)
+        notification = NotificationOutbox.objects.get(habit=habit)
+        self.assertEqual(notification.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(notification.attempts, 1)
+
+
+class HabitTimezoneTests(TestCase):
+    def setUp(self):
+        conf = celery_app.conf
+        self.addCleanup(
+            conf.update,
+            task_always_eager=conf.task_always_eager,
+            task_eager_propagates=conf.task_eager_propagates,
+        )
+        conf.update(task_always_eager=True, task_eager_propagates=True)
+        self.user = User.objects.create_user(username="tz", password="pass12345")
+
+    def create_habit(self, habit_time):
+        return Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=habit_time,
+            action="Зарядка",
+            is_pleasant=False,
+            periodicity=1,
+            execution_time=60,
+        )
+
+    def test_schedule_uses_owner_utc_offset(self):
+        TelegramProfile.objects.create(
+            user=self.user, chat_id="500", timezone="Asia/Yekaterinburg", utc_offset=300
+        )
+        habit = self.create_habit(time(8, 0))
+
+        next_at = habit.next_reminder_at.astimezone(dt_timezone.utc)
+        self.assertEqual(next_at.time(), time(3, 0))
+
+    def test_tick_sends_reminder_in_user_timezone(self):
+        TelegramProfile.objects.create(
+            user=self.user, chat_id="180", timezone="Europe/Moscow", utc_offset=180
+        )
+        local_now = timezone.now().astimezone(dt_timezone(timedelta(hours=3)))
+        habit = self.create_habit(local_now.time().replace(second=0, microsecond=0))
+
+        sent = []
+
+        def fake_send(messages):
+            sent.extend(messages)
+            return [SendResult(chat_id=chat_id, ok=True) for chat_id, _text in messages]
+
+        with patch("habits.outbox.send_telegram_messages", side_effect=fake_send):
+            send_habit_reminders()
+
+        self.assertEqual([chat_id for chat_id, _text in sent], ["180"])
+        habit.refresh_from_db()
+        self.assertEqual(habit.last_reminder, local_now.date())
+
+    def test_dst_transition_shifts_schedule_in_bulk(self):
+        profile = TelegramProfile.objects.create(
+            user=self.user, chat_id="ny", timezone="America/New_York", utc_offset=-300
+        )
+        habit = self.create_habit(time(8, 0))
+        due_at = habit.next_reminder_at
+
+        summer = datetime(2026, 7, 1, 12, 0, tzinfo=dt_timezone.utc)
+        with self.assertNumQueries(5):
+            self.assertEqual(apply_utc_offset_changes(summer), 1)
+
+        habit.refresh_from_db()
+        profile.refresh_from_db()
+        self.assertEqual(profile.utc_offset, -240)
+        self.assertEqual(habit.next_reminder_at, due_at - timedelta(hours=1))
+        # Повторный запуск ничего не меняет
+        self.assertEqual(apply_utc_offset_changes(summer), 0)
+
+
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user1", password="pass12345")
+        self.profile = TelegramProfile.objects.create(user=self.user, chat_id="100")
+        self.habit = Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=time(8, 0),
+            action="Зарядка",
+            is_pleasant=False,
+            periodicity=1,
+            execution_time=60,
+        )
+        self.habit = Habit.objects.select_related("owner__telegram_profile").get(
+            pk=self.habit.pk
+        )
+
+    def deliver(self, *results):
+        with patch("habits.outbox.send_telegram_messages", return_value=list(results)):
+            return deliver_outbox_batch()
+
+    def get_notification(self):
+        return NotificationOutbox.objects.get(habit=self.habit)
+
+    def test_same_habit_and_date_is_queued_once(self):
+        enqueue_reminders([(self.habit, "text")])
+        enqueue_reminders([(self.habit, "text")])
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+
+    def test_successful_delivery_marks_sent_and_stamps_habit(self):
+        enqueue_reminders([(self.habit, "text")])
+        stats = self.deliver(SendResult(chat_id="100", ok=True, status_code=200))
+
+        self.assertEqual(stats["sent"], 1)
+        notification = self.get_notification()
+        self.assertEqual(notification.status, NotificationOutbox.STATUS_SENT)
+        self.assertIsNotNone(notification.sent_at)
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.last_reminder, notification.reminder_date)
+
+    def test_failure_is_retried_with_exponential_backoff(self):
+        enqueue_reminders([(self.habit, "text")])
+        failure = SendResult(chat_id="100", ok=False, status_code=502, error="Bad Gateway")
+
+        before = timezone.now()
+        self.deliver(failure)
+        notification = self.get_notification()
+        self.assertEqual(notification.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(notification.attempts, 1)
+        self.assertEqual(notification.last_error, "Bad Gateway")
+        self.assertGreaterEqual(notification.next_attempt_at, before + timedelta(seconds=30))
+
+        # Не созревшие строки не забираются
+        self.assertEqual(self.deliver()["claimed"], 0)
+
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+        before = timezone.now()
+        self.deliver(failure)
+        notification = self.get_notification()
+        self.assertEqual(notification.attempts, 2)
+        self.assertGreaterEqual(notification.next_attempt_at, before + timedelta(seconds=60))
+
+    @override_settings(NOTIFICATION_OUTBOX_MAX_ATTEMPTS=2)
+    def test_dead_letter_after_max_attempts(self):
+        enqueue_reminders([(self.habit, "text")])
+        failure = SendResult(chat_id="100", ok=False, status_code=502)
+        self.deliver(failure)
+        NotificationOutbox.objects.update(next_attempt_at=timezone.now())
+        stats = self.deliver(failure)
+
+        self.assertEqual(stats["dead"], 1)
+        self.assertEqual(self.get_notification().status, NotificationOutbox.STATUS_DEAD)
+
+    def test_permanent_error_goes_to_dead_letter_immediately(self):
+        enqueue_reminders([(self.habit, "text")])
+        self.deliver(SendResult(chat_id="100", ok=False, status_code=403, error="blocked"))
+        self.assertEqual(self.get_notification().status, NotificationOutbox.STATUS_DEAD)
+
+    def test_single_reminder_is_sent_as_is(self):
+        enqueue_reminders([(self.habit, "Зарядка в 08:00 в месте: Дом")])
+        digests = build_digests(NotificationOutbox.objects.all())
+        self.assertEqual(len(digests), 1)
+        self.assertEqual(
+            format_digest(digests[0][1]),
+            "Напоминание о привычке:\nЗарядка в 08:00 в месте: Дом",
+        )
+
+    def test_digest_groups_by_chat_and_respects_length_limit(self):
+        other = User.objects.create_user(username="user2", password="pass12345")
+        TelegramProfile.objects.create(user=other, chat_id="200")
+        habits = []
+        for owner in (self.user, other):
+            for i in range(30):
+                habits.append(
+                    Habit.objects.create(
+                        owner=owner,
+                        place="П" * 200,
+                        time=time(8, 0),
+                        action=f"Действие {i}",
+                        is_pleasant=False,
+                        periodicity=1,
+                        execution_time=60,
+                    )
+                )
+        habits = Habit.objects.filter(pk__in=[h.pk for h in habits]).select_related(
+            "owner__telegram_profile"
+        )
+        enqueue_reminders((habit, f"{habit.action}: {habit.place}") for habit in habits)
+
+        digests = build_digests(NotificationOutbox.objects.order_by("pk"))
+        chats = [chat_id for chat_id, _rows in digests]
+        # 30 строк по ~215 символов не влезают в 4096: по два сообщения на чат
+        self.assertEqual(sorted(chats), ["100", "100", "200", "200"])
+        for chat_id, rows in digests:
+            self.assertLessEqual(len(format_digest(rows)), TELEGRAM_MESSAGE_LIMIT)
+        self.assertEqual(sum(len(rows) for _chat, rows in digests), 60)
+
+        sent = []
+
+        def fake_send(messages):
+            sent.extend(messages)
+            return [SendResult(chat_id=chat_id, ok=True) for chat_id, _text in messages]
+
+        messages_before = REMINDER_MESSAGES.get()
+        saved_before = REMINDER_MESSAGES_SAVED.get()
+        with patch("habits.outbox.send_telegram_messages", side_effect=fake_send):
+            stats = deliver_outbox_batch()
+        self.assertEqual(stats["sent"], 60)
+        self.assertEqual(stats["messages"], 4)
+        self.assertEqual(stats["saved"], 56)
+        self.assertEqual(len(sent), 4)
+        # Экономия от дайджестов видна на /metrics
+        self.assertEqual(REMINDER_MESSAGES.get() - messages_before, 4)
+        self.assertEqual(REMINDER_MESSAGES_SAVED.get() - saved_before, 56)
+
+    def test_rate_limited_message_waits_without_spending_attempt(self):
+        enqueue_reminders([(self.habit, "text")])
+        before = timezone.now()
+        self.deliver(SendResult(chat_id="100", ok=False, status_code=429, retry_after=12))
+
+        notification = self.get_notification()
+        self.assertEqual(notification.status, NotificationOutbox.STATUS_PENDING)
+        self.assertEqual(notification.attempts, 0)
+        self.assertGreaterEqual(notification.next_attempt_at, before + timedelta(seconds=12))
+
+    @override_settings(NOTIFICATION_OUTBOX_RETENTION_DAYS=7)
+    def test_purge_keeps_pending_and_recent_rows(self):
+        today = timezone.localdate()
+        old = today - timedelta(days=8)
+        recent = today - timedelta(days=1)
+        rows = {
+            "old-sent": (old, NotificationOutbox.STATUS_SENT),
+            "old-dead": (old, NotificationOutbox.STATUS_DEAD),
+            "old-pending": (old, NotificationOutbox.STATUS_PENDING),
+            "recent-sent": (recent, NotificationOutbox.STATUS_SENT),
+        }
+        for dedup_key, (reminder_date, status) in rows.items():
+            NotificationOutbox.objects.create(
+                habit=self.habit,
+                chat_id="100",
+                text="text",
+                reminder_date=reminder_date,
+                dedup_key=dedup_key,
+                status=status,
+            )
+
+        self.assertEqual(purge_notification_outbox(), 2)
+        self.assertEqual(
+            set(NotificationOutbox.objects.values_list("dedup_key", flat=True)),
+            {"old-pending", "recent-sent"},
+        )
+
+
+class TelegramClientTests(SimpleTestCase):
+    def make_client(self, api, **kwargs):
+        client = TelegramClient(token="test-token", api_url=api.url, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_send_message_posts_to_bot_api(self):
+        with FakeBotAPI() as api:
+            result = self.make_client(api).send_message("42", "Привет")
+
+        self.assertTrue(result.ok)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(api.requests[0]["path"], "/bottest-token/sendMessage")
+        self.assertEqual(api.requests[0]["payload"], {"chat_id": "42", "text": "Привет"})
+
+    def test_connection_is_reused(self):
+        with FakeBotAPI() as api:
+            client = self.make_client(api)
+            for i in range(5):
+                client.send_message(str(i), "text")
+
+        self.assertEqual(len(api.requests), 5)
+        self.assertEqual(len(api.connections), 1)
+
+    def test_batch_is_sent_concurrently(self):
+        with FakeBotAPI(delay=0.2) as api:
+            client = self.make_client(api, max_workers=8)
+            started = time_module.monotonic()
+            results = client.send_messages([(str(i), "text") for i in range(8)])
+            elapsed = time_module.monotonic() - started
+
+        self.assertEqual([result.chat_id for result in results], [str(i) for i in range(8)])
+        self.assertTrue(all(result.ok for result in results))
+        self.assertLess(elapsed, 1.0)
+
+    def test_errors_are_reported_per_message(self):
+        def responder(payload):
+            if payload["chat_id"] == "blocked":
+                return 403, {
+                    "ok": False,
+                    "error_code": 403,
+                    "description": "Forbidden: bot was blocked by the user",
+                }
+            return ok_responder(payload)
+
+        with FakeBotAPI(responder=responder) as api:
+            results = self.make_client(api).send_messages(
+                [("1", "text"), ("blocked", "text")]
+            )
+
+        self.assertTrue(results[0].ok)
+        self.assertFalse(results[1].ok)
+        self.assertEqual(results[1].status_code, 403)
+        self.assertIn("blocked", results[1].error)
+
+    def test_send_latency_and_failures_are_recorded(self):
+        def responder(payload):
+            if payload["chat_id"] == "blocked":
+                return 403, {"ok": False, "description": "Forbidden"}
+            return ok_responder(payload)
+
+        sent_before = TELEGRAM_SEND_DURATION.get(outcome="ok")[0]
+        failed_before = TELEGRAM_SEND_FAILURES.get(reason="http_403")
+        with FakeBotAPI(responder=responder) as api:
+            self.make_client(api).send_messages([("1", "text"), ("blocked", "text")])
+
+        self.assertEqual(TELEGRAM_SEND_DURATION.get(outcome="ok")[0], sent_before + 1)
+        self.assertEqual(TELEGRAM_SEND_FAILURES.get(reason="http_403"), failed_before + 1)
+
+    def test_network_error_is_reported(self):
+        api = FakeBotAPI().start()
+        url = api.url
+        api.stop()
+
+        client = TelegramClient(token="test-token", api_url=url, timeout=1)
+        self.addCleanup(client.close)
+        result = client.send_message("1", "text")
+        self.assertFalse(result.ok)
+        self.assertIsNone(result.status_code)
+        self.assertTrue(result.error)
+
+    def test_rate_limited_client_does_not_hit_api(self):
+        limiter = LocalRateLimiter(global_rate=30, chat_rate=1)
+        with FakeBotAPI() as api:
+            client = self.make_client(api, limiter=limiter, max_rate_limit_wait=0)
+            first = client.send_message("42", "text")
+            second = client.send_message("42", "text")
+            other = client.send_message("43", "text")
+
+        self.assertTrue(first.ok)
+        self.assertFalse(second.ok)
+        self.assertGreater(second.retry_after, 0)
+        self.assertTrue(other.ok)
+        self.assertEqual(len(api.requests), 2)
+
+    def test_429_retry_after_blocks_chat(self):
+        def responder(payload):
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 7",
+                "parameters": {"retry_after": 7},
+            }
+
+        limiter = LocalRateLimiter(global_rate=30, chat_rate=30)
+        with FakeBotAPI(responder=responder) as api:
+            client = self.make_client(api, limiter=limiter, max_rate_limit_wait=0)
+            result = client.send_message("42", "text")
+            blocked = client.send_message("42", "text")
+
+        self.assertEqual(result.status_code, 429)
+        self.assertEqual(result.retry_after, 7)
+        self.assertIsNone(blocked.status_code)
+        self.assertGreater(blocked.retry_after, 6)
+        self.assertEqual(len(api.requests), 1)
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_local_limiter_enforces_per_chat_and_global_rate(self):
+        limiter = LocalRateLimiter(global_rate=2, chat_rate=1)
+        self.assertEqual(limiter.acquire("a"), 0)
+        self.assertGreater(limiter.acquire("a"), 0)
+        self.assertEqual(limiter.acquire("b"), 0)
+        # Общий бюджет (2 в секунду) исчерпан даже для нового чата
+        self.assertGreater(limiter.acquire("c"), 0)
+
+    def test_local_limiter_block(self):
+        limiter = LocalRateLimiter(global_rate=30, chat_rate=30)
+        limiter.block("a", 5)
+        self.assertGreater(limiter.acquire("a"), 4)
+        self.assertEqual(limiter.acquire("b"), 0)
+
+    @skipUnless(redis_available(), "Redis недоступен")
+    def test_redis_limiter_shares_state_between_instances(self):
+        url = settings.TELEGRAM_RATE_LIMIT_REDIS_URL
+        first = RedisRateLimiter(url, global_rate=30, chat_rate=1)
+        second = RedisRateLimiter(url, global_rate=30, chat_rate=1)
+        chat_id = f"test-{time_module.time()}"
+
+        self.assertEqual(first.acquire(chat_id), 0)
+        self.assertGreater(second.acquire(chat_id), 0)
+
+    @skipUnless(redis_available(), "Redis недоступен")
+    def test_redis_limiter_keeps_longer_block_ttl(self):
+        limiter = RedisRateLimiter(
+            settings.TELEGRAM_RATE_LIMIT_REDIS_URL, global_rate=30, chat_rate=1
+        )
+        chat_id = f"test-{time_module.time()}"
+        key = CHAT_KEY.format(chat_id)
+
+        limiter.block(chat_id, 300)
+        limiter.block(chat_id, 1)
+
+        self.assertGreater(limiter.client.ttl(key), 300)
+
+
+class ReminderSchedulerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user1", password="pass12345")
+        self.now = timezone.now().replace(second=0, microsecond=0)
+        self.dispatched = []
+        self.scheduler = ReminderScheduler(
+            dispatch=lambda: self.dispatched.append(True),
+            horizon=120,
+            reload_interval=3600,
+        )
+
+    def create_habit(self, next_reminder_at, **kwargs):
+        habit = Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=time(8, 0),
+            action="Зарядка",
+            periodicity=1,
+            execution_time=60,
+            **kwargs,
+        )
+        Habit.objects.filter(pk=habit.pk).update(next_reminder_at=next_reminder_at)
+        return habit
+
+    def test_load_keeps_distinct_minutes_within_horizon(self):
+        in_ten = self.now + timedelta(minutes=10)
+        self.create_habit(in_ten)
+        self.create_habit(in_ten + timedelta(seconds=30))
+        self.create_habit(self.now + timedelta(minutes=45))
+        self.create_habit(self.now + timedelta(hours=5))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.scheduler.load(self.now), 2)
+        self.assertEqual(self.scheduler.next_wakeup(), in_ten)
+        self.assertEqual(
+            self.scheduler.seconds_until_next(self.now),
+            timedelta(minutes=10).total_seconds(),
+        )
+
+    def test_run_pending_dispatches_one_tick_for_due_minutes(self):
+        self.create_habit(self.now + timedelta(minutes=1))
+        self.create_habit(self.now + timedelta(minutes=2))
+        self.create_habit(self.now + timedelta(minutes=30))
+        self.scheduler.load(self.now)
+
+        self.assertEqual(self.scheduler.run_pending(self.now), 0)
+        self.assertFalse(self.dispatched)
+
+        self.assertEqual(self.scheduler.run_pending(self.now + timedelta(minutes=5)), 2)
+        self.assertEqual(len(self.dispatched), 1)
+        self.assertEqual(self.scheduler.next_wakeup(), self.now + timedelta(minutes=30))
+
+    def test_idle_scheduler_sleeps_until_reload(self):
+        self.scheduler.load(self.now)
+        self.assertIsNone(self.scheduler.next_wakeup())
+        self.assertEqual(self.scheduler.seconds_until_next(self.now), 3600)
+
+    def test_habit_changes_wake_registered_scheduler(self):
+        self.scheduler.load(self.now)
+        register_local_scheduler(self.scheduler)
+        self.addCleanup(unregister_local_scheduler, self.scheduler)
+
+        soon = (timezone.localtime() + timedelta(minutes=3)).replace(second=0, microsecond=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            habit = Habit.objects.create(
+                owner=self.user,
+                place="Дом",
+                time=soon.time(),
+                action="Зарядка",
+                periodicity=1,
+                execution_time=60,
+            )
+        self.assertEqual(self.scheduler.next_wakeup(), habit.next_reminder_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            habit.delete()
+        self.assertTrue(self.scheduler.needs_reload(self.now))
@@ -0,0 +1,218 @@
+"""
+Потоковый экспорт и импорт привычек пользователя в NDJSON и CSV.
+
+Экспорт читает строки курсором (iterator) и отдаёт их по одной, импорт
+разбирает тело запроса построчно и пишет пачками через bulk_create,
+поэтому память не зависит от размера аккаунта.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cache import bump_public_feed_version
+from .models import Habit
+from .scheduler import publish_schedule_change
+from .serializers import BulkHabitSerializer
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+CONTENT_TYPES = {
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_CSV: "text/csv",
+}
+
+# id нужен, чтобы при импорте восстановить ссылки related_habit
+EXPORT_FIELDS = (
+    "id",
+    "place",
+    "time",
+    "action",
+    "is_pleasant",
+    "related_habit",
+    "periodicity",
+    "reward",
+    "execution_time",
+    "is_public",
+)
+# Пустая ячейка CSV в этих полях означает null
+NULLABLE_FIELDS = ("related_habit", "reward")
+# Сколько ошибок импорта возвращать клиенту
+MAX_REPORTED_ERRORS = 100
+
+
+def get_export_queryset(user):
+    # Приятные привычки первыми: на них ссылаются related_habit остальных
+    return (
+        Habit.objects.filter(owner=user)
+        .order_by("-is_pleasant", "id")
+        .values_list(*[
+            "related_habit_id" if field == "related_habit" else field
+            for field in EXPORT_FIELDS
+        ])
+    )
+
+
+def iter_export_rows(user):
+    chunk_size = settings.HABIT_EXPORT_CHUNK_SIZE
+    for row in get_export_queryset(user).iterator(chunk_size=chunk_size):
+        yield dict(zip(EXPORT_FIELDS, row))
+
+
+def iter_ndjson(user):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in iter_export_rows(user):
+        yield encoder.encode(row) + "\n"
+
+
+class Echo:
+    """Файл для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(user):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in iter_export_rows(user):
+        yield writer.writerow(
+            "" if row[field] is None else row[field] for field in EXPORT_FIELDS
+        )
+
+
+def iter_export(user, export_format):
+    if export_format == FORMAT_CSV:
+        return iter_csv(user)
+    return iter_ndjson(user)
+
+
+def decode_lines(stream):
+    """Строки тела запроса (байты) в текст без чтения тела целиком."""
+    for raw in stream:
+        yield raw.decode("utf-8")
+
+
+def parse_lines(lines, import_format):
+    """
+    Разбирает строки в пары (номер строки, словарь или текст ошибки).
+    Пустые строки NDJSON пропускаются.
+    """
+    if import_format == FORMAT_CSV:
+        reader = csv.DictReader(lines)
+        for item in reader:
+            for field in NULLABLE_FIELDS:
+                if item.get(field) == "":
+                    item[field] = None
+            yield reader.line_num, item
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as exc:
+            yield number, str(exc)
+
+
+class HabitImporter:
+    """
+    Импорт потока привычек. related_habit в файле — id из экспорта:
+    приятные привычки запоминаются по старому id после вставки, и ссылки
+    остальных переводятся на новые строки.
+    """
+
+    def __init__(self, user, batch_size=None):
+        self.user = user
+        self.batch_size = batch_size or settings.HABIT_IMPORT_BATCH_SIZE
+        self.context = {
+            "habits": {},
+            "utc_offset": Habit(owner=user).get_utc_offset(),
+        }
+        # Поля сериализатора строятся один раз, а не на каждую строку
+        self.serializer = BulkHabitSerializer(context=self.context)
+        self.pending = []
+        self.pending_ids = set()
+        self.created = 0
+        self.errors = []
+        self.error_count = 0
+        self.touches_public = False
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "errors": errors})
+
+    def flush(self):
+        if not self.pending:
+            return
+        habits = [habit for _old_id, habit in self.pending]
+        Habit.objects.bulk_create(habits)
+        for old_id, habit in self.pending:
+            # Сослаться можно только на приятную привычку
+            if old_id is not None and habit.is_pleasant:
+                self.context["habits"][old_id] = habit
+        self.created += len(habits)
+        self.pending = []
+        self.pending_ids = set()
+
+    def add(self, line, item):
+        if isinstance(item, str):
+            self.add_error(line, {"non_field_errors": [item]})
+            return
+        if not isinstance(item, dict):
+            self.add_error(line, {"non_field_errors": ["Ожидался объект привычки."]})
+            return
+        old_id = item.pop("id", None)
+        try:
+            old_id = int(old_id) if old_id not in (None, "") else None
+        except (TypeError, ValueError):
+            old_id = None
+        related = item.get("related_habit")
+        if related is not None and str(related) in self.pending_ids:
+            # Привычка-награда ещё в текущей пачке: вставляем пачку сначала
+            self.flush()
+
+        try:
+            validated = dict(self.serializer.run_validation(item))
+        except ValidationError as exc:
+            self.add_error(line, exc.detail)
+            return
+        validated["owner"] = self.user
+        self.serializer.set_next_reminder_at(validated)
+        habit = Habit(**validated)
+        self.touches_public |= habit.is_public
+        self.pending.append((old_id, habit))
+        if old_id is not None:
+            self.pending_ids.add(str(old_id))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def run(self, lines, import_format):
+        line = 0
+        try:
+            for line, item in parse_lines(lines, import_format):
+                self.add(line, item)
+        except (ValueError, csv.Error) as exc:
+            # Битая кодировка или CSV: дальше поток не разобрать
+            self.add_error(line + 1, {"non_field_errors": [str(exc)]})
+        self.flush()
+
+        # bulk_create не вызывает сигналы
+        if self.touches_public:
+            bump_public_feed_version()
+        if self.created:
+            publish_schedule_change(timezone.now(), reload=True)
+        return {
+            "created": self.created,
+            "failed": self.error_count,
+            "errors": self.errors,
+        }
+
+
+def import_habits(user, lines, import_format, batch_size=None):
+    return HabitImporter(user, batch_size).run(lines, import_format)
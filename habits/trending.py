@@ -0,0 +1,174 @@
+"""
+Популярные публичные привычки.
+
+GROUP BY по всем публичным привычкам на каждый запрос слишком дорог, поэтому
+рейтинг хранится готовым в TrendingHabit, а задача refresh_trending_habits
+поддерживает его по приращениям: берёт только привычки, изменённые после
+прошлого запуска (индекс по updated_at), и сравнивает их с тем, куда они
+засчитаны в TrendingHabitMember. Удалённые привычки находятся по
+обнулённой ссылке в TrendingHabitMember.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Habit, TrendingHabit, TrendingHabitMember, Watermark
+
+TRENDING_WATERMARK = "trending-habits"
+# Отметка первого запуска: рейтинг строится по всем публичным привычкам
+NEVER = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def normalize_text(value) -> str:
+    """Регистр, ё/е, лишние пробелы и точка в конце не различают привычки."""
+    return " ".join(value.casefold().replace("ё", "е").split()).rstrip(".! ")
+
+
+def get_trend_key(action, place):
+    return normalize_text(action), normalize_text(place)
+
+
+def get_trend_ids(display):
+    """
+    id строк TrendingHabit по ключам display (ключ → написание action, place);
+    недостающие строки создаются.
+    """
+    if not display:
+        return {}
+    action_keys = {action_key for action_key, _place_key in display}
+    place_keys = {place_key for _action_key, place_key in display}
+
+    def fetch():
+        rows = TrendingHabit.objects.filter(
+            action_key__in=action_keys, place_key__in=place_keys
+        ).values_list("action_key", "place_key", "pk")
+        return {(action_key, place_key): pk for action_key, place_key, pk in rows}
+
+    trend_ids = fetch()
+    missing = display.keys() - trend_ids.keys()
+    if missing:
+        TrendingHabit.objects.bulk_create(
+            [
+                TrendingHabit(
+                    action_key=key[0],
+                    place_key=key[1],
+                    action=display[key][0],
+                    place=display[key][1],
+                )
+                for key in missing
+            ],
+            ignore_conflicts=True,
+        )
+        trend_ids = fetch()
+    return {key: trend_ids[key] for key in display}
+
+
+def apply_changed_habits(rows, deltas):
+    """
+    Переносит пачку изменённых привычек (pk, action, place, is_public)
+    в TrendingHabitMember и копит приращения счётчиков в deltas.
+    """
+    members = {
+        habit_id: (member_id, trend_id)
+        for habit_id, member_id, trend_id in TrendingHabitMember.objects.filter(
+            habit_id__in=[row[0] for row in rows]
+        ).values_list("habit_id", "pk", "trend_id")
+    }
+    keys = {pk: get_trend_key(action, place) for pk, action, place, is_public in rows if is_public}
+    display = {}
+    for pk, action, place, is_public in rows:
+        if is_public:
+            display.setdefault(keys[pk], (action.strip(), place.strip()))
+    trend_ids = get_trend_ids(display)
+
+    created, moved, removed = [], [], []
+    for pk, _action, _place, _is_public in rows:
+        member_id, current = members.get(pk, (None, None))
+        target = trend_ids[keys[pk]] if pk in keys else None
+        if target == current:
+            continue
+        if current is not None:
+            deltas[current] -= 1
+        if target is not None:
+            deltas[target] += 1
+        if member_id is None:
+            created.append(TrendingHabitMember(habit_id=pk, trend_id=target))
+        elif target is None:
+            removed.append(member_id)
+        else:
+            moved.append(TrendingHabitMember(pk=member_id, trend_id=target))
+    TrendingHabitMember.objects.bulk_create(created)
+    TrendingHabitMember.objects.bulk_update(moved, ["trend"])
+    TrendingHabitMember.objects.filter(pk__in=removed).delete()
+    return len(created) + len(moved) + len(removed)
+
+
+def drop_deleted_habits(deltas):
+    """Вычитает привычки, удалённые после прошлого запуска."""
+    orphans = list(
+        TrendingHabitMember.objects.filter(habit__isnull=True).values_list("pk", "trend_id")
+    )
+    for _member_id, trend_id in orphans:
+        deltas[trend_id] -= 1
+    TrendingHabitMember.objects.filter(pk__in=[member_id for member_id, _trend in orphans]).delete()
+    return len(orphans)
+
+
+def apply_deltas(deltas):
+    """Один UPDATE на каждое значение приращения; опустевшие строки удаляются."""
+    by_delta = defaultdict(list)
+    for trend_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(trend_id)
+    for delta, trend_ids in by_delta.items():
+        TrendingHabit.objects.filter(pk__in=trend_ids).update(
+            habits_count=F("habits_count") + delta,
+            updated_at=timezone.now(),
+        )
+    TrendingHabit.objects.filter(pk__in=list(deltas), habits_count=0).delete()
+
+
+def refresh_trending(now=None):
+    """
+    Приращение рейтинга с прошлого запуска. Окно перекрывается на
+    HABIT_CHANGES_OVERLAP секунд, как у дельта-синхронизации: привычка,
+    попавшая в окно повторно, уже учтена и ничего не меняет.
+    """
+    now = now or timezone.now()
+    chunk_size = settings.HABIT_TRENDING_CHUNK_SIZE
+    Watermark.objects.get_or_create(name=TRENDING_WATERMARK, defaults={"value": NEVER})
+    with transaction.atomic():
+        # Блокировка отметки не даёт двум запускам засчитать одно и то же
+        watermark = Watermark.objects.select_for_update().get(name=TRENDING_WATERMARK)
+        since = watermark.value - timedelta(seconds=settings.HABIT_CHANGES_OVERLAP)
+        rows = (
+            Habit.objects.filter(updated_at__gt=since)
+            .filter(Q(is_public=True) | Q(trending_member__isnull=False))
+            .order_by()
+            .values_list("pk", "action", "place", "is_public")
+            .iterator(chunk_size=chunk_size)
+        )
+        deltas = Counter()
+        changed = 0
+        while chunk := list(islice(rows, chunk_size)):
+            changed += apply_changed_habits(chunk, deltas)
+        deleted = drop_deleted_habits(deltas)
+        apply_deltas(deltas)
+        watermark.value = now
+        watermark.save(update_fields=["value", "updated_at"])
+    return {
+        "changed": changed,
+        "deleted": deleted,
+        "trends": sum(1 for delta in deltas.values() if delta),
+    }
+
+
+def get_trending(limit):
+    """Верх рейтинга по индексу (-habits_count, id): один запрос с LIMIT."""
+    return TrendingHabit.objects.filter(habits_count__gt=0).order_by("-habits_count", "id")[:limit]
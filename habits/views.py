@@ -1,9 +1,54 @@
-from rest_framework import viewsets, permissions
-from rest_framework.pagination import PageNumberPagination
+from contextlib import nullcontext
 
+from django.conf import settings
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import permissions, status, viewsets
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from config.db_router import (
+    is_pinned_to_primary,
+    pin_to_primary,
+    read_from_replica,
+    replica_configured,
+)
+from config.metrics import measure_serialization
+
+from .bulk import sync_habits
+from .cache import (
+    get_public_feed_cache_key,
+    make_etag,
+    public_feed_cache_enabled,
+    public_feed_changed_within,
+    set_public_feed_page,
+)
+from .changes import (
+    TokenExpired,
+    get_changes,
+    get_last_modified,
+    make_list_etag,
+    parse_token,
+)
+from .completions import get_habit_stats, get_local_today, record_completions
 from .models import Habit
 from .permissions import IsOwnerHabit
-from .serializers import HabitSerializer
+from .search import MAX_QUERY_LENGTH, search_habits
+from .serializers import (
+    HabitSerializer,
+    PublicHabitSerializer,
+    TrendingHabitSerializer,
+    get_row_serializer,
+    get_source_columns,
+)
+from .transfer import CONTENT_TYPES, decode_lines, import_habits, iter_export
+from .trending import get_trending
 
 
 class HabitPagination(PageNumberPagination):
@@ -12,25 +57,440 @@ class HabitPagination(PageNumberPagination):
     max_page_size = 50
 
 
-class HabitViewSet(viewsets.ModelViewSet):
+class HabitCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация: страница выбирается по индексу (…, created_at) без
+    COUNT и OFFSET, поэтому глубокие страницы не дороже первой.
+    """
+    page_size = 5
+    page_size_query_param = "page_size"
+    max_page_size = 50
+    ordering = ("-created_at", "id")
+
+
+class HabitSearchPagination(CursorPagination):
+    """
+    Выдача поиска: лучшие совпадения первыми (search_rank «меньше — лучше»),
+    страницы — keyset по рангу, равные ранги добираются смещением.
+    """
+    page_size = 5
+    page_size_query_param = "page_size"
+    max_page_size = 50
+    ordering = ("search_rank", "-id")
+
+
+class SwitchablePaginationMixin:
+    """
+    По умолчанию — постраничная пагинация для старых клиентов;
+    ?pagination=cursor (или уже полученный cursor) включает keyset-режим.
+    """
+    cursor_pagination_class = HabitCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            params = self.request.query_params
+            if "cursor" in params or params.get("pagination") == "cursor":
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+
+class ReplicaReadMixin:
+    """
+    GET/HEAD читают с реплики, если она настроена. Пользователь, который
+    недавно что-то записал, читает с основной БД (pin_to_primary), как и
+    действия из primary_actions, которым нельзя отставать от записи.
+    """
+    primary_actions = ()
+    _replica_reads = None
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Даже если исключение не превратилось в ответ, следующий
+            # запрос этого потока не должен читать с реплики
+            if self._replica_reads is not None:
+                self._replica_reads.__exit__(None, None, None)
+                self._replica_reads = None
+
+    def initial(self, request, *args, **kwargs):
+        # Решаем после аутентификации: закрепление проверяется по пользователю
+        super().initial(request, *args, **kwargs)
+        if (
+            replica_configured()
+            and request.method in SAFE_METHODS
+            and self.action not in self.primary_actions
+            and not (request.user.is_authenticated and is_pinned_to_primary(request.user.pk))
+        ):
+            self._replica_reads = read_from_replica()
+            self._replica_reads.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class SparseFieldsMixin:
+    """
+    ?fields=id,action,time или ?exclude=place,reward для чтения: лишние поля
+    убираются из сериализатора, а .only() не даёт читать их столбцы из БД.
+    """
+    # Столбцы, без которых не обойтись (id всегда в ответе)
+    sparse_required_columns = ("id",)
+
+    def get_sparse_fields(self):
+        if hasattr(self, "_sparse_fields"):
+            return self._sparse_fields
+        self._sparse_fields = None
+        if self.request is None or self.request.method not in SAFE_METHODS:
+            return None
+        params = self.request.query_params
+        fields, exclude = params.get("fields"), params.get("exclude")
+        if not fields and not exclude:
+            return None
+
+        available = list(self.get_serializer_class()().fields)
+        requested = [name for name in (fields or "").split(",") if name]
+        excluded = [name for name in (exclude or "").split(",") if name]
+        unknown = [name for name in requested + excluded if name not in available]
+        if unknown:
+            raise ValidationError({"fields": [f"Неизвестные поля: {', '.join(unknown)}."]})
+
+        selected = [
+            name
+            for name in available
+            if (not requested or name in requested or name == "id") and name not in excluded
+        ]
+        self._sparse_fields = selected
+        return selected
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["fields"] = self.get_sparse_fields()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            columns = get_source_columns(self.get_serializer_class(), fields)
+            queryset = queryset.only(*{*columns, *self.sparse_required_columns})
+        return queryset
+
+
+class FastListMixin:
+    """
+    Список для JSON-клиентов строится из .values() через HabitRowSerializer:
+    без экземпляров моделей, но с тем же JSON, что дал бы HabitSerializer.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            return super().list(request, *args, **kwargs)
+
+        fields = self.get_sparse_fields()
+        row_serializer = get_row_serializer(
+            tuple(fields) if fields is not None else None,
+            self.get_serializer_class(),
+        )
+        # Cursor-пагинации нужны столбцы сортировки, даже если их нет в ответе
+        ordering = [name.lstrip("-") for name in getattr(self.paginator, "ordering", ())]
+        columns = dict.fromkeys([*row_serializer.columns, *ordering])
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+
+        page = self.paginate_queryset(queryset)
+        rows = list(page if page is not None else queryset)
+        with measure_serialization():
+            data = row_serializer.represent(rows)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+def get_transfer_format(request, default=None):
+    """
+    Формат выгрузки/загрузки из ?as= (имя format занято DRF) или Content-Type.
+    None, если формат не поддерживается.
+    """
+    transfer_format = request.query_params.get("as")
+    if transfer_format is None:
+        content_type = request.content_type.split(";")[0].strip()
+        transfer_format = next(
+            (name for name, value in CONTENT_TYPES.items() if value == content_type),
+            default,
+        )
+    return transfer_format if transfer_format in CONTENT_TYPES else None
+
+
+class HabitViewSet(
+    ReplicaReadMixin,
+    SparseFieldsMixin,
+    SwitchablePaginationMixin,
+    FastListMixin,
+    viewsets.ModelViewSet,
+):
     """
     CRUD только по своим привычкам.
     """
     serializer_class = HabitSerializer
     permission_classes = (permissions.IsAuthenticated, IsOwnerHabit)
     pagination_class = HabitPagination
+    # IsOwnerHabit сравнивает владельца
+    sparse_required_columns = ("id", "owner")
+    # Токен синхронизации — время основной БД: с реплики изменения, которые
+    # до неё ещё не дошли, потерялись бы навсегда
+    primary_actions = ("changes",)
 
     def get_queryset(self):
         return Habit.objects.filter(owner=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Условный GET: Last-Modified и ETag от последнего изменения привычек
+        пользователя. Если ничего не менялось, ответ 304 стоит одного запроса.
+        """
+        last_modified = get_last_modified(request.user)
+        etag = make_list_etag(request.user, last_modified, request.META.get("QUERY_STRING", ""))
+        headers = {"ETag": etag}
+        if last_modified is not None:
+            headers["Last-Modified"] = http_date(last_modified.timestamp())
+
+        not_modified = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=int(last_modified.timestamp()) if last_modified else None,
+        )
+        if not_modified is not None:
+            response = not_modified
+        else:
+            response = super().list(request, *args, **kwargs)
+        for header, value in headers.items():
+            response[header] = value
+        return response
 
-class PublicHabitViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        """
+        Дельта-синхронизация: ?since=<token> из прошлого ответа. Возвращает
+        изменённые привычки, id удалённых и новый token. Без since — все
+        привычки; 410, если токен старше хранимых надгробий.
+        """
+        since = request.query_params.get("since")
+        try:
+            since = parse_token(since) if since else None
+        except ValueError:
+            return Response(
+                {"since": ["Некорректный токен."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            changed, deleted, token = get_changes(request.user, since)
+        except TokenExpired:
+            return Response(
+                {"since": ["Токен устарел, нужна полная синхронизация."]},
+                status=status.HTTP_410_GONE,
+            )
+        serializer = self.get_serializer(self.filter_queryset(changed), many=True)
+        return Response({"token": token, "changed": serializer.data, "deleted": deleted})
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Пакетная синхронизация: список элементов с op create/update/delete
+        (по умолчанию update при наличии id, иначе create). Пакет
+        применяется целиком или не применяется: при ошибках возвращаем 400
+        и список ошибок по элементам в порядке запроса.
+        """
+        if not isinstance(request.data, list):
+            return Response(
+                {"non_field_errors": ["Ожидался список привычек."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        results, errors = sync_habits(request.user, request.data)
+        if errors:
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = [
+            HabitSerializer(result).data
+            if isinstance(result, Habit)
+            else {"id": result, "deleted": True}
+            for result in results
+        ]
+        return Response(data)
+
+    @action(detail=True, methods=["post"])
+    def complete(self, request, pk=None):
+        """
+        Отметка о выполнении: completed_on (по умолчанию — сегодня в поясе
+        владельца). Повторная отметка того же дня ничего не меняет.
+        """
+        habit = self.get_object()
+        if not isinstance(request.data, dict):
+            return Response(
+                {"non_field_errors": ["Ожидался объект отметки."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        item = {"habit": habit.pk}
+        if request.data.get("completed_on") is not None:
+            item["completed_on"] = request.data["completed_on"]
+        result, errors = record_completions(request.user, [item])
+        if errors:
+            return Response(errors[0], status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            result["habits"][0],
+            status=status.HTTP_201_CREATED if result["created"] else status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=["post"])
+    def completions(self, request):
+        """
+        Пакет отметок от офлайн-клиента: список {"habit", "completed_on"}.
+        Применяется целиком или не применяется, как bulk.
+        """
+        if not isinstance(request.data, list):
+            return Response(
+                {"non_field_errors": ["Ожидался список отметок."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        result, errors = record_completions(request.user, request.data)
+        if errors:
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result)
+
+    @action(detail=True, methods=["get"])
+    def stats(self, request, pk=None):
+        """Серии и число выполнений из счётчиков привычки, без обхода журнала."""
+        return Response(get_habit_stats(self.get_object(), get_local_today(request.user)))
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """Потоковая выгрузка всех привычек: ?as=ndjson (по умолчанию) или csv."""
+        export_format = request.query_params.get("as", "ndjson")
+        if export_format not in CONTENT_TYPES:
+            return Response(
+                {"as": ["Поддерживаются ndjson и csv."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        response = StreamingHttpResponse(
+            iter_export(request.user, export_format),
+            content_type=CONTENT_TYPES[export_format],
+        )
+        response["Content-Disposition"] = f'attachment; filename="habits.{export_format}"'
+        return response
+
+    @action(detail=False, methods=["post"], url_path="import", url_name="import")
+    def import_stream(self, request):
+        """
+        Потоковая загрузка в формате выгрузки. Тело читается построчно,
+        некорректные строки пропускаются и перечисляются в ответе.
+        """
+        import_format = get_transfer_format(request)
+        if import_format is None:
+            return Response(
+                {"as": ["Укажите ?as=ndjson или csv либо соответствующий Content-Type."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # Читаем исходный поток Django, минуя парсеры DRF, которые грузят тело целиком
+        lines = decode_lines(request._request)
+        result = import_habits(request.user, lines, import_format)
+        return Response(result)
+
+
+class PublicHabitViewSet(
+    ReplicaReadMixin,
+    SparseFieldsMixin,
+    SwitchablePaginationMixin,
+    FastListMixin,
+    viewsets.ReadOnlyModelViewSet,
+):
     """
-    Список публичных привычек (только чтение).
+    Список публичных привычек (только чтение), ?q= — полнотекстовый поиск.
     """
-    serializer_class = HabitSerializer
+    serializer_class = PublicHabitSerializer
     pagination_class = HabitPagination
+    search_pagination_class = HabitSearchPagination
     permission_classes = (permissions.AllowAny,)
 
+    def get_search_query(self):
+        if self.request is None or self.action != "list":
+            return ""
+        query = self.request.query_params.get("q", "").strip()
+        if len(query) > MAX_QUERY_LENGTH:
+            raise ValidationError({"q": [f"Не больше {MAX_QUERY_LENGTH} символов."]})
+        return query
+
+    @property
+    def paginator(self):
+        # Поиск всегда листается по рангу, независимо от ?pagination=
+        if not hasattr(self, "_paginator") and self.get_search_query():
+            self._paginator = self.search_pagination_class()
+        return super().paginator
+
     def get_queryset(self):
-        return Habit.objects.filter(is_public=True)
\ No newline at end of file
+        queryset = Habit.objects.filter(is_public=True)
+        query = self.get_search_query()
+        if query:
+            queryset = search_habits(queryset, query)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        Страницы ленты берутся из кэша, пока не изменилась ни одна публичная
+        привычка. Клиент с актуальным If-None-Match получает 304 (и без кэша:
+        тогда ETag считается по только что построенной странице).
+        """
+        # Кэшируем только JSON: у browsable API другие байты ответа. Выдачу
+        # поиска не кэшируем: произвольные запросы лишь вытесняли бы ленту
+        if not isinstance(request.accepted_renderer, JSONRenderer) or self.get_search_query():
+            return super().list(request, *args, **kwargs)
+
+        key = get_public_feed_cache_key(request) if public_feed_cache_enabled() else None
+        cached = cache.get(key) if key is not None else None
+        if cached is None:
+            # Сразу после изменения ленты реплика может отставать: страница
+            # легла бы в кэш под новой версией со старыми данными
+            fresh = key is not None and replica_configured() and public_feed_changed_within(
+                settings.DB_REPLICA_PIN_SECONDS
+            )
+            with read_from_replica(enabled=False) if fresh else nullcontext():
+                response = super().list(request, *args, **kwargs)
+            content = request.accepted_renderer.render(
+                response.data,
+                request.accepted_media_type,
+                self.get_renderer_context(),
+            )
+            cached = (make_etag(content), response.data)
+            if key is not None:
+                set_public_feed_page(key, *cached)
+
+        etag, data = cached
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            return not_modified
+        return Response(data, headers={"ETag": etag})
+
+    @action(detail=False, methods=["get"])
+    def trending(self, request):
+        """
+        Самые частые публичные привычки (?limit=, по умолчанию 20) из готового
+        рейтинга, который пересчитывает задача refresh_trending_habits.
+        """
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= settings.HABIT_TRENDING_MAX_LIMIT:
+            return Response(
+                {"limit": [f"Укажите число от 1 до {settings.HABIT_TRENDING_MAX_LIMIT}."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(TrendingHabitSerializer(get_trending(limit), many=True).data)
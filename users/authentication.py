@@ -0,0 +1,128 @@
+"""
+JWT-аутентификация с кэшем пользователей.
+
+Стандартный JWTAuthentication ищет пользователя в БД на каждый запрос.
+Здесь поля для проверки токена берутся из общего кэша (CACHES["shared"],
+Redis) на AUTH_USER_CACHE_TIMEOUT секунд. Сохранение и удаление
+пользователя сбрасывают запись во всех процессах (users/signals.py);
+изменения в обход сигналов (queryset.update) видны не позже чем через TTL.
+Без общего кэша пользователь читается из БД на каждый запрос: сброс записи
+в памяти одного процесса не дошёл бы до остальных.
+
+В кэше лежат только pk, is_active и отпечаток пароля для CHECK_REVOKE_TOKEN,
+а не объект пользователя с хешем пароля.
+"""
+import logging
+
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_shared_cache
+
+logger = logging.getLogger(__name__)
+
+AUTH_USER_KEY = "users:auth-user:{user_id}"
+
+
+def get_auth_user_cache_key(user_id):
+    return AUTH_USER_KEY.format(user_id=user_id)
+
+
+def load_auth_record(user_id):
+    """Поля пользователя для проверки токена из БД или None, если его нет."""
+    row = (
+        get_user_model()
+        .objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+        .values("pk", "is_active", "password")
+        .first()
+    )
+    if row is None:
+        return None
+    return {
+        "pk": row["pk"],
+        "is_active": row["is_active"],
+        "password_digest": get_md5_hash_password(row["password"]),
+    }
+
+
+def get_auth_record(user_id):
+    """Запись пользователя по значению USER_ID_FIELD или None, если его нет."""
+    shared = get_shared_cache()
+    key = get_auth_user_cache_key(user_id)
+    if shared is not None:
+        try:
+            record = shared.get(key)
+        except redis.RedisError as exc:
+            logger.warning("Auth user cache unavailable: %s", exc)
+            return load_auth_record(user_id)
+        if record is not None:
+            return record
+
+    record = load_auth_record(user_id)
+    if record is not None and shared is not None:
+        try:
+            shared.set(key, record, settings.AUTH_USER_CACHE_TIMEOUT)
+        except redis.RedisError as exc:
+            logger.warning("Auth user cache unavailable: %s", exc)
+    return record
+
+
+def invalidate_cached_user(user_id):
+    shared = get_shared_cache()
+    if shared is None:
+        return
+    try:
+        shared.delete(get_auth_user_cache_key(user_id))
+    except redis.RedisError as exc:
+        # Запись истечёт сама через AUTH_USER_CACHE_TIMEOUT
+        logger.warning("Could not invalidate auth user cache: %s", exc)
+
+
+def build_user(record):
+    """
+    Пользователь с загруженными pk и is_active. Остальные поля отложены,
+    как у .only(): догружаются при обращении, save() их не перезапишет.
+    """
+    user_model = get_user_model()
+    values = {user_model._meta.pk.attname: record["pk"], "is_active": record["is_active"]}
+    field_names = [
+        field.attname for field in user_model._meta.concrete_fields if field.attname in values
+    ]
+    return user_model.from_db(
+        router.db_for_read(user_model), field_names, [values[name] for name in field_names]
+    )
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication, который читает пользователя из кэша."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as exc:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from exc
+
+        record = get_auth_record(user_id)
+        if record is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        # Те же проверки, что у родителя, по закэшированной записи
+        if api_settings.CHECK_USER_IS_ACTIVE and not record["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != record["password_digest"]:
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return build_user(record)
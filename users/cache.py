@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def get_shared_cache():
+    """
+    Общий для веб-процессов и воркеров кэш (settings.CACHES["shared"]) или
+    None. Кэш в памяти процесса общим не считается: запись, которую сбросил
+    один процесс, другой продолжал бы отдавать.
+    """
+    if "shared" not in settings.CACHES:
+        return None
+    shared = caches["shared"]
+    return None if isinstance(shared, LocMemCache) else shared
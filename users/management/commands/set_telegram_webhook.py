@@ -0,0 +1,47 @@
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Регистрирует вебхук бота в Bot API (setWebhook) с секретом "
+        "TELEGRAM_WEBHOOK_SECRET. Бот получает только сообщения"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("url", help="Публичный URL /api/telegram/webhook/")
+        parser.add_argument(
+            "--max-connections",
+            type=int,
+            default=40,
+            help="Сколько одновременных запросов Telegram шлёт на вебхук",
+        )
+        parser.add_argument(
+            "--drop-pending",
+            action="store_true",
+            help="Отбросить обновления, накопившиеся в Telegram",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.TELEGRAM_BOT_TOKEN or not settings.TELEGRAM_WEBHOOK_SECRET:
+            raise CommandError("Нужны TELEGRAM_BOT_TOKEN и TELEGRAM_WEBHOOK_SECRET")
+        api_url = settings.TELEGRAM_API_URL.rstrip("/")
+        try:
+            response = requests.post(
+                f"{api_url}/bot{settings.TELEGRAM_BOT_TOKEN}/setWebhook",
+                json={
+                    "url": options["url"],
+                    "secret_token": settings.TELEGRAM_WEBHOOK_SECRET,
+                    "allowed_updates": ["message"],
+                    "max_connections": options["max_connections"],
+                    "drop_pending_updates": options["drop_pending"],
+                },
+                timeout=settings.TELEGRAM_TIMEOUT,
+            )
+            body = response.json()
+        except (requests.RequestException, ValueError) as exc:
+            raise CommandError(f"setWebhook: {exc}")
+        if not body.get("ok"):
+            raise CommandError(f"setWebhook: {body.get('description', response.status_code)}")
+        self.stdout.write(f"Webhook set to {options['url']}")
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:20
+
+import timezone_field.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telegramprofile',
+            name='timezone',
+            field=timezone_field.fields.TimeZoneField(default='UTC', help_text='Время привычек пользователя задаётся в этом поясе', verbose_name='Часовой пояс'),
+        ),
+        migrations.AddField(
+            model_name='telegramprofile',
+            name='utc_offset',
+            field=models.SmallIntegerField(default=0, help_text='Смещение, по которому посчитано расписание привычек. Сверяется с часовым поясом фоновой задачей sync_habit_utc_offsets', verbose_name='Смещение от UTC (мин.)'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_telegramprofile_timezone_telegramprofile_utc_offset'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('update_id', models.BigIntegerField(unique=True, verbose_name='update_id')),
+                ('payload', models.JSONField(verbose_name='Обновление')),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Получено')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Обработано')),
+            ],
+            options={
+                'verbose_name': 'Обновление Telegram',
+                'verbose_name_plural': 'Обновления Telegram',
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['update_id'], name='users_tgupdate_pending_idx'), models.Index(fields=['processed_at'], name='users_tgupdate_processed_idx')],
+            },
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
+from timezone_field import TimeZoneField
 
 
 class TelegramProfile(models.Model):
@@ -18,6 +20,50 @@ class TelegramProfile(models.Model):
         max_length=64,
         unique=True,
     )
+    timezone = TimeZoneField(
+        "Часовой пояс",
+        default="UTC",
+        help_text="Время привычек пользователя задаётся в этом поясе",
+    )
+    utc_offset = models.SmallIntegerField(
+        "Смещение от UTC (мин.)",
+        default=0,
+        help_text="Смещение, по которому посчитано расписание привычек. "
+        "Сверяется с часовым поясом фоновой задачей sync_habit_utc_offsets",
+    )
+
+    def __str__(self) -> str:
+        return f"Telegram профиль {self.user} ({self.chat_id})"
+
+    def get_current_utc_offset(self, now=None) -> int:
+        """Смещение часового пояса в минутах на момент now (с учётом летнего времени)."""
+        now = now or timezone.now()
+        return int(now.astimezone(self.timezone).utcoffset().total_seconds() // 60)
+
+
+class TelegramUpdate(models.Model):
+    """
+    Входящее обновление Bot API (inbox). Вебхук только сохраняет его и сразу
+    отвечает 200, разбирает пачками задача process_telegram_updates.
+    update_id уникален: повторная доставка от Telegram не обработается дважды.
+    """
+    update_id = models.BigIntegerField("update_id", unique=True)
+    payload = models.JSONField("Обновление")
+    received_at = models.DateTimeField("Получено", default=timezone.now)
+    processed_at = models.DateTimeField("Обработано", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Обновление Telegram"
+        verbose_name_plural = "Обновления Telegram"
+        indexes = [
+            # Очередь необработанных: маленький частичный индекс
+            models.Index(
+                fields=["update_id"],
+                condition=models.Q(processed_at__isnull=True),
+                name="users_tgupdate_pending_idx",
+            ),
+            models.Index(fields=["processed_at"], name="users_tgupdate_processed_idx"),
+        ]
 
     def __str__(self) -> str:
-        return f"Telegram профиль {self.user} ({self.chat_id})"
\ No newline at end of file
+        return f"Обновление {self.update_id}"
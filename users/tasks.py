@@ -0,0 +1,81 @@
+import logging
+from datetime import timedelta
+
+import redis
+from celery import shared_task
+from django.conf import settings
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+
+from .cache import get_shared_cache
+from .models import TelegramUpdate
+from .telegram import process_update_batch
+
+logger = logging.getLogger(__name__)
+
+UPDATES_SCHEDULED_KEY = "users:telegram-updates:scheduled"
+# Если задача разбора потерялась, через столько секунд вебхук поставит новую
+UPDATES_SCHEDULED_TIMEOUT = 30
+# Пачек за один запуск: при затяжном всплеске воркер не занят бесконечно
+MAX_BATCHES_PER_RUN = 20
+
+
+def get_schedule_cache():
+    """
+    Кэш отметки «разбор запланирован». Её ставит веб-процесс, а снимает
+    воркер, поэтому годится только общий кэш (settings.CACHES["shared"]).
+    В памяти процесса отметку никто не снял бы: None, дебаунса нет.
+    """
+    return get_shared_cache()
+
+
+def schedule_update_processing():
+    """
+    Дебаунс: на окно TELEGRAM_UPDATES_DEBOUNCE ставится одна задача разбора,
+    и всплеск обновлений разбирается пачкой, а не задачей на каждое.
+    Без общего кэша задача ставится на каждое обновление.
+    """
+    shared = get_schedule_cache()
+    if shared is not None:
+        try:
+            if not shared.add(UPDATES_SCHEDULED_KEY, 1, UPDATES_SCHEDULED_TIMEOUT):
+                return
+        except redis.RedisError as exc:
+            logger.warning("Telegram update debounce unavailable: %s", exc)
+    try:
+        process_telegram_updates.apply_async(countdown=settings.TELEGRAM_UPDATES_DEBOUNCE)
+    except OperationalError as exc:
+        # Обновление уже в inbox: его подберёт периодический запуск. Отметку
+        # не снимаем, чтобы вебхук не ждал недоступный брокер на каждом запросе
+        logger.warning("Could not schedule Telegram update processing: %s", exc)
+
+
+@shared_task
+def process_telegram_updates():
+    """Разбирает накопленные обновления вебхука пачками."""
+    # Снимаем отметку до разбора: пришедшее во время него запланирует новый запуск
+    shared = get_schedule_cache()
+    if shared is not None:
+        try:
+            shared.delete(UPDATES_SCHEDULED_KEY)
+        except redis.RedisError as exc:
+            # Отметка истечёт сама через UPDATES_SCHEDULED_TIMEOUT
+            logger.warning("Could not clear Telegram update debounce: %s", exc)
+    batch_size = settings.TELEGRAM_UPDATES_BATCH_SIZE
+    total = 0
+    for _number in range(MAX_BATCHES_PER_RUN):
+        processed = process_update_batch(batch_size)
+        total += processed
+        if processed < batch_size:
+            break
+    else:
+        schedule_update_processing()
+    return total
+
+
+@shared_task
+def purge_telegram_updates():
+    """Удаляет обработанные обновления старше TELEGRAM_UPDATES_RETENTION_DAYS."""
+    threshold = timezone.now() - timedelta(days=settings.TELEGRAM_UPDATES_RETENTION_DAYS)
+    deleted, _details = TelegramUpdate.objects.filter(processed_at__lt=threshold).delete()
+    return deleted
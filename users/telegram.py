@@ -0,0 +1,219 @@
+"""
+Бот Telegram: привязка чата к аккаунту и команды.
+
+Вебхук (users/views.py) только сохраняет обновление в TelegramUpdate, а
+разбор идёт здесь пачками: профили всех чатов пачки читаются одним
+запросом, ответы уходят одной параллельной отправкой после коммита.
+
+Привязка: приложение выдаёт ссылку t.me/<бот>?start=<токен>, пользователь
+открывает её, и бот получает «/start <токен>». Токен подписан и живёт
+TELEGRAM_LINK_TOKEN_TTL секунд; в подпись входит текущий chat_id профиля,
+поэтому после привязки ссылка перестаёт работать.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import base36_to_int, int_to_base36
+
+from habits.completions import get_local_today, record_completions
+from habits.models import Habit
+from habits.services import send_telegram_messages
+
+from .models import TelegramProfile, TelegramUpdate
+
+logger = logging.getLogger(__name__)
+
+LINK_TOKEN_SALT = "users.telegram.link-token"
+
+NOT_LINKED_TEXT = (
+    "Чат не привязан к аккаунту. Откройте ссылку привязки из приложения."
+)
+HELP_TEXT = (
+    "/done — привычки на сегодня\n"
+    "/done <номер> [<номер> …] — отметить выполнение"
+)
+
+
+def get_link_signature(user, value) -> str:
+    profile = getattr(user, "telegram_profile", None)
+    chat_id = profile.chat_id if profile is not None else ""
+    return salted_hmac(
+        LINK_TOKEN_SALT, f"{value}:{chat_id}", algorithm="sha256"
+    ).hexdigest()[:32]
+
+
+def make_link_token(user, now=None) -> str:
+    """
+    Параметр /start: id пользователя, срок действия и подпись. Только
+    [0-9a-z-] и не длиннее 64 символов, как требует Telegram.
+    """
+    expires = int(now or time.time()) + settings.TELEGRAM_LINK_TOKEN_TTL
+    value = f"{int_to_base36(user.pk)}-{int_to_base36(expires)}"
+    return f"{value}-{get_link_signature(user, value)}"
+
+
+def get_link_user(token, now=None):
+    """Пользователь из токена привязки; None, если токен неверен или истёк."""
+    try:
+        user_b36, expires_b36, signature = token.split("-")
+        user_id, expires = base36_to_int(user_b36), base36_to_int(expires_b36)
+    except ValueError:
+        return None
+    if expires < (now or time.time()):
+        return None
+    user = (
+        get_user_model().objects.select_related("telegram_profile")
+        .filter(pk=user_id, is_active=True)
+        .first()
+    )
+    if user is None or not constant_time_compare(
+        signature, get_link_signature(user, f"{user_b36}-{expires_b36}")
+    ):
+        return None
+    return user
+
+
+def save_update(update_id, payload):
+    """Кладёт обновление в inbox; повтор того же update_id игнорируется."""
+    TelegramUpdate.objects.bulk_create(
+        [TelegramUpdate(update_id=update_id, payload=payload)],
+        ignore_conflicts=True,
+    )
+
+
+def get_message(payload):
+    """Текстовое сообщение из личного чата; остальное бот пропускает."""
+    message = payload.get("message")
+    if not isinstance(message, dict) or not isinstance(message.get("text"), str):
+        return None
+    chat = message.get("chat") or {}
+    if chat.get("type") != "private" or "id" not in chat:
+        return None
+    return message
+
+
+def parse_command(text):
+    """("/done", "3 5") из "/done@habit_bot 3 5"; (None, текст) для обычного текста."""
+    text = text.strip()
+    if not text.startswith("/"):
+        return None, text
+    command, _sep, args = text.partition(" ")
+    return command.split("@", 1)[0].lower(), args.strip()
+
+
+def handle_start(chat_id, args, profiles):
+    profile = profiles.get(chat_id)
+    if not args:
+        return HELP_TEXT if profile is not None else NOT_LINKED_TEXT
+    user = get_link_user(args)
+    if user is None:
+        return "Ссылка недействительна или устарела: получите новую в приложении."
+    if profile is not None and profile.user_id != user.pk:
+        return "Этот чат уже привязан к другому аккаунту."
+
+    profile = getattr(user, "telegram_profile", None)
+    if profile is None:
+        profile = TelegramProfile.objects.create(user=user, chat_id=chat_id)
+    else:
+        profile.chat_id = chat_id
+        profile.save(update_fields=["chat_id"])
+    profiles[chat_id] = profile
+    return f"Чат привязан к аккаунту {user.get_username()}. Напоминания придут сюда.\n\n{HELP_TEXT}"
+
+
+def list_habits(user):
+    today = get_local_today(user)
+    habits = (
+        Habit.objects.filter(owner=user, is_pleasant=False)
+        .order_by("time", "pk")
+        .values_list("pk", "action", "time", "last_completed_on")
+    )
+    lines = [
+        f"{'✅' if last_completed_on == today else '▫️'} {pk}. {habit_time:%H:%M} {action}"
+        for pk, action, habit_time, last_completed_on in habits
+    ]
+    if not lines:
+        return "Привычек пока нет."
+    return "\n".join(["Привычки на сегодня:", *lines, "", "Отметить: /done <номер>"])
+
+
+def handle_done(profile, args):
+    if profile is None:
+        return NOT_LINKED_TEXT
+    user = profile.user
+    if not args:
+        return list_habits(user)
+    items = [{"habit": value} for value in args.split()]
+    result, errors = record_completions(user, items)
+    if errors:
+        return "Не нашёл такие привычки. Список: /done"
+    actions = dict(
+        Habit.objects.filter(pk__in=[stats["habit"] for stats in result["habits"]])
+        .values_list("pk", "action")
+    )
+    return "\n".join(
+        f"✅ {actions.get(stats['habit'], stats['habit'])}: серия {stats['current_streak']}"
+        for stats in result["habits"]
+    )
+
+
+def handle_message(message, profiles):
+    """Текст ответа на сообщение (или None, если отвечать не нужно)."""
+    chat_id = str(message["chat"]["id"])
+    command, args = parse_command(message["text"])
+    if command == "/start":
+        return handle_start(chat_id, args, profiles)
+    profile = profiles.get(chat_id)
+    if command == "/done":
+        return handle_done(profile, args)
+    return HELP_TEXT if profile is not None else NOT_LINKED_TEXT
+
+
+def process_update_batch(batch_size=None):
+    """
+    Разбирает до batch_size необработанных обновлений по порядку update_id.
+    Ошибка в одном обновлении не останавливает пачку: оно помечается
+    обработанным и пишется в лог. Возвращает число разобранных обновлений.
+    """
+    batch_size = batch_size or settings.TELEGRAM_UPDATES_BATCH_SIZE
+    replies = []
+    with transaction.atomic():
+        updates = list(
+            TelegramUpdate.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by("update_id")[:batch_size]
+        )
+        if not updates:
+            return 0
+        messages = [(update, get_message(update.payload)) for update in updates]
+        chat_ids = {str(message["chat"]["id"]) for _update, message in messages if message}
+        profiles = {
+            profile.chat_id: profile
+            for profile in TelegramProfile.objects.filter(chat_id__in=chat_ids)
+            .select_related("user")
+        }
+        for update, message in messages:
+            if message is None:
+                continue
+            try:
+                with transaction.atomic():
+                    reply = handle_message(message, profiles)
+            except Exception:
+                logger.exception("Telegram update %s failed", update.update_id)
+                continue
+            if reply:
+                replies.append((str(message["chat"]["id"]), reply))
+        TelegramUpdate.objects.filter(pk__in=[update.pk for update in updates]).update(
+            processed_at=timezone.now()
+        )
+
+    # Сеть — после коммита: блокировки строк inbox не ждут Telegram
+    for result in send_telegram_messages(replies):
+        if not result.ok:
+            logger.warning("Telegram reply to %s failed: %s", result.chat_id, result.error)
+    return len(updates)
@@ -1,3 +1,304 @@
-from django.test import TestCase
+import json
+import tempfile
+import time as time_module
+from datetime import time
+from pathlib import Path
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config.celery import app as celery_app
+from habits.models import Habit, HabitCompletion
+from habits.services import reset_telegram_client
+from habits.testing import FakeBotAPI
+from users.authentication import get_auth_user_cache_key
+from users.models import TelegramProfile, TelegramUpdate
+from users.tasks import process_telegram_updates
+from users.telegram import get_link_user, make_link_token, process_update_batch, save_update
+
+User = get_user_model()
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        # Общий кэш в файлах, как Redis в проде
+        self.enterContext(override_settings(CACHES={
+            **settings.CACHES,
+            "shared": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": self.enterContext(tempfile.TemporaryDirectory()),
+            },
+        }))
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user1", password="pass12345")
+        self.habit = Habit.objects.create(
+            owner=self.user,
+            place="Дом",
+            time=time(8, 0),
+            action="Зарядка",
+            execution_time=60,
+        )
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}"
+        )
+        self.url = reverse("habit-detail", args=[self.habit.pk])
+
+    def test_authenticated_get_uses_one_query_with_warm_cache(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        # Пользователь из кэша, владелец сравнивается по owner_id
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["id"], self.habit.pk)
+
+    def test_foreign_habit_is_not_found(self):
+        other = User.objects.create_user(username="user2", password="pass12345")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(other)}")
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_deactivation_invalidates_cached_user(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        key = get_auth_user_cache_key(self.user.pk)
+        self.assertIsNotNone(caches["shared"].get(key))
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        self.assertIsNone(caches["shared"].get(key))
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_cache_holds_password_digest_not_hash(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        record = caches["shared"].get(get_auth_user_cache_key(self.user.pk))
+        self.assertEqual(set(record), {"pk", "is_active", "password_digest"})
+        self.assertNotIn(self.user.password, record.values())
+
+    def test_without_shared_cache_user_is_read_from_db(self):
+        local_caches = {
+            alias: config for alias, config in settings.CACHES.items() if alias != "shared"
+        }
+        with override_settings(CACHES=local_caches):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+            # Деактивация в обход сигналов видна сразу: кэша в памяти процесса нет
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+            self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+# Обновления Bot API, записанные с настоящего бота (id и имена заменены)
+RECORDED_UPDATES = json.loads(
+    (Path(__file__).parent / "testdata" / "telegram_updates.json").read_text(encoding="utf-8")
+)
+CHAT_ID = "422170135"
+
+
+def recorded_update(name, update_id=None, **placeholders):
+    """Записанное обновление с подставленными {token}/{args} и, если нужно, своим update_id."""
+    raw = json.dumps(RECORDED_UPDATES[name], ensure_ascii=False)
+    for key, value in placeholders.items():
+        raw = raw.replace(f"{{{key}}}", value)
+    update = json.loads(raw)
+    if update_id is not None:
+        update["update_id"] = update_id
+    return update
+
+
+@override_settings(
+    TELEGRAM_WEBHOOK_SECRET="webhook-secret",
+    TELEGRAM_BOT_TOKEN="test",
+    TELEGRAM_RATE_LIMIT_REDIS_URL="",
+    TELEGRAM_RATE_LIMIT_GLOBAL=10 ** 6,
+    TELEGRAM_RATE_LIMIT_PER_CHAT=10 ** 6,
+)
+class TelegramWebhookTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        conf = celery_app.conf
+        self.addCleanup(
+            conf.update,
+            task_always_eager=conf.task_always_eager,
+            task_eager_propagates=conf.task_eager_propagates,
+        )
+        conf.update(task_always_eager=True, task_eager_propagates=True)
+        # Общий кэш дебаунса: файлы видны всем экземплярам, как Redis процессам
+        self.enterContext(override_settings(CACHES={
+            **settings.CACHES,
+            "shared": self.file_cache(),
+        }))
+
+        self.api = self.enterContext(FakeBotAPI())
+        self.enterContext(override_settings(TELEGRAM_API_URL=self.api.url))
+        reset_telegram_client()
+        self.addCleanup(reset_telegram_client)
+
+        self.client = APIClient()
+        self.url = reverse("telegram-webhook")
+        self.user = User.objects.create_user(username="anna", password="pass12345")
+
+    def file_cache(self):
+        return {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": self.enterContext(tempfile.TemporaryDirectory()),
+        }
+
+    def post_update(self, update, secret="webhook-secret"):
+        return self.client.post(
+            self.url,
+            json.dumps(update),
+            content_type="application/json",
+            HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN=secret,
+        )
+
+    def replies(self):
+        return [request["payload"]["text"] for request in self.api.requests]
+
+    def link(self):
+        return TelegramProfile.objects.create(user=self.user, chat_id=CHAT_ID)
+
+    def test_webhook_checks_secret(self):
+        update = recorded_update("text")
+        self.assertEqual(self.post_update(update, secret="wrong").status_code, 403)
+        self.assertEqual(self.post_update(update, secret="").status_code, 403)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        with override_settings(TELEGRAM_WEBHOOK_SECRET=""):
+            self.assertEqual(self.post_update(update).status_code, 404)
+        self.assertEqual(self.post_update({"message": {}}).status_code, 400)
+        self.assertFalse(TelegramUpdate.objects.exists())
+
+    def test_webhook_stores_update_and_debounces_processing(self):
+        with patch("users.tasks.process_telegram_updates.apply_async") as apply_async:
+            for update_id in (1, 2, 2):
+                response = self.post_update(recorded_update("text", update_id=update_id))
+                self.assertEqual(response.status_code, 200)
+        # Повторная доставка того же update_id не создаёт вторую запись
+        self.assertEqual(TelegramUpdate.objects.count(), 2)
+        apply_async.assert_called_once()
+        self.assertFalse(TelegramUpdate.objects.filter(processed_at__isnull=False).exists())
+
+    def scheduled_across_processes(self, config):
+        """
+        Три обновления: между вторым и третьим отметку снимает задача в
+        «воркере». У веба и воркера — разные экземпляры кэша с настройками
+        config. Возвращает число поставленных задач разбора.
+        """
+        with override_settings(CACHES={**settings.CACHES, "shared": config}):
+            web = caches.create_connection("shared")
+            worker = caches.create_connection("shared")
+            with patch("users.tasks.process_telegram_updates.apply_async") as apply_async:
+                with patch("users.cache.caches", {"shared": web}):
+                    self.post_update(recorded_update("text", update_id=1))
+                    self.post_update(recorded_update("text", update_id=2))
+                with patch("users.cache.caches", {"shared": worker}):
+                    process_telegram_updates()
+                with patch("users.cache.caches", {"shared": web}):
+                    self.post_update(recorded_update("text", update_id=3))
+        return apply_async.call_count
+
+    def test_debounce_flag_is_cleared_by_another_process(self):
+        # Второе обновление ждёт уже поставленную задачу, третье — новую
+        self.assertEqual(self.scheduled_across_processes(self.file_cache()), 2)
+
+    def test_process_local_cache_does_not_debounce(self):
+        # В памяти процесса воркер не снял бы отметку веба: задача на каждое
+        config = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        self.assertEqual(self.scheduled_across_processes(config), 3)
+
+    def test_start_links_chat_with_single_use_token(self):
+        token = make_link_token(self.user)
+        self.assertEqual(self.post_update(recorded_update("start", token=token)).status_code, 200)
+
+        profile = TelegramProfile.objects.get(user=self.user)
+        self.assertEqual(profile.chat_id, CHAT_ID)
+        self.assertIn("Чат привязан к аккаунту anna", self.replies()[0])
+        self.assertEqual(self.api.requests[0]["payload"]["chat_id"], CHAT_ID)
+        self.assertFalse(TelegramUpdate.objects.filter(processed_at__isnull=True).exists())
+        # После привязки та же ссылка недействительна
+        self.assertIsNone(get_link_user(token))
+
+        other = User.objects.create_user(username="boris", password="pass12345")
+        self.post_update(recorded_update("start", update_id=2, token=make_link_token(other)))
+        self.assertIn("другому аккаунту", self.replies()[-1])
+        self.assertFalse(TelegramProfile.objects.filter(user=other).exists())
+
+    def test_link_token_expires_and_rejects_tampering(self):
+        token = make_link_token(self.user)
+        self.assertEqual(get_link_user(token), self.user)
+        self.assertLessEqual(len(token), 64)
+        self.assertIsNone(get_link_user(token[:-1] + ("0" if token[-1] != "0" else "1")))
+        self.assertIsNone(get_link_user("garbage"))
+        self.assertIsNone(get_link_user(token, now=time_module.time() + 3600))
+
+    def test_link_endpoint_requires_auth(self):
+        url = reverse("telegram-link")
+        self.assertEqual(self.client.post(url).status_code, 401)
+        self.client.force_authenticate(self.user)
+        with override_settings(TELEGRAM_BOT_USERNAME="habit_tracker_bot"):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["url"], f"https://t.me/habit_tracker_bot?start={response.data['token']}"
+        )
+        self.assertEqual(get_link_user(response.data["token"]), self.user)
+
+    def test_done_lists_and_marks_habits(self):
+        self.link()
+        habit = Habit.objects.create(
+            owner=self.user, place="Дом", time=time(8, 0), action="Зарядка", execution_time=60,
+        )
+        self.post_update(recorded_update("done", update_id=1, args=""))
+        self.assertIn(f"{habit.pk}. 08:00 Зарядка", self.replies()[-1])
+
+        self.post_update(recorded_update("done", update_id=2, args=str(habit.pk)))
+        self.assertEqual(self.replies()[-1], "✅ Зарядка: серия 1")
+        self.assertTrue(
+            HabitCompletion.objects.filter(habit=habit, completed_on=timezone.now().date()).exists()
+        )
+
+        self.post_update(recorded_update("done", update_id=3, args="999"))
+        self.assertIn("Не нашёл", self.replies()[-1])
+
+    def test_unlinked_chat_and_unsupported_updates(self):
+        self.post_update(recorded_update("done", args=""))
+        self.assertIn("не привязан", self.replies()[-1])
+        sent = len(self.api.requests)
+        for name in ("sticker", "group", "edited"):
+            self.assertEqual(self.post_update(recorded_update(name)).status_code, 200)
+        self.assertEqual(len(self.api.requests), sent)
+        self.assertFalse(TelegramUpdate.objects.filter(processed_at__isnull=True).exists())
+
+    def test_batch_reads_profiles_once_and_replies_together(self):
+        self.link()
+        for update_id in range(1, 6):
+            save_update(update_id, recorded_update("text", update_id=update_id))
+        with patch(
+            "users.telegram.send_telegram_messages", return_value=[]
+        ) as send, CaptureQueriesContext(connection) as queries:
+            self.assertEqual(process_update_batch(batch_size=10), 5)
+        # Пачка, профили чатов, отметка обработки; плюс точки сохранения
+        statements = [
+            query["sql"] for query in queries if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertEqual(len(statements), 3)
+        send.assert_called_once()
+        self.assertEqual(len(send.call_args.args[0]), 5)
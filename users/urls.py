@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import telegram_link, telegram_webhook
+
+urlpatterns = [
+    path("telegram/webhook/", telegram_webhook, name="telegram-webhook"),
+    path("telegram/link/", telegram_link, name="telegram-link"),
+]
@@ -1,3 +1,50 @@
-from django.shortcuts import render
+import hmac
+import json
 
-# Create your views here.
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import permissions
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from .tasks import schedule_update_processing
+from .telegram import make_link_token, save_update
+
+
+@csrf_exempt
+@require_POST
+def telegram_webhook(request):
+    """
+    Вебхук Bot API. Проверяет секрет из setWebhook, сохраняет обновление
+    и сразу отвечает 200: разбор — пачками в process_telegram_updates.
+    Обычная Django-view без DRF, чтобы ответ стоил одного INSERT.
+    """
+    secret = settings.TELEGRAM_WEBHOOK_SECRET
+    if not secret:
+        raise Http404
+    received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(received.encode(), secret.encode()):
+        return HttpResponseForbidden()
+    try:
+        update = json.loads(request.body)
+        update_id = int(update["update_id"])
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest()
+    save_update(update_id, update)
+    schedule_update_processing()
+    return HttpResponse()
+
+
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+def telegram_link(request):
+    """Ссылка для привязки Telegram-чата к аккаунту: открыть её в Telegram."""
+    token = make_link_token(request.user)
+    bot = settings.TELEGRAM_BOT_USERNAME
+    return Response({
+        "token": token,
+        "url": f"https://t.me/{bot}?start={token}" if bot else None,
+        "expires_in": settings.TELEGRAM_LINK_TOKEN_TTL,
+    })